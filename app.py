@@ -6,25 +6,101 @@
 import os
 import json
 import uuid
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from werkzeug.utils import secure_filename
+import hashlib
+import threading
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory
 
 # 导入计分模块
-from detect_circles_final import detect_circles, extract_first_frame
-from detect_hit_score import detect_and_score
+import cv2
+
+from detect_circles_final import detect_circles, extract_first_frame, curtain_crop_box
+from detect_hit_score import detect_and_score, MOTION_THRESHOLD_FACTOR, COOLDOWN_SEC, HIT_TOLERANCE
+from resolution import WORK_WIDTH
+from score_map import SCORE_POLICY
+from task_queue import TaskQueue, QueueFullError, report_progress
+from calibration_cache import CalibrationCache
+from motion_cache import MotionCache, remember_digest
+from result_store import ResultStore
+from live_scorer import LiveScorer, EventHub, load_live_circles
+from instrumentation import MetricsRegistry, profile
+from render_cache import RenderCache, record_render_info
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
 # 配置
 UPLOAD_FOLDER = '/Users/tgg_ai_studio/Desktop/tennis_score/uploads'
-OUTPUT_FOLDER = '/Users/tgg_ai_studio/Desktop/tennis_score/output'
+OUTPUT_FOLDER = '/Users/tgg_ai_studio/Desktop/tennis_score/output'  # 通过 /output 对外提供图片
+DATA_FOLDER = '/Users/tgg_ai_studio/Desktop/tennis_score/data'  # 结果库和缓存（不对外提供）
 ALLOWED_EXTENSIONS = {'mov', 'mp4', 'avi', 'mkv'}
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 上传写入磁盘和计算哈希的块大小
+
+# 影响计分结果的参数（结果库按 视频内容哈希 + 参数 复用结果）
+SCORING_PARAMS = {
+    'threshold_factor': MOTION_THRESHOLD_FACTOR,
+    'cooldown_sec': COOLDOWN_SEC,
+    'hit_tolerance': HIT_TOLERANCE,
+    'score_policy': SCORE_POLICY,
+    'work_width': WORK_WIDTH,
+}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max
+app.config['SCORING_WORKERS'] = int(os.environ.get('SCORING_WORKERS', 2))  # 计分进程数
+app.config['SCORING_QUEUE_DEPTH'] = int(os.environ.get('SCORING_QUEUE_DEPTH', 8))  # 最多排队任务数
+app.config['RENDER_CACHE_MB'] = int(os.environ.get('RENDER_CACHE_MB', 512))  # 按需渲染的图片缓存上限
+app.config['RESULT_DB'] = os.environ.get('RESULT_DB', os.path.join(DATA_FOLDER, 'results.db'))  # 计分结果库
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+os.makedirs(DATA_FOLDER, exist_ok=True)
+
+# 圆圈标定缓存（工作进程之间通过文件共享）
+calibration_cache = CalibrationCache(os.path.join(DATA_FOLDER, 'calibration_cache.json'))
+
+# 运动信号缓存（按容量上限淘汰）
+motion_cache = MotionCache(os.path.join(DATA_FOLDER, 'motion_cache'))
+
+# 标注图片在 /output 第一次被请求时渲染
+render_cache = RenderCache(OUTPUT_FOLDER, max_bytes=app.config['RENDER_CACHE_MB'] * 1024 * 1024)
+
+# 各任务的分阶段统计累计（/metrics）
+metrics_registry = MetricsRegistry()
+
+# 计分结果库（视频内容哈希 → 结果，历史查询）
+result_store = ResultStore(app.config['RESULT_DB'])
+
+# 正在处理的视频：内容哈希 → task_id（处理期间重复上传同一视频时复用）
+inflight = {}
+# 处理期间重复上传的选手和文件名：内容哈希 → [(player, video_name)]，任务完成后各记录一条计分记录
+inflight_uploads = {}
+inflight_lock = threading.Lock()
+
+
+def on_task_done(task_id, result):
+    """任务完成（主进程）：累计阶段统计，结果写入结果库（处理期间的重复上传各记录一条）"""
+    metrics_registry.add(result.get('metrics'))
+    sha256 = result.get('video_sha256')
+    if sha256:
+        result_store.save(sha256, SCORING_PARAMS, result,
+                          player=result.get('player'), video_name=result.get('video_name'))
+        with inflight_lock:
+            inflight.pop(sha256, None)
+            duplicates = inflight_uploads.pop(sha256, [])
+        for player, video_name in duplicates:
+            result_store.record_session(sha256, SCORING_PARAMS, result, player=player, video_name=video_name)
+
+
+task_queue = TaskQueue(
+    workers=app.config['SCORING_WORKERS'],
+    max_pending=app.config['SCORING_QUEUE_DEPTH'],
+    on_done=on_task_done
+)
+
+# 实时计分（同一时间只运行一路视频流，事件通过 /api/live/events 推送）
+LIVE_OUTPUT_FOLDER = os.path.join(OUTPUT_FOLDER, 'live')
+live_hub = EventHub()
+live_state = {'thread': None, 'scorer': None, 'source': None}
+live_lock = threading.Lock()
 
 
 def allowed_file(filename):
@@ -37,116 +113,340 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/api/upload', methods=['POST'])
-def upload_video():
-    """上传视频并处理"""
-    if 'video' not in request.files:
-        return jsonify({'error': '没有上传文件'}), 400
-
-    file = request.files['video']
-    if file.filename == '':
-        return jsonify({'error': '没有选择文件'}), 400
-
-    if not allowed_file(file.filename):
-        return jsonify({'error': '不支持的文件格式'}), 400
-
-    # 保存文件
-    task_id = str(uuid.uuid4())[:8]
-    filename = secure_filename(f"{task_id}_{file.filename}")
-    video_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(video_path)
+def save_upload(file, folder):
+    """
+    边写入磁盘边计算 SHA-256，文件按内容哈希命名（同一视频只保存一份）
+    返回：(路径, 哈希, 是否新建了该文件)
+    """
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(folder, f".upload_{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'wb') as f:
+        for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            f.write(chunk)
+
+    sha256 = digest.hexdigest()
+    video_path = os.path.join(folder, f"{sha256[:16]}.{ext}")
+    try:
+        # 硬链接在目标已存在时失败，多个请求同时上传同一视频时只有一个算作新建
+        os.link(tmp_path, video_path)
+        created = True
+    except FileExistsError:
+        created = False
+    finally:
+        os.remove(tmp_path)
+    return video_path, sha256, created
+
+
+def process_video(task_id, video_path, sha256=None, player=None, video_name=None):
+    """
+    处理一个视频：提取第一帧 → 检测圆圈（同时扫描视频）→ 检测击中并计分
+    在任务队列的工作进程中运行（演示模式下在请求线程中运行）
+    sha256 / player / video_name 随结果返回，由 on_task_done 写入结果库
+    """
+    if sha256:
+        remember_digest(video_path, sha256)  # 运动信号缓存不必再读一遍视频
 
     # 创建任务输出目录
     task_output_dir = os.path.join(OUTPUT_FOLDER, task_id)
     os.makedirs(task_output_dir, exist_ok=True)
 
-    try:
+    with profile() as profiler:
         # Step 1: 提取第一帧
+        report_progress('extract', '正在提取第一帧...')
         first_frame_path = os.path.join(task_output_dir, "first_frame.jpg")
         extract_first_frame(video_path, first_frame_path)
 
-        # Step 2: 检测圆圈
-        circles = detect_circles(first_frame_path, task_output_dir)
+        # Step 2+3: 检测圆圈，同时检测击中并计分（流水线）
+        report_progress('scoring', '正在检测得分圆圈并扫描视频...')
+        h, w = cv2.imread(first_frame_path).shape[:2]
+        detected = {}
+
+        def calibrate():
+            detected['circles'] = detect_circles(first_frame_path, task_output_dir, cache=calibration_cache,
+                                                 render_images=False)
+            report_progress('scoring', '圆圈检测完成，正在检测击中事件并计分...')
+            return detected['circles']
 
-        # Step 3: 检测击中并计分
-        circles_config_path = os.path.join(task_output_dir, "circles_config.json")
         total_score, events = detect_and_score(
             video_path,
-            circles_config_path=circles_config_path,
-            output_dir=task_output_dir
+            output_dir=task_output_dir,
+            calibrate=calibrate,
+            calibration_roi=curtain_crop_box(w, h),
+            motion_cache=motion_cache,
+            render_images=False
         )
-
-        # 构建结果
-        result = {
-            'task_id': task_id,
-            'total_score': total_score,
-            'events': events,
-            'circles': circles,
-            'images': {
-                'first_frame': f'/output/{task_id}/first_frame.jpg',
-                'circles': f'/output/{task_id}/detected_circles_final.jpg',
-            }
+        circles = detected['circles']
+
+        # 标注图片按需渲染（/output）
+        record_render_info(task_output_dir, video_path, first_frame_path, circles, events)
+
+    # 构建结果
+    return {
+        'task_id': task_id,
+        'video_sha256': sha256,
+        'player': player,
+        'video_name': video_name,
+        'total_score': total_score,
+        'events': events,
+        'circles': circles,
+        'metrics': profiler.summary(),
+        'images': {
+            'first_frame': f'/output/{task_id}/first_frame.jpg',
+            'circles': f'/output/{task_id}/detected_circles_final.jpg',
+            'hits': [f'/output/{task_id}/hit_event_{i+1}.jpg' for i in range(len(events))]
+        },
+        'thumbs': {
+            'first_frame': f'/output/{task_id}/first_frame.thumb.jpg',
+            'circles': f'/output/{task_id}/detected_circles_final.thumb.jpg',
+            'hits': [f'/output/{task_id}/hit_event_{i+1}.thumb.jpg' for i in range(len(events))]
         }
+    }
 
-        # 添加击中事件图片
-        hit_images = []
-        for i in range(len(events)):
-            img_path = f'/output/{task_id}/hit_event_{i+1}.jpg'
-            hit_images.append(img_path)
-        result['images']['hits'] = hit_images
 
-        return jsonify(result)
+@app.route('/api/upload', methods=['POST'])
+def upload_video():
+    """
+    上传视频：同一视频（内容相同）已计分过时直接返回结果（200），
+    正在处理时返回处理中的 task_id，否则加入处理队列（202）
+    表单字段 player 为可选的选手名
+    """
+    if 'video' not in request.files:
+        return jsonify({'error': '没有上传文件'}), 400
+
+    file = request.files['video']
+    if file.filename == '':
+        return jsonify({'error': '没有选择文件'}), 400
 
+    if not allowed_file(file.filename):
+        return jsonify({'error': '不支持的文件格式'}), 400
+
+    player = request.form.get('player') or None
+    video_path, sha256, created = save_upload(file, app.config['UPLOAD_FOLDER'])
+
+    cached = result_store.lookup(sha256, SCORING_PARAMS)
+    if cached is not None:
+        task_id = cached['task_id']
+        result_store.record_session(sha256, SCORING_PARAMS, cached, player=player, video_name=file.filename)
+        result = {**cached, 'cached': True}
+        task_queue.complete(task_id, result)
+        return jsonify({'task_id': task_id, 'status': 'done', 'cached': True, 'result': result})
+
+    with inflight_lock:
+        task_id = inflight.get(sha256)
+        task = task_queue.get(task_id) if task_id else None
+        if task is not None and task['status'] in ('queued', 'running'):
+            inflight_uploads.setdefault(sha256, []).append((player, file.filename))
+            return jsonify({'task_id': task_id, 'status': task['status'], 'duplicate': True}), 202
+
+        task_id = str(uuid.uuid4())[:8]
+        try:
+            task_queue.submit(task_id, process_video, video_path, sha256, player, file.filename)
+        except QueueFullError:
+            if created:  # 已有的视频（之前上传过）不删除
+                os.remove(video_path)
+            return jsonify({'error': '服务器繁忙，请稍后再试'}), 503, {'Retry-After': '30'}
+        inflight[sha256] = task_id
+        inflight_uploads[sha256] = []
+
+    return jsonify({'task_id': task_id, 'status': 'queued'}), 202
+
+
+@app.route('/api/tasks/<task_id>')
+def task_status(task_id):
+    """查询任务状态"""
+    task = task_queue.get(task_id) or stored_task(task_id)
+    if task is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(task)
+
+
+def stored_task(task_id):
+    """任务状态已过期时，从结果库中取得已完成的结果"""
+    result = result_store.get_by_task(task_id)
+    if result is None:
+        return None
+    return {'task_id': task_id, 'status': 'done', 'stage': 'done', 'result': result, 'version': 0}
+
+
+@app.route('/api/tasks/<task_id>/events')
+def task_events(task_id):
+    """任务进度推送（Server-Sent Events），任务结束后关闭连接"""
+    def stream():
+        version = -1
+        while True:
+            task = task_queue.wait(task_id, version) or stored_task(task_id)
+            if task is None:
+                yield f"data: {json.dumps({'status': 'error', 'error': '任务不存在'}, ensure_ascii=False)}\n\n"
+                return
+            if task['version'] != version:
+                version = task['version']
+                yield f"data: {json.dumps(task, ensure_ascii=False)}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if task['status'] in ('done', 'error'):
+                return
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def run_live(source, track, realtime):
+    """实时计分线程：准备圆圈配置后持续读取视频流，事件发布到 live_hub"""
+    try:
+        circles = load_live_circles(source, LIVE_OUTPUT_FOLDER, cache=calibration_cache)
+        scorer = LiveScorer(source, circles, on_event=live_hub.publish,
+                            realtime=realtime, track=track)
+        with live_lock:
+            live_state['scorer'] = scorer
+        live_hub.publish({'type': 'started', 'source': source})
+        stats = scorer.run()
+        live_hub.publish({'type': 'stopped', 'source': source, **stats})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        live_hub.publish({'type': 'error', 'source': source, 'error': str(e)})
+    finally:
+        with live_lock:
+            live_state.update(thread=None, scorer=None, source=None)
+
+
+@app.route('/api/live/start', methods=['POST'])
+def live_start():
+    """开始实时计分：{"source": 摄像头编号 / 流地址 / 视频路径, "track": false, "realtime": false}"""
+    data = request.get_json(silent=True) or {}
+    source = str(data.get('source', '0'))
+
+    with live_lock:
+        if live_state['thread'] is not None:
+            return jsonify({'error': f"实时计分已在运行: {live_state['source']}"}), 409
+        thread = threading.Thread(
+            target=run_live,
+            args=(source, bool(data.get('track')), bool(data.get('realtime'))),
+            daemon=True
+        )
+        live_state.update(thread=thread, source=source)
+        thread.start()
+
+    return jsonify({'status': 'started', 'source': source, 'seq': live_hub.seq}), 202
+
+
+@app.route('/api/live/stop', methods=['POST'])
+def live_stop():
+    """停止实时计分"""
+    with live_lock:
+        if live_state['scorer'] is None:
+            return jsonify({'error': '实时计分未运行'}), 404
+        live_state['scorer'].stop()
+    return jsonify({'status': 'stopping'})
+
+
+@app.route('/api/live/status')
+def live_status():
+    """实时计分状态与统计"""
+    with live_lock:
+        scorer = live_state['scorer']
+        return jsonify({
+            'running': live_state['thread'] is not None,
+            'source': live_state['source'],
+            'stats': dict(scorer.stats) if scorer is not None else None,
+            'seq': live_hub.seq,
+        })
+
+
+@app.route('/api/live/events')
+def live_events():
+    """
+    实时事件推送（Server-Sent Events）
+    断线重连时浏览器通过 Last-Event-ID 续传，也可用 ?after=<seq> 指定起点
+    """
+    after = request.headers.get('Last-Event-ID') or request.args.get('after')
+    after = int(after) if after and after.isdigit() else live_hub.seq
+
+    def stream():
+        seq = after
+        while True:
+            events = live_hub.wait(seq)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                seq = event['seq']
+                yield f"id: {seq}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api/demo')
 def demo():
     """使用默认视频进行演示"""
     demo_video = '/Users/tgg_ai_studio/Desktop/tennis_score/hit.mov'
-    task_id = 'demo'
-    task_output_dir = os.path.join(OUTPUT_FOLDER, task_id)
-    os.makedirs(task_output_dir, exist_ok=True)
 
     try:
-        # 提取第一帧
-        first_frame_path = os.path.join(task_output_dir, "first_frame.jpg")
-        extract_first_frame(demo_video, first_frame_path)
+        result = process_video('demo', demo_video)
+        metrics_registry.add(result['metrics'])
+        return jsonify(result)
 
-        # 检测圆圈
-        circles = detect_circles(first_frame_path, task_output_dir)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # 检测击中并计分
-        circles_config_path = os.path.join(task_output_dir, "circles_config.json")
-        total_score, events = detect_and_score(
-            demo_video,
-            circles_config_path=circles_config_path,
-            output_dir=task_output_dir
-        )
 
-        result = {
-            'task_id': task_id,
-            'total_score': total_score,
-            'events': events,
-            'circles': circles,
-            'images': {
-                'first_frame': f'/output/{task_id}/first_frame.jpg',
-                'circles': f'/output/{task_id}/detected_circles_final.jpg',
-                'hits': [f'/output/{task_id}/hit_event_{i+1}.jpg' for i in range(len(events))]
-            }
-        }
+@app.route('/api/sessions')
+def list_sessions():
+    """历史计分记录：?player=&since=YYYY-MM-DD&until=YYYY-MM-DD&limit=100&offset=0"""
+    return jsonify(result_store.list_sessions(
+        player=request.args.get('player'),
+        since=request.args.get('since'),
+        until=request.args.get('until'),
+        limit=request.args.get('limit', 100, type=int),
+        offset=request.args.get('offset', 0, type=int),
+    ))
 
-        return jsonify(result)
 
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+@app.route('/api/sessions/daily')
+def daily_sessions():
+    """每位选手每天的计分次数与总分：?player=&since=&until="""
+    return jsonify(result_store.daily_totals(
+        player=request.args.get('player'),
+        since=request.args.get('since'),
+        until=request.args.get('until'),
+    ))
+
+
+@app.route('/api/calibration/stats')
+def calibration_stats():
+    """圆圈标定缓存统计"""
+    return jsonify(calibration_cache.summary())
+
+
+@app.route('/metrics')
+def metrics():
+    """各阶段耗时、帧数、写入字节数、峰值内存（Prometheus 文本格式）"""
+    text = metrics_registry.render_prometheus()
+    text += (
+        "# HELP tennis_queue_pending 排队中的任务数\n"
+        "# TYPE tennis_queue_pending gauge\n"
+        f"tennis_queue_pending {task_queue.pending()}\n"
+        "# HELP tennis_queue_active 未结束的任务数\n"
+        "# TYPE tennis_queue_active gauge\n"
+        f"tennis_queue_active {task_queue.active()}\n"
+    )
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/render/stats')
+def render_stats():
+    """按需渲染的图片缓存统计"""
+    return jsonify(render_cache.summary())
 
 
 @app.route('/output/<path:filename>')
 def serve_output(filename):
-    """提供输出文件"""
-    return send_from_directory(OUTPUT_FOLDER, filename)
+    """提供结果图片（第一帧、圆圈检测、击中图片及其缩略图），标注图片和缩略图在第一次请求时渲染"""
+    path = render_cache.get(filename)
+    if path is None:
+        return jsonify({'error': '文件不存在'}), 404
+    return send_from_directory(OUTPUT_FOLDER, os.path.relpath(path, render_cache.root))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+击中点定位 - 在运动峰值附近的几帧内跟踪球的轨迹
+
+单帧颜色检测的问题：
+    - 峰值帧时球可能已经反弹离开，或被幕布遮挡
+    - 第一个大小合适的黄绿色轮廓可能是噪声（衣服、场地标记）
+
+做法：
+    1. 只读取每个峰值前后 BALL_TRACK_WINDOW 帧的幕布区域（按帧号定位，成本只与击中次数有关；
+       定位后第一帧的位置与请求的帧号不符时改为从头顺序读取）
+    2. 每帧找出所有大小合适的球候选（颜色 + 面积 + 圆度）
+    3. 用恒速模型的卡尔曼滤波把候选逐帧关联成轨迹（预测位置附近 BALL_TRACK_GATE 像素内最近的候选）
+    4. 丢弃太短或几乎不动的轨迹（静止的黄色噪声）
+    5. 击中点 = 轨迹的折返点（相邻两段位移方向变化最大、且超过 BALL_TURN_MIN_ANGLE 的位置）
+没有可用轨迹时回退到峰值帧的单帧检测（面积最大的候选）。
+
+使用方法：
+    result = localize_ball(video_path, peak_idx, curtain_roi)
+    result['pos']     # 击中点 (x, y)（原图坐标），None 表示未找到
+    result['method']  # 'track' / 'peak' / 'none'
+
+像素参数（面积、关联距离、最小路径长度）为参考分辨率下的值，按 WorkResolution 换算：
+候选在工作分辨率上检测，坐标换算回原图后再关联成轨迹。
+"""
+import cv2
+import numpy as np
+
+from detect_hit_score import BALL_COLOR_LOWER, BALL_COLOR_UPPER, BALL_MIN_AREA, BALL_MAX_AREA
+from frame_source import open_frame_source, read_frames
+from instrumentation import timed
+from resolution import WorkResolution, REFERENCE_WIDTH
+
+BALL_TRACK_WINDOW = 4  # 峰值前后各读取的帧数
+BALL_TRACK_GATE = 80  # 轨迹关联时候选与预测位置的最大距离（像素）
+BALL_MIN_TRACK_LEN = 3  # 有效轨迹的最少帧数
+BALL_MIN_TRACK_MOTION = 6  # 有效轨迹的最小路径长度（像素），过滤静止的黄色噪声
+BALL_MIN_CIRCULARITY = 0.4  # 轮廓圆度 4πA/P² 下限
+BALL_MAX_CANDIDATES = 8  # 每帧最多保留的候选数（按面积）
+BALL_TURN_MIN_ANGLE = 60  # 折返点处位移方向至少改变的角度（度）
+
+
+def find_ball_candidates(curtain, offset=(0, 0), resolution=None):
+    """
+    在幕布区域图像中找出所有球候选
+    resolution: WorkResolution，先缩小到工作分辨率再检测（None 时按原图检测，面积范围不换算）
+    返回：[(x, y, 面积), ...]（原图坐标，面积为工作分辨率下的值，按面积从大到小）
+    """
+    if resolution is None:
+        resolution = WorkResolution(REFERENCE_WIDTH)
+    curtain = resolution.to_work(curtain)
+    min_area = resolution.work_area(BALL_MIN_AREA)
+    max_area = resolution.work_area(BALL_MAX_AREA)
+
+    hsv = cv2.cvtColor(curtain, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, BALL_COLOR_LOWER, BALL_COLOR_UPPER)
+    mask = cv2.dilate(mask, None, iterations=2)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    candidates = []
+    for c in contours:
+        area = cv2.contourArea(c)
+        if not min_area < area < max_area:
+            continue
+        perimeter = cv2.arcLength(c, True)
+        if perimeter == 0 or 4 * np.pi * area / perimeter ** 2 < BALL_MIN_CIRCULARITY:
+            continue
+        M = cv2.moments(c)
+        if M['m00'] > 0:
+            x, y = resolution.to_source(M['m10'] / M['m00'], M['m01'] / M['m00'], offset)
+            candidates.append((x, y, area))
+
+    candidates.sort(key=lambda c: -c[2])
+    return candidates[:BALL_MAX_CANDIDATES]
+
+
+def _new_kalman(x, y):
+    """恒速模型卡尔曼滤波器，状态 (x, y, vx, vy)，时间步长为一帧"""
+    kf = cv2.KalmanFilter(4, 2)
+    kf.transitionMatrix = np.array([[1, 0, 1, 0],
+                                    [0, 1, 0, 1],
+                                    [0, 0, 1, 0],
+                                    [0, 0, 0, 1]], np.float32)
+    kf.measurementMatrix = np.array([[1, 0, 0, 0],
+                                     [0, 1, 0, 0]], np.float32)
+    kf.processNoiseCov = np.eye(4, dtype=np.float32) * 4.0  # 允许碰撞时速度突变
+    kf.measurementNoiseCov = np.eye(2, dtype=np.float32) * 2.0
+    kf.errorCovPost = np.diag([4.0, 4.0, 400.0, 400.0]).astype(np.float32)
+    kf.statePost = np.array([[x], [y], [0], [0]], np.float32)
+    return kf
+
+
+def link_tracks(detections, gate=BALL_TRACK_GATE):
+    """
+    把逐帧候选关联成轨迹
+    detections: [(帧号, [(x, y, 面积), ...]), ...]（按帧号排序）
+    每条轨迹用卡尔曼滤波预测下一帧位置，按距离从近到远贪心匹配；
+    未匹配的候选开始新轨迹，连续两帧未匹配的轨迹结束
+    返回：[[(帧号, x, y), ...], ...]
+    """
+    active, finished = [], []
+    for frame_idx, candidates in detections:
+        predicted = [track['kf'].predict()[:2, 0] for track in active]
+
+        pairs = []
+        for t, pred in enumerate(predicted):
+            for c, (x, y, _) in enumerate(candidates):
+                dist = np.hypot(x - pred[0], y - pred[1])
+                if dist <= gate:
+                    pairs.append((dist, t, c))
+
+        used_tracks, used_cands = set(), set()
+        for _, t, c in sorted(pairs):
+            if t in used_tracks or c in used_cands:
+                continue
+            used_tracks.add(t)
+            used_cands.add(c)
+            x, y, _ = candidates[c]
+            active[t]['kf'].correct(np.array([[x], [y]], np.float32))
+            active[t]['points'].append((frame_idx, x, y))
+            active[t]['missed'] = 0
+
+        still_active = []
+        for t, track in enumerate(active):
+            if t not in used_tracks:
+                track['missed'] += 1
+            if track['missed'] >= 2:
+                finished.append(track)
+            else:
+                still_active.append(track)
+        active = still_active
+
+        for c, (x, y, _) in enumerate(candidates):
+            if c not in used_cands:
+                active.append({'kf': _new_kalman(x, y), 'points': [(frame_idx, x, y)], 'missed': 0})
+
+    return [track['points'] for track in finished + active]
+
+
+def turnaround_point(points):
+    """
+    轨迹的折返点：相邻两段位移方向变化最大的点（至少 BALL_TURN_MIN_ANGLE 度）
+    返回：(帧号, x, y)，没有折返时返回 None
+    """
+    if len(points) < 3:
+        return None
+    pts = np.array([(x, y) for _, x, y in points], np.float64)
+    v = np.diff(pts, axis=0)
+    norm = np.linalg.norm(v, axis=1)
+    norm[norm == 0] = np.inf
+    cos = (v[:-1] * v[1:]).sum(axis=1) / (norm[:-1] * norm[1:])
+    k = int(np.argmin(cos))
+    if cos[k] > np.cos(np.radians(BALL_TURN_MIN_ANGLE)):
+        return None
+    return points[k + 1]
+
+
+def choose_impact(tracks, peak_idx, min_motion=BALL_MIN_TRACK_MOTION):
+    """
+    从轨迹中选出击中点
+    有效轨迹（足够长且路径长度不小于 min_motion）中优先有折返的，取折返时间离峰值最近的；
+    都没有折返时取最长轨迹上离峰值最近的点
+    返回：(帧号, x, y) 或 None
+    """
+    valid = []
+    for points in tracks:
+        if len(points) < BALL_MIN_TRACK_LEN:
+            continue
+        pts = np.array([(x, y) for _, x, y in points], np.float64)
+        if np.linalg.norm(np.diff(pts, axis=0), axis=1).sum() < min_motion:
+            continue
+        valid.append(points)
+    if not valid:
+        return None
+
+    turns = [p for p in (turnaround_point(points) for points in valid) if p is not None]
+    if turns:
+        return min(turns, key=lambda p: abs(p[0] - peak_idx))
+
+    longest = max(valid, key=len)
+    return min(longest, key=lambda p: abs(p[0] - peak_idx))
+
+
+def localize_in_crops(crops, peak_idx, curtain_roi, resolution=None):
+    """
+    在已有的幕布区域图像序列上定位击中点（实时模式直接使用环形缓冲中的帧）
+    crops: [(帧号, 幕布区域 BGR 图像), ...]（按帧号排序）
+    resolution: WorkResolution，None 时按参考分辨率处理（像素参数不换算）
+
+    Returns:
+        {'pos': (x, y) 或 None, 'idx': 击中点所在帧号, 'method': 'track' / 'peak' / 'none',
+         'track': 选中轨迹（仅 method='track'）[(帧号, x, y), ...]}
+    """
+    if resolution is None:
+        resolution = WorkResolution(REFERENCE_WIDTH)
+    offset = (curtain_roi[0], curtain_roi[1])
+    detections = [(frame_idx, find_ball_candidates(crop, offset, resolution)) for frame_idx, crop in crops]
+
+    tracks = link_tracks(detections, gate=resolution.source_length(BALL_TRACK_GATE))
+    impact = choose_impact(tracks, peak_idx, min_motion=resolution.source_length(BALL_MIN_TRACK_MOTION))
+    if impact is not None:
+        track = next(points for points in tracks if impact in points)
+        return {'pos': (int(impact[1]), int(impact[2])), 'idx': impact[0],
+                'method': 'track', 'track': track}
+
+    # 回退：峰值帧单帧检测（取面积最大的候选）
+    for frame_idx, candidates in detections:
+        if frame_idx == peak_idx and candidates:
+            x, y, _ = candidates[0]
+            return {'pos': (int(x), int(y)), 'idx': peak_idx, 'method': 'peak'}
+    return {'pos': None, 'idx': peak_idx, 'method': 'none'}
+
+
+@timed('localize_ball')
+def localize_ball(video_path, peak_idx, curtain_roi, window=BALL_TRACK_WINDOW, resolution=None):
+    """在视频中峰值前后 window 帧内定位击中点，返回值同 localize_in_crops"""
+    start = max(0, peak_idx - window)
+    end = peak_idx + window
+
+    crops = []
+    with open_frame_source(video_path, roi=curtain_roi, start=start) as source:
+        for frame_idx, curtain in source:
+            if frame_idx == start and int(source.cap.get(cv2.CAP_PROP_POS_FRAMES)) != start + 1:
+                # 部分编码格式按帧号定位只能落到附近的关键帧，帧号不可信
+                crops = None
+                break
+            if frame_idx > end:
+                break
+            crops.append((frame_idx, curtain))
+
+    if crops is None:
+        x1, y1, x2, y2 = curtain_roi
+        frames = read_frames(video_path, range(start, end + 1))
+        crops = [(i, frames[i][y1:y2, x1:x2]) for i in sorted(frames)]
+
+    return localize_in_crops(crops, peak_idx, curtain_roi, resolution)
+
+
+def locate_ball(video_path, event, curtain_roi, resolution=None):
+    """detect_and_score 的 ball_locator：返回击中事件的击中点 (x, y) 或 None"""
+    return localize_ball(video_path, event['idx'], curtain_roi, resolution=resolution)['pos']
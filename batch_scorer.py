@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量计分 - 对一个目录（或通配符匹配）的全部视频计分
+
+每个视频一个输出目录，多个进程并行计分；同一摄像机位置的视频共用圆圈标定，
+已计分过的视频（按内容哈希识别，改名或移动过也能识别）直接跳过，中断后重新运行即可继续。
+
+输出目录结构：
+    <输出目录>/
+        calibration_cache.json        所有视频共用的标定缓存
+        motion_cache/                 所有视频共用的运动信号缓存
+        <文件名>_<哈希前12位>/         每个视频的 scoring_result.json、击中图片、scoring.log
+        batch_summary.csv             所有视频的汇总
+        batch_summary.jsonl
+
+流程：
+    1. 并行计算每个视频的内容哈希；已有同一哈希的结果时跳过
+    2. 提取待处理视频的第一帧并计算场景指纹，指纹相近（同一摄像机位置）的视频归为一组
+    3. 各组第一个视频的第一帧一起标定（本地检测，失败的打包成一个多图 Gemini 请求），写入共用的标定缓存
+    4. 全部视频并行计分（命中标定缓存）；有场景未能批量标定时，先计分各组第一个视频，其余视频再计分
+    5. 写出汇总
+
+使用方法：
+    python batch_scorer.py /data/2024-05-01/ -o output/batch -j 4
+    python batch_scorer.py "/data/*/court1_*.mov" --track
+"""
+import argparse
+import contextlib
+import csv
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from detect_circles_final import calibrate_scenes, extract_first_frame, preprocess_image
+from calibration_cache import (CalibrationCache, scene_fingerprint, fingerprint_distance,
+                               CALIBRATION_MAX_DRIFT)
+from motion_cache import file_digest
+from tennis_scorer import run_scoring
+
+VIDEO_EXTENSIONS = {'.mov', '.mp4', '.avi', '.mkv'}
+BATCH_OUTPUT_DIR = "output/batch"
+SUMMARY_FIELDS = ['video', 'sha256', 'recorded', 'output_dir', 'status', 'total_score',
+                  'hits', 'scored', 'seconds', 'error']
+
+
+def collect_videos(inputs, recursive=False):
+    """目录、通配符或文件路径 → 视频文件列表（去重、按路径排序）"""
+    videos = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            paths = glob.glob(pattern, recursive=recursive)
+        else:
+            paths = glob.glob(item, recursive=recursive) or [item]
+        for path in paths:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS:
+                videos.add(os.path.abspath(path))
+    return sorted(videos)
+
+
+def find_existing(output_root, digest):
+    """按内容哈希查找已完成的结果，返回 scoring_result.json 路径或 None"""
+    for path in glob.glob(os.path.join(output_root, f"*_{digest[:12]}", "scoring_result.json")):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                json.load(f)
+        except (OSError, ValueError):
+            continue  # 上次写到一半中断
+        return path
+    return None
+
+
+def inspect_video(task):
+    """
+    阶段 1（进程池）：内容哈希、已有结果检查、第一帧场景指纹
+    返回：{'video', 'sha256', 'output_dir', 'status': 'pending' / 'skipped', ...}
+    """
+    video_path, output_root, force = task
+    digest = file_digest(video_path)
+    item = {'video': video_path, 'sha256': digest}
+
+    existing = None if force else find_existing(output_root, digest)
+    if existing is not None:
+        return {**item, 'status': 'skipped', 'output_dir': os.path.dirname(existing)}
+
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    output_dir = os.path.join(output_root, f"{stem}_{digest[:12]}")
+    os.makedirs(output_dir, exist_ok=True)
+    first_frame_path = os.path.join(output_dir, "first_frame.jpg")
+    if extract_first_frame(video_path, first_frame_path) is None:
+        return {**item, 'status': 'error', 'output_dir': output_dir, 'error': '无法读取视频'}
+
+    preprocessed, crop_info = preprocess_image(first_frame_path)
+    return {**item, 'status': 'pending', 'output_dir': output_dir,
+            'fingerprint': scene_fingerprint(preprocessed), 'size': crop_info['original_size']}
+
+
+def group_by_scene(items, max_drift=CALIBRATION_MAX_DRIFT):
+    """
+    按场景指纹分组（分辨率相同且与组内第一个视频的汉明距离不超过 max_drift）
+    返回：[[item, ...], ...]，每组第一个为先计分的视频
+    """
+    groups = []
+    for item in items:
+        for group in groups:
+            leader = group[0]
+            if (leader['size'] == item['size']
+                    and fingerprint_distance(leader['fingerprint'], item['fingerprint']) <= max_drift):
+                group.append(item)
+                break
+        else:
+            groups.append([item])
+    return groups
+
+
+def score_video(task):
+    """
+    阶段 2（进程池）：对一个视频计分，输出写入该视频目录下的 scoring.log
+    返回：汇总行
+    """
+    item, cache_dir, track_ball, render_images = task
+    log_path = os.path.join(item['output_dir'], "scoring.log")
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        try:
+            run_scoring(item['video'], output_dir=item['output_dir'], force_detect_circles=True,
+                        track_ball=track_ball, cache_dir=cache_dir, render_images=render_images)
+        except Exception as e:
+            traceback.print_exc(file=log)
+            return summary_row({**item, 'status': 'error', 'error': str(e)})
+    return summary_row({**item, 'status': 'done'}, time.perf_counter() - start)
+
+
+def summary_row(item, seconds=None):
+    """汇总行：视频信息 + scoring_result.json 中的得分"""
+    row = {
+        'video': item['video'],
+        'sha256': item['sha256'],
+        'recorded': datetime.fromtimestamp(os.path.getmtime(item['video'])).isoformat(timespec='seconds'),
+        'output_dir': item['output_dir'],
+        'status': item['status'],
+        'total_score': None,
+        'hits': None,
+        'scored': None,
+        'seconds': round(seconds, 2) if seconds is not None else None,
+        'error': item.get('error'),
+    }
+    if item['status'] in ('done', 'skipped'):
+        with open(os.path.join(item['output_dir'], "scoring_result.json"), 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        row['total_score'] = result['total_score']
+        row['hits'] = len(result['events'])
+        row['scored'] = sum(1 for e in result['events'] if e['scored'])
+    return row
+
+
+def write_summary(rows, output_root):
+    """写出 batch_summary.csv 和 batch_summary.jsonl"""
+    csv_path = os.path.join(output_root, "batch_summary.csv")
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    jsonl_path = os.path.join(output_root, "batch_summary.jsonl")
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return csv_path, jsonl_path
+
+
+def run_batch(videos, output_root=BATCH_OUTPUT_DIR, workers=None, track_ball=False, force=False,
+              render_images=False):
+    """
+    批量计分
+
+    Args:
+        videos: 视频路径列表
+        output_root: 输出根目录
+        workers: 并行进程数，默认为 CPU 核数
+        track_ball: 多帧跟踪球的轨迹定位击中点
+        force: 忽略已有结果，全部重新计分
+        render_images: 立即渲染标注图片（默认只记录 render.json，之后用 render_cache.py 渲染）
+
+    Returns:
+        汇总行列表（与 videos 顺序相同）
+    """
+    os.makedirs(output_root, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        items = list(pool.map(inspect_video, [(v, output_root, force) for v in videos]))
+
+        # 内容相同的视频只计分一次
+        pending, duplicates, first_by_digest = [], [], {}
+        for item in items:
+            if item['status'] != 'pending':
+                continue
+            if item['sha256'] in first_by_digest:
+                duplicates.append(item)
+            else:
+                first_by_digest[item['sha256']] = item
+                pending.append(item)
+        groups = group_by_scene(pending)
+        skipped = sum(1 for item in items if item['status'] == 'skipped')
+        print(f"视频: {len(videos)} 个, 已有结果跳过 {skipped} 个, 内容重复 {len(duplicates)} 个, "
+              f"待计分 {len(pending)} 个 ({len(groups)} 个场景)")
+
+        rows = {}
+        for item in items:
+            if item['status'] != 'pending':
+                rows[item['video']] = summary_row(item)
+
+        # 各场景一起标定；未能批量标定时每个场景先计分一个视频，标定结果写入共用缓存后再计分其余视频
+        leaders = [group[0] for group in groups]
+        followers = [item for group in groups for item in group[1:]]
+        batches = (leaders, followers)
+        if leaders:
+            cache = CalibrationCache(os.path.join(output_root, "calibration_cache.json"))
+            try:
+                calibrated = calibrate_scenes(
+                    [os.path.join(item['output_dir'], "first_frame.jpg") for item in leaders], cache)
+            except Exception as e:
+                print(f"批量标定失败，逐个场景标定: {e}")
+                calibrated = 0
+            if calibrated == len(leaders):
+                batches = (leaders + followers,)
+        for batch in batches:
+            tasks = [(item, output_root, track_ball, render_images) for item in batch]
+            for row in pool.map(score_video, tasks):
+                rows[row['video']] = row
+                score = row['total_score'] if row['status'] == 'done' else row['error']
+                print(f"  [{len(rows):>4}/{len(videos)}] {os.path.basename(row['video']):<40} "
+                      f"{row['status']:<6} {score}")
+
+    for item in duplicates:
+        # 结果指向第一次出现的视频的目录，删除阶段 1 为它创建的目录
+        shutil.rmtree(item['output_dir'], ignore_errors=True)
+        original = rows[first_by_digest[item['sha256']]['video']]
+        item = {**item, 'output_dir': original['output_dir']}
+        if original['status'] == 'done':
+            rows[item['video']] = summary_row({**item, 'status': 'skipped'})
+        else:
+            rows[item['video']] = summary_row({**item, 'status': 'error',
+                                               'error': f"与 {original['video']} 内容相同，计分失败"})
+
+    return [rows[v] for v in videos]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量计分：目录或通配符匹配的全部视频")
+    parser.add_argument("inputs", nargs="+", help="视频目录、通配符或文件路径")
+    parser.add_argument("-o", "--output", default=BATCH_OUTPUT_DIR, help="输出根目录")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并行进程数（默认 CPU 核数）")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归查找子目录")
+    parser.add_argument("-t", "--track", action="store_true", help="多帧跟踪球的轨迹定位击中点")
+    parser.add_argument("-f", "--force", action="store_true", help="忽略已有结果，全部重新计分")
+    parser.add_argument("--render", action="store_true", help="立即渲染标注图片（默认不渲染）")
+    args = parser.parse_args()
+
+    videos = collect_videos(args.inputs, args.recursive)
+    if not videos:
+        print("错误: 没有找到视频文件")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("批量计分")
+    print("=" * 60)
+    print(f"输出目录: {args.output}")
+    print("-" * 60)
+
+    start = time.perf_counter()
+    rows = run_batch(videos, args.output, args.workers, args.track, args.force, args.render)
+    csv_path, jsonl_path = write_summary(rows, args.output)
+
+    done = [r for r in rows if r['status'] in ('done', 'skipped')]
+    errors = [r for r in rows if r['status'] == 'error']
+    print("-" * 60)
+    print(f"完成 {len(done)} 个（其中跳过 {sum(1 for r in rows if r['status'] == 'skipped')} 个），"
+          f"失败 {len(errors)} 个，总得分 {sum(r['total_score'] for r in done)}，"
+          f"耗时 {time.perf_counter() - start:.1f}s")
+    print(f"汇总: {csv_path}")
+    print(f"      {jsonl_path}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
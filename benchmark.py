@@ -0,0 +1,845 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+
+使用方法：
+    python benchmark.py decode <视频路径> [--circles circles_config.json] [--frames 600]
+    python benchmark.py parallel <视频路径> [--circles circles_config.json] [--workers 1,2,4,8]
+    python benchmark.py peaks [--frames 1000000] [--repeat 3]
+    python benchmark.py kernel <视频路径> [--circles circles_config.json] [--frames 300] [--repeat 5]
+    python benchmark.py adaptive <视频路径> --circles circles_config.json [--repeat 3]
+    python benchmark.py suite [--scenarios 720p30,1080p30] [--repeat 3] [--json output/bench.json]
+    python benchmark.py compare 旧结果.json 新结果.json [--tolerance 0.1]
+    python benchmark.py startup [--repeat 5]
+    python benchmark.py local [--sizes 1280x720,1920x1080,3840x2160] [--noise 0,2,6,12]
+
+suite 在合成视频（见 synthetic_video.py）上运行完整计分流程，报告吞吐量、
+每次击中的延迟、峰值内存和计分准确率；结果保存为 JSON，用 compare 比较两次提交。
+adaptive 比较自适应跳帧与全帧率处理：耗时、完整读取的帧数，以及击中帧是否一致（相差不超过 1 帧）。
+kernel 比较逐帧运动量计算（MotionKernel，预分配缓冲）与逐帧新建图像的实现：每帧耗时和临时内存。
+startup 测量冷启动时间（命令行 --help、Web 应用启动、第一个工作进程就绪），超过预算时退出码为 1。
+local 在合成靶面上检查本地圆圈检测（detect_with_opencv）：各分辨率下 6 个圆圈都被本地接受，否则退出码为 1。
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from detect_hit_score import (
+    get_curtain_roi, detect_motion_streaming, detect_motion_parallel,
+    find_hit_events, find_hit_indices, batch_threshold, detect_and_score, motion_options,
+    WARMUP_SEC, COOLDOWN_SEC, MotionKernel
+)
+from frame_source import open_frame_source
+from instrumentation import peak_rss_mb, profile
+from live_scorer import LiveScorer, LIVE_CONFIRM_FRAMES
+from param_sweep import match_hits
+from region_motion import MotionRegions
+from resolution import WorkResolution
+from synthetic_video import DEFAULT_PARAMS, SYNTH_VERSION, generate_video, synthetic_circles, render_background
+
+# 合成视频场景：名称 → 生成参数（未给出的使用 synthetic_video.DEFAULT_PARAMS）
+SUITE_SCENARIOS = {
+    '720p30': {'width': 1280, 'height': 720, 'fps': 30},
+    '1080p30': {'width': 1920, 'height': 1080, 'fps': 30},
+    '1080p60': {'width': 1920, 'height': 1080, 'fps': 60},
+    '720p30-noisy': {'width': 1280, 'height': 720, 'fps': 30, 'noise': 8.0, 'distractor': True},
+    '2160p30': {'width': 3840, 'height': 2160, 'fps': 30},
+}
+SUITE_VIDEO_DIR = "output/bench_videos"  # 合成视频缓存目录（按参数生成一次）
+COMPARE_TOLERANCE = 0.1  # compare 判定退化的相对变化
+
+# 冷启动预算（秒，取多次运行的中位数）
+STARTUP_BUDGET_SEC = {
+    'cli_help': 0.25,  # python tennis_scorer.py --help（进程启动到退出）
+    'app_boot': 1.5,  # python -c "import app"（进程启动到退出）
+    'worker_fork': 0.25,  # 已导入 app 的进程中，提交第一个任务到完成（创建进程池 + 启动工作进程）
+}
+STARTUP_HEAVY_MODULES = ('cv2', 'numpy', 'flask', 'google.genai')  # 报告各入口是否加载了这些模块
+
+# 各启动场景在子进程中运行的脚本；最后输出一行 STARTUP <JSON>（加载的重模块，以及脚本内计时）
+STARTUP_PROBES = {
+    'cli_help': """
+import runpy
+sys.argv = ['tennis_scorer.py', '--help']
+try:
+    runpy.run_path('tennis_scorer.py', run_name='__main__')
+except SystemExit:
+    pass
+""",
+    'app_boot': """
+import app
+""",
+    'worker_fork': """
+import app
+from task_queue import TaskQueue
+start = time.perf_counter()
+queue = TaskQueue(workers=1)
+queue.submit('startup', len)
+while queue.get('startup')['status'] not in ('done', 'error'):
+    time.sleep(0.001)
+result['seconds'] = time.perf_counter() - start
+queue.shutdown()
+""",
+}
+
+
+# 解码后端配置：名称 → (后端, 选项)，'roi' 会替换为实际幕布区域
+DECODE_CONFIGS = [
+    ('opencv 整帧 BGR', 'opencv', {}),
+    ('opencv 幕布灰度', 'opencv', {'roi': 'roi', 'gray': True}),
+    ('opencv 幕布灰度 stride=2', 'opencv', {'roi': 'roi', 'gray': True, 'stride': 2}),
+    ('opencv 幕布灰度 0.5x', 'opencv', {'roi': 'roi', 'gray': True, 'scale': 0.5}),
+    ('ffmpeg 整帧 BGR', 'ffmpeg', {}),
+    ('ffmpeg 幕布灰度', 'ffmpeg', {'roi': 'roi', 'gray': True}),
+    ('ffmpeg 幕布灰度 stride=2', 'ffmpeg', {'roi': 'roi', 'gray': True, 'stride': 2}),
+    ('ffmpeg 幕布灰度 0.5x', 'ffmpeg', {'roi': 'roi', 'gray': True, 'scale': 0.5}),
+]
+
+
+def benchmark_decode(video_path, roi, max_frames=None):
+    """
+    测量各解码后端的吞吐量
+    返回：[{'name', 'backend', 'frames', 'seconds', 'fps'}, ...]
+    fps 按覆盖的视频帧数计算（跳帧时包含被跳过的帧）
+    """
+    results = []
+    for name, backend, options in DECODE_CONFIGS:
+        options = {k: (roi if v == 'roi' else v) for k, v in options.items()}
+        try:
+            start = time.perf_counter()
+            covered = 0
+            with open_frame_source(video_path, backend, **options) as source:
+                for frame_idx, _ in source:
+                    covered = frame_idx + 1
+                    if max_frames and covered >= max_frames:
+                        break
+            elapsed = time.perf_counter() - start
+        except (OSError, ValueError) as e:
+            print(f"  {name:<28} 跳过: {e}")
+            continue
+
+        results.append({
+            'name': name,
+            'backend': backend,
+            'frames': covered,
+            'seconds': elapsed,
+            'fps': covered / elapsed if elapsed > 0 else 0.0,
+        })
+        print(f"  {name:<28} {covered:>6} 帧  {elapsed:7.2f}s  {results[-1]['fps']:8.1f} fps")
+
+    return results
+
+
+def benchmark_parallel(video_path, roi, worker_counts):
+    """
+    测量并行分段运动检测的墙钟时间随进程数的变化
+    返回：[{'workers', 'seconds', 'speedup'}, ...]，speedup 相对串行流式模式
+    """
+    start = time.perf_counter()
+    detect_motion_streaming(video_path, roi, max_candidates=0)
+    serial = time.perf_counter() - start
+    print(f"  {'串行':<8} {serial:7.2f}s")
+
+    results = [{'workers': 0, 'seconds': serial, 'speedup': 1.0}]
+    for workers in worker_counts:
+        start = time.perf_counter()
+        detect_motion_parallel(video_path, roi, workers=workers)
+        elapsed = time.perf_counter() - start
+        results.append({'workers': workers, 'seconds': elapsed, 'speedup': serial / elapsed})
+        print(f"  {workers:>2} 进程   {elapsed:7.2f}s  加速 {serial / elapsed:5.2f}x")
+
+    return results
+
+
+def find_hit_events_loop(frames_data, fps, threshold_factor=1.5, cooldown_sec=1.0):
+    """逐帧循环的击中识别（向量化之前的实现，作为基准和结果对照）"""
+    motion_scores = [f['motion'] for f in frames_data]
+    threshold = batch_threshold(motion_scores, threshold_factor)
+
+    cooldown_frames = int(fps * cooldown_sec)
+    hit_events = []
+
+    i = int(fps * WARMUP_SEC)
+    while i < len(frames_data):
+        fd = frames_data[i]
+        if fd['motion'] > threshold:
+            peak_frame = fd
+            j = i + 1
+            while j < len(frames_data) and j - i < cooldown_frames:
+                if frames_data[j]['motion'] > peak_frame['motion']:
+                    peak_frame = frames_data[j]
+                j += 1
+            hit_events.append(peak_frame)
+            i = i + cooldown_frames
+        else:
+            i += 1
+
+    return hit_events, threshold
+
+
+def synthetic_motion(frames, fps=30.0, hit_interval_sec=4.0, seed=0):
+    """
+    模拟发球机长时间训练的运动量序列：
+    背景噪声 + 每隔约 hit_interval_sec 一次击中（持续数帧的尖峰，附带余震）
+    """
+    rng = np.random.default_rng(seed)
+    motion = rng.gamma(4.0, 2.5e4, frames).round()
+    starts = np.arange(int(fps), frames, int(fps * hit_interval_sec))
+    starts = starts + rng.integers(-int(fps), int(fps), len(starts))
+    for offset, gain in ((0, 8.0), (1, 12.0), (2, 6.0), (4, 3.0)):
+        idx = np.clip(starts + offset, 0, frames - 1)
+        motion[idx] *= gain
+    return motion
+
+
+def benchmark_peaks(frames, repeat=3, fps=30.0, cooldown_sec=1.5):
+    """
+    测量击中识别的耗时：逐帧循环 vs 向量化
+    返回：[{'name', 'frames', 'hits', 'seconds'}, ...]（取 repeat 次中的最小值）
+    """
+    motion = synthetic_motion(frames, fps)
+    frames_data = [{'idx': i, 'time': i / fps, 'motion': m} for i, m in enumerate(motion.tolist())]
+    threshold = batch_threshold(motion)
+
+    cases = [
+        ('逐帧循环 (frames_data)', lambda: find_hit_events_loop(frames_data, fps, cooldown_sec=cooldown_sec)[0]),
+        ('向量化 (frames_data)', lambda: find_hit_events(frames_data, fps, cooldown_sec=cooldown_sec)[0]),
+        ('向量化 (数组)', lambda: find_hit_indices(motion, fps, threshold, cooldown_sec)),
+    ]
+
+    results = []
+    outputs = []
+    for name, fn in cases:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hits = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        indices = [e['idx'] for e in hits] if isinstance(hits, list) else hits.tolist()
+        outputs.append(indices)
+        results.append({'name': name, 'frames': frames, 'hits': len(indices), 'seconds': best})
+        print(f"  {name:<24} {len(indices):>6} 次击中  {best * 1000:9.1f} ms"
+              f"  加速 {results[0]['seconds'] / best:6.1f}x")
+
+    print(f"  结果一致: {'是' if all(o == outputs[0] for o in outputs) else '否'}")
+    return results
+
+
+def motion_alloc(prev, curtain, scale, ksize, regions=None):
+    """逐帧新建图像的运动量计算（MotionKernel 之前的实现，作为基准和结果对照）"""
+    gray = cv2.cvtColor(curtain, cv2.COLOR_BGR2GRAY)
+    if scale != 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    gray = cv2.GaussianBlur(gray, (ksize, ksize), 0)
+    if prev is None:
+        return (0, None), gray
+    diff = cv2.absdiff(prev, gray)
+    if regions is None:
+        return (int(np.sum(diff)), None), gray
+    return regions.sums(diff), gray
+
+
+def benchmark_kernel(video_path, roi, frames=300, repeat=5, regions=None, resolution=None):
+    """
+    测量逐帧运动量计算的耗时和临时内存：逐帧新建图像 vs MotionKernel（预分配缓冲）
+    先把 frames 帧解码到内存（不计解码），输入为原帧上的幕布区域切片，与运动检测相同
+    每帧耗时取 repeat 次中最快一次的平均；临时内存为 tracemalloc 下每帧分配的峰值
+    返回：[{'name', 'frames', 'us_per_frame', 'alloc_kb_per_frame', 'allocating_frames'}, ...]
+    """
+    resolution = resolution or WorkResolution.for_video(video_path)
+    scale, ksize = resolution.scale, resolution.blur_ksize
+    x1, y1, x2, y2 = roi
+    with open_frame_source(video_path) as source:
+        decoded = []
+        for _, frame in source:
+            decoded.append(frame)
+            if len(decoded) >= frames:
+                break
+
+    def run_alloc():
+        prev, out = None, []
+        for frame in decoded:
+            result, prev = motion_alloc(prev, frame[y1:y2, x1:x2], scale, ksize, regions)
+            out.append(result)
+        return out
+
+    def run_kernel():
+        kernel = MotionKernel(scale, ksize, regions)
+        return [kernel(frame[y1:y2, x1:x2]) for frame in decoded]
+
+    def per_frame_alloc(step):
+        # 逐帧记录 tracemalloc 峰值相对帧开始时的增量（该帧内同时存在的临时分配）
+        tracemalloc.start()
+        peaks = []
+        try:
+            for frame in decoded:
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                step(frame[y1:y2, x1:x2])
+                peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        finally:
+            tracemalloc.stop()
+        return np.array(peaks[1:])  # 第一帧分配缓冲，不计
+
+    def alloc_step():
+        state = {'prev': None}
+
+        def step(curtain):
+            _, state['prev'] = motion_alloc(state['prev'], curtain, scale, ksize, regions)
+        return step
+
+    cases = [
+        ('逐帧新建图像', run_alloc, alloc_step),
+        ('MotionKernel', run_kernel, lambda: MotionKernel(scale, ksize, regions)),
+    ]
+
+    results = []
+    outputs = []
+    for name, run, make_step in cases:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        outputs.append([(m, None if r is None else r.tolist()) for m, r in output])
+        peaks = per_frame_alloc(make_step())
+        results.append({
+            'name': name,
+            'frames': len(decoded),
+            'us_per_frame': best / len(decoded) * 1e6,
+            'alloc_kb_per_frame': float(peaks.mean()) / 1024 if len(peaks) else 0.0,
+            'allocating_frames': int(np.count_nonzero(peaks >= 4096)),  # 分配 4KB 以上的帧数
+        })
+        r = results[-1]
+        print(f"  {name:<16} {r['us_per_frame']:9.1f} us/帧  临时内存 {r['alloc_kb_per_frame']:9.1f} KB/帧"
+              f"  (≥4KB 的帧 {r['allocating_frames']}/{max(0, r['frames'] - 1)})"
+              f"  加速 {results[0]['us_per_frame'] / r['us_per_frame']:5.2f}x")
+
+    print(f"  结果一致: {'是' if all(o == outputs[0] for o in outputs) else '否'}")
+    return results
+
+
+def benchmark_adaptive(video_path, roi, repeat=3, regions=None, resolution=None):
+    """
+    比较全帧率处理与自适应跳帧（detect_motion_streaming(adaptive=True)）
+    每种方式重复 repeat 次取最快一次；击中在两者的运动序列上分别识别
+    返回：[{'name', 'frames', 'seconds', 'processed', 'dense', 'hits', 'max_offset'}, ...]
+          processed 为完整读取的帧数，dense 为逐帧处理（运动量与全帧率相同）的帧数，
+          max_offset 为与全帧率击中帧的最大相差帧数（击中数不同时为 None）
+    """
+    resolution = resolution or WorkResolution.for_video(video_path)
+    options = motion_options(resolution)
+
+    results = []
+    reference = None
+    for name, adaptive in (('全帧率', False), ('自适应跳帧', True)):
+        best = None
+        for _ in range(repeat):
+            with profile() as profiler:
+                start = time.perf_counter()
+                frames_data, fps, _ = detect_motion_streaming(video_path, roi, max_candidates=0,
+                                                              regions=regions, adaptive=adaptive, **options)
+                elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best, processed = elapsed, profiler.summary()['detect_motion.diff']['frames']
+        events, _ = find_hit_events(frames_data, fps, cooldown_sec=COOLDOWN_SEC, regions=regions)
+        hits = [e['idx'] for e in events]
+        reference = hits if reference is None else reference
+        offset = (max((abs(a - b) for a, b in zip(hits, reference)), default=0)
+                  if len(hits) == len(reference) else None)
+        results.append({
+            'name': name,
+            'frames': len(frames_data),
+            'seconds': best,
+            'processed': processed,
+            'dense': sum(1 for f in frames_data if not f.get('filled')),
+            'hits': len(hits),
+            'max_offset': offset,
+        })
+        r = results[-1]
+        print(f"  {name:<10} {r['seconds']:7.2f}s  完整读取 {r['processed']:>6}/{r['frames']} 帧  "
+              f"逐帧处理 {r['dense']:>6} 帧  击中 {r['hits']:>3}  "
+              f"相差 {'-' if offset is None else offset} 帧  加速 {results[0]['seconds'] / best:5.2f}x")
+
+    ok = results[-1]['max_offset'] is not None and results[-1]['max_offset'] <= 1
+    print(f"  击中一致（相差不超过 1 帧）: {'是' if ok else '否'}")
+    return results
+
+
+def ensure_video(name, params, video_dir=SUITE_VIDEO_DIR):
+    """按参数生成合成视频，已生成过时直接复用（击中信息从标注文件读取）"""
+    params = {**DEFAULT_PARAMS, **params}
+    key = hashlib.sha1(json.dumps([SYNTH_VERSION, params], sort_keys=True).encode()).hexdigest()[:10]
+    video_path = os.path.join(video_dir, f"{name}_{key}.avi")
+    base, _ = os.path.splitext(video_path)
+    labels_path = f"{base}_labels.json"
+
+    if os.path.exists(video_path) and os.path.exists(labels_path):
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)[0]
+        return {'video': video_path, 'circles': entry['circles'], 'labels': labels_path,
+                'params': params, 'hits': entry['hits']}
+    return generate_video(video_path, **params)
+
+
+def score_accuracy(events, labels):
+    """
+    计分准确率：按时间匹配检测结果与标注
+    返回：{'precision', 'recall', 'score_accuracy', 'total_score', 'expected_score'}
+    score_accuracy 为得分正确的标注击中比例（漏检算错）
+    """
+    pairs = match_hits([e['time'] for e in events], [h['time'] for h in labels])
+    correct = sum(1 for i, j in pairs if events[i]['score'] == labels[j]['score'])
+    return {
+        'hits': len(labels),
+        'detected': len(events),
+        'precision': len(pairs) / len(events) if events else 0.0,
+        'recall': len(pairs) / len(labels) if labels else 0.0,
+        'score_accuracy': correct / len(labels) if labels else 0.0,
+        'total_score': sum(e['score'] for e in events),
+        'expected_score': sum(h['score'] for h in labels),
+    }
+
+
+def run_scenario(task):
+    """
+    在一个合成视频上运行完整计分流程和实时计分（在独立进程中运行，峰值内存互不影响）
+    返回：场景结果字典
+    """
+    name, video, output_dir, repeat = task
+    with open(video['circles'], 'r') as f:
+        circles_config = json.load(f)
+    frames = int(video['params']['duration'] * video['params']['fps'])
+
+    # 批处理：detect_and_score，重复 repeat 次取最快一次（及其分阶段统计）
+    elapsed, stages = None, None
+    for _ in range(repeat):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), profile() as profiler:
+            start = time.perf_counter()
+            _, events = detect_and_score(video['video'], video['circles'],
+                                         output_dir=os.path.join(output_dir, name),
+                                         render_images=False)
+            seconds = time.perf_counter() - start
+        if elapsed is None or seconds < elapsed:
+            elapsed, stages = seconds, profiler.summary()
+    batch = score_accuracy(events, video['hits'])
+
+    # 实时：LiveScorer 不节流读取，延迟 = 峰值帧读入到事件发布（另加确认等待的帧数）
+    live_events = []
+    live = LiveScorer(video['video'], circles_config, on_event=live_events.append)
+    live_start = time.perf_counter()
+    stats = live.run()
+    live_elapsed = time.perf_counter() - live_start
+    confirm_ms = LIVE_CONFIRM_FRAMES * 1000 / video['params']['fps']
+
+    return {
+        'name': name,
+        'params': video['params'],
+        'frames': frames,
+        'seconds': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+        'seconds_per_hit': elapsed / len(events) if events else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'accuracy': batch,
+        'stages': stages,
+        'live': {
+            'fps': stats['frames'] / live_elapsed if live_elapsed > 0 else 0.0,
+            'mean_latency_ms': stats['mean_latency_ms'],
+            'max_latency_ms': stats['max_latency_ms'],
+            'stream_latency_ms': stats['mean_latency_ms'] + confirm_ms,
+            'accuracy': score_accuracy(live_events, video['hits']),
+        },
+    }
+
+
+def benchmark_suite(scenarios, video_dir=SUITE_VIDEO_DIR, output_dir="output/bench_runs", repeat=3):
+    """
+    运行合成视频基准测试
+    scenarios: {名称: 生成参数}
+    repeat: 批处理重复次数（取最快一次）
+    返回：{'commit', 'created', 'environment', 'scenarios': [run_scenario 的结果, ...]}
+    """
+    results = []
+    for name, params in scenarios.items():
+        # 生成视频和运行场景各用一个新启动（spawn）的进程：子进程的峰值内存从父进程当前的
+        # 常驻内存开始计，父进程不做重活，各场景的峰值内存才可以比较
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            video = pool.submit(ensure_video, name, params, video_dir).result()
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            r = pool.submit(run_scenario, (name, video, output_dir, repeat)).result()
+        results.append(r)
+        acc, live = r['accuracy'], r['live']
+        print(f"  {name:<14} {r['frames']:>5} 帧  {r['fps']:7.1f} fps  {r['peak_rss_mb'] or 0:6.0f} MB  "
+              f"召回 {acc['recall']:.0%}  得分正确 {acc['score_accuracy']:.0%}  "
+              f"实时延迟 {live['mean_latency_ms']:.1f}/{live['max_latency_ms']:.1f} ms")
+
+    return {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'scenarios': results,
+    }
+
+
+def git_commit():
+    """当前提交（短哈希），不在 git 仓库中时返回 None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# compare 比较的指标：(名称, 取值函数, 越大越好)
+COMPARE_METRICS = [
+    ('吞吐量 fps', lambda r: r['fps'], True),
+    ('峰值内存 MB', lambda r: r['peak_rss_mb'], False),
+    ('实时平均延迟 ms', lambda r: r['live']['mean_latency_ms'], False),
+    ('实时最大延迟 ms', lambda r: r['live']['max_latency_ms'], False),
+    ('召回率', lambda r: r['accuracy']['recall'], True),
+    ('得分正确率', lambda r: r['accuracy']['score_accuracy'], True),
+]
+
+
+def compare_results(old, new, tolerance=COMPARE_TOLERANCE):
+    """
+    比较两次 suite 结果，打印各场景指标的变化
+    性能指标变差超过 tolerance（相对值）或准确率下降时记为退化
+    返回：退化项列表 [(场景, 指标, 旧值, 新值), ...]
+    """
+    old_by_name = {r['name']: r for r in old['scenarios']}
+    regressions = []
+    for r in new['scenarios']:
+        base = old_by_name.get(r['name'])
+        if base is None:
+            print(f"  {r['name']}: 旧结果中没有该场景，跳过")
+            continue
+        if base['params'] != r['params']:
+            print(f"  {r['name']}: 生成参数不同，结果不可比较")
+            continue
+        print(f"  {r['name']}")
+        for metric, get, higher_better in COMPARE_METRICS:
+            a, b = get(base), get(r)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a if a else 0.0
+            if metric in ('召回率', '得分正确率'):
+                worse = b < a
+            else:
+                worse = (-change if higher_better else change) > tolerance
+            if worse:
+                regressions.append((r['name'], metric, a, b))
+            print(f"    {metric:<14} {a:10.2f} → {b:10.2f}  {change:+7.1%}{'  退化' if worse else ''}")
+    return regressions
+
+
+def run_startup_probe(name):
+    """在新的 Python 进程中运行一个启动场景，返回 (耗时秒, 加载的重模块)"""
+    script = "import json, sys, time\nresult = {}\n" + STARTUP_PROBES[name] + (
+        "\nresult['modules'] = [m for m in %r if m in sys.modules]"
+        "\nprint('STARTUP ' + json.dumps(result))\n" % (STARTUP_HEAVY_MODULES,)
+    )
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed = time.perf_counter() - start
+    line = next((l for l in proc.stdout.splitlines() if l.startswith('STARTUP ')), None)
+    if proc.returncode != 0 or line is None:
+        raise RuntimeError(f"启动场景 {name} 失败: {proc.stderr.strip()[-500:]}")
+    result = json.loads(line[len('STARTUP '):])
+    return result.get('seconds', elapsed), result['modules']
+
+
+def benchmark_startup(repeat=5, budget=None):
+    """
+    冷启动时间：每个场景在新进程中运行 repeat 次，取中位数并与预算比较
+    返回：[{'name', 'seconds', 'runs', 'budget', 'ok', 'modules'}, ...]
+    """
+    budget = budget or STARTUP_BUDGET_SEC
+    results = []
+    for name in STARTUP_PROBES:
+        runs = []
+        for _ in range(repeat):
+            seconds, modules = run_startup_probe(name)
+            runs.append(seconds)
+        median = float(np.median(runs))
+        results.append({
+            'name': name,
+            'seconds': round(median, 4),
+            'runs': [round(r, 4) for r in runs],
+            'budget': budget[name],
+            'ok': median <= budget[name],
+            'modules': modules,
+        })
+        print(f"  {name:<12} {median * 1000:8.1f} ms  (预算 {budget[name] * 1000:.0f} ms)"
+              f"  {'通过' if median <= budget[name] else '超出'}  加载: {', '.join(modules) or '-'}")
+    return results
+
+
+def benchmark_local_detection(sizes, noises, seed=0):
+    """
+    本地圆圈检测在合成靶面（synthetic_video.render_background，加高斯噪声）上的结果
+    返回：[{'size', 'noise', 'found', 'confidence', 'max_error', 'ok'}, ...]
+          max_error 为原图坐标中与真实圆心的最大距离；ok 表示 detect_local 接受且分值、圆心正确
+    """
+    from detect_circles_final import (
+        preprocess_image, detect_with_opencv, convert_to_original_coords, EXPECTED_CIRCLES,
+        LOCAL_MIN_CONFIDENCE
+    )
+
+    rng = np.random.default_rng(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for w, h in sizes:
+            circles = synthetic_circles(w, h)
+            background = render_background(w, h, circles)
+            for noise in noises:
+                image = background
+                if noise > 0:
+                    image = np.clip(background + rng.normal(0, noise, background.shape), 0, 255).astype(np.uint8)
+                path = os.path.join(tmp, f"{w}x{h}_{noise}.png")
+                cv2.imwrite(path, image)
+
+                preprocessed, crop_info = preprocess_image(path)
+                found, confidence = detect_with_opencv(preprocessed, crop_info)
+                detected = convert_to_original_coords(found, crop_info)
+                errors = []
+                for c in circles:
+                    dists = [np.hypot(d['center'][0] - c['center'][0], d['center'][1] - c['center'][1])
+                             for d in detected if d['score'] == c['score']]
+                    errors.append(min(dists) if dists else float('inf'))
+                max_error = max(errors)
+                ok = (len(found) == sum(EXPECTED_CIRCLES.values()) and confidence >= LOCAL_MIN_CONFIDENCE
+                      and all(e <= c['radius'] * 0.2 for e, c in zip(errors, circles)))
+                results.append({'size': f"{w}x{h}", 'noise': noise, 'found': len(found),
+                                'confidence': round(float(confidence), 3), 'max_error': round(max_error, 1),
+                                'ok': ok})
+                print(f"  {w}x{h:<6} 噪声 {noise:>4}  找到 {len(found)}  置信度 {confidence:.2f}  "
+                      f"圆心误差 {max_error:4.1f}px  {'本地接受' if ok else '失败'}")
+    return results
+
+
+def resolve_roi(args):
+    """根据命令行参数确定幕布区域：--roi > --circles > 整帧"""
+    if args.roi:
+        return tuple(int(v) for v in args.roi.split(','))
+    if args.circles:
+        with open(args.circles, 'r') as f:
+            return get_curtain_roi(json.load(f))
+    with open_frame_source(args.video) as source:
+        return (0, 0, source.width, source.height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网球计分系统性能基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_decode = sub.add_parser("decode", help="解码后端吞吐量")
+    p_decode.add_argument("video", help="视频文件路径")
+    p_decode.add_argument("--circles", help="圆圈配置文件（用于计算幕布区域）")
+    p_decode.add_argument("--roi", help="幕布区域 x1,y1,x2,y2（优先于 --circles）")
+    p_decode.add_argument("--frames", type=int, default=None, help="最多测试的帧数")
+    p_decode.add_argument("--json", help="结果保存路径")
+
+    p_parallel = sub.add_parser("parallel", help="并行分段运动检测的扩展性")
+    p_parallel.add_argument("video", help="视频文件路径")
+    p_parallel.add_argument("--circles", help="圆圈配置文件（用于计算幕布区域）")
+    p_parallel.add_argument("--roi", help="幕布区域 x1,y1,x2,y2（优先于 --circles）")
+    p_parallel.add_argument("--workers", default=None,
+                            help="逗号分隔的进程数列表，默认 1,2,4,...,CPU 核数")
+    p_parallel.add_argument("--json", help="结果保存路径")
+
+    p_peaks = sub.add_parser("peaks", help="击中识别（峰值查找）耗时")
+    p_peaks.add_argument("--frames", type=int, default=1000000, help="模拟运动量序列的帧数")
+    p_peaks.add_argument("--repeat", type=int, default=3, help="每种实现重复次数")
+    p_peaks.add_argument("--json", help="结果保存路径")
+
+    p_kernel = sub.add_parser("kernel", help="逐帧运动量计算的耗时和临时内存")
+    p_kernel.add_argument("video", help="视频文件路径")
+    p_kernel.add_argument("--circles", help="圆圈配置文件（幕布区域，同时按圆圈求分区域运动量）")
+    p_kernel.add_argument("--roi", help="幕布区域 x1,y1,x2,y2（优先于 --circles）")
+    p_kernel.add_argument("--frames", type=int, default=300, help="解码到内存中测试的帧数")
+    p_kernel.add_argument("--repeat", type=int, default=5, help="每种实现重复次数")
+    p_kernel.add_argument("--json", help="结果保存路径")
+
+    p_adaptive = sub.add_parser("adaptive", help="自适应跳帧与全帧率处理的比较")
+    p_adaptive.add_argument("video", help="视频文件路径")
+    p_adaptive.add_argument("--circles", help="圆圈配置文件（幕布区域，同时按圆圈求分区域运动量）")
+    p_adaptive.add_argument("--roi", help="幕布区域 x1,y1,x2,y2（优先于 --circles）")
+    p_adaptive.add_argument("--repeat", type=int, default=3, help="每种方式重复次数（取最快一次）")
+    p_adaptive.add_argument("--json", help="结果保存路径")
+
+    p_suite = sub.add_parser("suite", help="合成视频上的吞吐量、延迟、内存和准确率")
+    p_suite.add_argument("--scenarios", default=",".join(SUITE_SCENARIOS),
+                         help=f"逗号分隔的场景（{', '.join(SUITE_SCENARIOS)}）")
+    p_suite.add_argument("--duration", type=float, default=None, help="覆盖各场景的视频时长（秒）")
+    p_suite.add_argument("--seed", type=int, default=None, help="覆盖各场景的随机种子")
+    p_suite.add_argument("--repeat", type=int, default=3, help="批处理重复次数（取最快一次）")
+    p_suite.add_argument("--video-dir", default=SUITE_VIDEO_DIR, help="合成视频缓存目录")
+    p_suite.add_argument("--json", help="结果保存路径")
+
+    p_compare = sub.add_parser("compare", help="比较两次 suite 结果")
+    p_compare.add_argument("old", help="旧结果 JSON")
+    p_compare.add_argument("new", help="新结果 JSON")
+    p_compare.add_argument("--tolerance", type=float, default=COMPARE_TOLERANCE,
+                           help="性能指标判定退化的相对变化")
+
+    p_startup = sub.add_parser("startup", help="冷启动时间（命令行、Web 应用、工作进程）")
+    p_startup.add_argument("--repeat", type=int, default=5, help="每个场景的运行次数（取中位数）")
+    p_startup.add_argument("--json", help="结果保存路径")
+
+    p_local = sub.add_parser("local", help="合成靶面上的本地圆圈检测")
+    p_local.add_argument("--sizes", default="1280x720,1920x1080,3840x2160", help="分辨率列表（逗号分隔）")
+    p_local.add_argument("--noise", default="0,2,6,12", help="像素噪声标准差列表（逗号分隔）")
+    p_local.add_argument("--json", help="结果保存路径")
+
+    args = parser.parse_args()
+
+    if args.command == "local":
+        sizes = [tuple(int(v) for v in size.lower().split('x')) for size in args.sizes.split(',')]
+        noises = [float(v) for v in args.noise.split(',')]
+        print("=" * 60)
+        print("本地圆圈检测（合成靶面）")
+        print("=" * 60)
+        results = benchmark_local_detection(sizes, noises)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            print(f"\n结果已保存: {args.json}")
+        sys.exit(0 if all(r['ok'] for r in results) else 1)
+
+    if args.command == "startup":
+        print("=" * 60)
+        print("冷启动时间")
+        print("=" * 60)
+        results = benchmark_startup(args.repeat)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            print(f"\n结果已保存: {args.json}")
+        sys.exit(0 if all(r['ok'] for r in results) else 1)
+
+    if args.command == "compare":
+        with open(args.old, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.new, 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        print("=" * 60)
+        print(f"基准比较: {old.get('commit')} → {new.get('commit')}")
+        print("=" * 60)
+        regressions = compare_results(old, new, args.tolerance)
+        print("-" * 60)
+        print(f"退化: {len(regressions)} 项")
+        sys.exit(1 if regressions else 0)
+
+    if args.command == "suite":
+        overrides = {k: v for k, v in (('duration', args.duration), ('seed', args.seed)) if v is not None}
+        scenarios = {}
+        for name in args.scenarios.split(','):
+            if name not in SUITE_SCENARIOS:
+                parser.error(f"未知场景: {name}")
+            scenarios[name] = {**SUITE_SCENARIOS[name], **overrides}
+        print("=" * 60)
+        print("合成视频基准测试")
+        print("=" * 60)
+        print(f"场景: {', '.join(scenarios)}")
+        print("-" * 60)
+        results = benchmark_suite(scenarios, args.video_dir, repeat=args.repeat)
+
+    elif args.command == "peaks":
+        print("=" * 60)
+        print("击中识别耗时")
+        print("=" * 60)
+        print(f"序列长度: {args.frames} 帧")
+        print("-" * 60)
+        results = benchmark_peaks(args.frames, args.repeat)
+    else:
+        roi = resolve_roi(args)
+
+    if args.command == "decode":
+        print("=" * 60)
+        print("解码后端吞吐量")
+        print("=" * 60)
+        print(f"视频: {args.video}")
+        print(f"幕布区域: {roi}")
+        print("-" * 60)
+        results = benchmark_decode(args.video, roi, args.frames)
+
+    elif args.command == "kernel":
+        resolution = WorkResolution.for_video(args.video)
+        regions = None
+        if args.circles:
+            with open(args.circles, 'r') as f:
+                regions = MotionRegions(json.load(f), roi, resolution)
+        print("=" * 60)
+        print("逐帧运动量计算")
+        print("=" * 60)
+        print(f"视频: {args.video}")
+        print(f"幕布区域: {roi}  工作分辨率: {resolution.describe()}")
+        print(f"分区域运动量: {'是' if regions is not None else '否'}")
+        print("-" * 60)
+        results = benchmark_kernel(args.video, roi, args.frames, args.repeat, regions, resolution)
+
+    elif args.command == "adaptive":
+        resolution = WorkResolution.for_video(args.video)
+        regions = None
+        if args.circles:
+            with open(args.circles, 'r') as f:
+                regions = MotionRegions(json.load(f), roi, resolution)
+        print("=" * 60)
+        print("自适应跳帧")
+        print("=" * 60)
+        print(f"视频: {args.video}")
+        print(f"幕布区域: {roi}  工作分辨率: {resolution.describe()}")
+        print("-" * 60)
+        results = benchmark_adaptive(args.video, roi, args.repeat, regions, resolution)
+
+    elif args.command == "parallel":
+        if args.workers:
+            worker_counts = [int(v) for v in args.workers.split(',')]
+        else:
+            cpus = os.cpu_count() or 1
+            worker_counts = [1]
+            while worker_counts[-1] * 2 <= cpus:
+                worker_counts.append(worker_counts[-1] * 2)
+
+        print("=" * 60)
+        print("并行分段运动检测")
+        print("=" * 60)
+        print(f"视频: {args.video}")
+        print(f"CPU 核数: {os.cpu_count()}")
+        print("-" * 60)
+        results = benchmark_parallel(args.video, roi, worker_counts)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+圆圈标定缓存 - 按场景指纹复用 Gemini 检测结果
+
+摄像机和靶布很少移动，同一场景的圆圈位置不变。
+对 preprocess_image 的裁剪图计算感知哈希（DCT pHash），
+命中缓存（汉明距离不超过漂移阈值）时直接返回之前的检测结果，
+只有未命中或画面漂移过大时才调用 Gemini。
+
+缓存持久化为 JSON 文件，按 LRU 淘汰，并记录命中 / 未命中次数。
+多个进程共用同一文件时，读取前按修改时间重新加载；写入（store）在整个文件的文件锁内
+重新读取 → 修改 → 原子替换，不会覆盖其它进程的条目。查找只读文件，最近使用时间和
+命中统计先记在内存中，每 CALIBRATION_FLUSH_EVERY 次查找或进程退出时批量写入。
+未命中时用 claim 对同一分辨率的标定加锁（文件锁，多进程有效），同一场景的视频同时上传时
+只有第一个任务调用检测，其余任务等待后命中缓存。
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows：只在进程内互斥
+    fcntl = None
+
+import cv2
+import numpy as np
+
+CALIBRATION_CACHE_SIZE = 32  # 最多缓存的场景数
+CALIBRATION_MAX_DRIFT = 8  # 允许的指纹汉明距离（63 位中），超过视为场景变化
+CALIBRATION_FLUSH_EVERY = 16  # 累计多少次查找后把使用时间和命中统计写入文件
+
+
+def scene_fingerprint(image):
+    """
+    计算场景指纹：32x32 灰度图的 DCT 低频 8x8 系数与中位数比较得到 63 位哈希
+    返回：16 位十六进制字符串
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()[1:]  # 去掉直流分量（亮度）
+    bits = low > np.median(low)
+
+    value = 0
+    for b in bits:
+        value = (value << 1) | int(b)
+    return f"{value:016x}"
+
+
+def fingerprint_distance(a, b):
+    """两个指纹的汉明距离"""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+class CalibrationCache:
+    """
+    场景指纹 → 圆圈检测结果（裁剪图坐标）的 LRU 缓存
+
+    Args:
+        path: 持久化文件路径，None 表示只在内存中缓存
+        capacity: 最多缓存的场景数
+        max_drift: 命中所允许的最大汉明距离
+    """
+
+    def __init__(self, path=None, capacity=CALIBRATION_CACHE_SIZE, max_drift=CALIBRATION_MAX_DRIFT):
+        self.path = path
+        self.capacity = capacity
+        self.max_drift = max_drift
+        self.entries = []  # 文件中的场景（淘汰按 used，最近使用时间）
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}  # 文件中的统计
+        self._pending = {'hits': 0, 'misses': 0}  # 尚未写入文件的命中 / 未命中次数
+        self._touched = {}  # (指纹, 尺寸) → 尚未写入文件的最近使用时间
+        self._stamp = None  # 已加载文件的 (修改时间, 大小)
+        self._guard = threading.RLock()  # 进程内：内存状态
+        self._locks = {}  # 分辨率 → 进程内的锁
+        self._locks_guard = threading.Lock()
+        if path:
+            atexit.register(self.flush)
+        with self._guard:
+            self._load()
+
+    @staticmethod
+    def _key(entry):
+        return entry['fingerprint'], tuple(entry['size']) if entry.get('size') else None
+
+    def _load(self):
+        """文件有变化时重新加载（调用方持有 _guard）"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.entries = data.get('entries', [])
+        self.stats.update(data.get('stats', {}))
+        self._stamp = stamp
+
+    @contextmanager
+    def _file_lock(self):
+        """整个文件的 读取 → 修改 → 写入 加锁（文件锁，多进程有效）"""
+        with self._guard:
+            if not self.path or fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(f"{self.path}.lock", 'w') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _merge(self):
+        """把内存中的使用时间和统计合并到 entries / stats（调用方持有 _file_lock，且已 _load）"""
+        for entry in self.entries:
+            used = self._touched.get(self._key(entry))
+            if used is not None and used > entry.get('used', 0):
+                entry['used'] = used
+        for name, count in self._pending.items():
+            self.stats[name] += count
+        self._touched.clear()
+        self._pending = {'hits': 0, 'misses': 0}
+
+    def _save(self):
+        """合并后写入文件（原子替换）"""
+        self._merge()
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'entries': self.entries, 'stats': self.stats}, f, indent=2)
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._stamp = (st.st_mtime_ns, st.st_size)
+
+    def flush(self):
+        """把内存中的使用时间和命中统计写入文件（累计 CALIBRATION_FLUSH_EVERY 次查找或退出时自动调用）"""
+        with self._file_lock():
+            if not self._touched and not any(self._pending.values()):
+                return
+            self._load()
+            self._save()
+
+    def lookup(self, fingerprint, size=None, record=True):
+        """
+        查找与指纹最接近的场景（只读文件；最近使用时间和命中统计先记在内存中，批量写入）
+        size: 原图尺寸 [w, h]，只匹配相同分辨率的场景
+        record: 是否计入命中 / 未命中次数（claim 之后的再次查找不重复计数）
+        返回：缓存的圆圈列表，未命中返回 None
+        """
+        with self._guard:
+            self._load()
+            best, best_dist = None, None
+            for entry in self.entries:
+                if size is not None and entry.get('size') != list(size):
+                    continue
+                dist = fingerprint_distance(fingerprint, entry['fingerprint'])
+                if dist <= self.max_drift and (best_dist is None or dist < best_dist):
+                    best, best_dist = entry, dist
+
+            if record:
+                self._pending['misses' if best is None else 'hits'] += 1
+            if best is not None:
+                self._touched[self._key(best)] = time.time()
+            pending = sum(self._pending.values()) + len(self._touched)
+        if pending >= CALIBRATION_FLUSH_EVERY:
+            self.flush()
+        return best['circles'] if best is not None else None
+
+    @contextmanager
+    def claim(self, size=None):
+        """
+        对同一分辨率的标定加锁（持久化缓存使用文件锁，多进程有效）
+        持有锁后应再 lookup 一次：等待期间其它任务可能已经写入了同一场景
+        """
+        key = f"{size[0]}x{size[1]}" if size else "any"
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if not self.path or fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(f"{self.path}.{key}.lock", 'w') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def store(self, fingerprint, circles, size=None):
+        """保存场景的检测结果，超过容量时淘汰最久未使用的场景（加文件锁，重新读取后修改）"""
+        with self._file_lock():
+            self._stamp = None
+            self._load()
+            now = time.time()
+            key = (fingerprint, tuple(size) if size else None)
+            self.entries = [e for e in self.entries if self._key(e) != key]
+            self.entries.append({
+                'fingerprint': fingerprint,
+                'size': list(size) if size else None,
+                'circles': circles,
+                'created': now,
+                'used': now,
+            })
+            self._touched.pop(key, None)
+            self._merge()
+            while len(self.entries) > self.capacity:
+                self.entries.remove(min(self.entries, key=lambda e: e.get('used', e.get('created', 0))))
+                self.stats['evictions'] += 1
+            self._save()
+
+    def summary(self):
+        """缓存统计：场景数、命中 / 未命中 / 淘汰次数（含尚未写入文件的）、命中率"""
+        with self._guard:
+            self._load()
+            stats = dict(self.stats)
+            for name, count in self._pending.items():
+                stats[name] += count
+        total = stats['hits'] + stats['misses']
+        return {
+            'entries': len(self.entries),
+            'capacity': self.capacity,
+            **stats,
+            'hit_rate': stats['hits'] / total if total else 0.0,
+        }
+
+
+class StubDetector:
+    """
+    本地桩检测器：返回固定的圆圈结果并记录调用次数
+    用于在测试或离线环境中代替 detect_with_gemini
+
+        detect_circles(image_path, detector=StubDetector(circles))
+    """
+
+    def __init__(self, circles):
+        self.circles = circles
+        self.calls = 0
+
+    def __call__(self, image):
+        self.calls += 1
+        return [dict(c) for c in self.circles]
@@ -2,54 +2,83 @@
 """
 得分圆圈检测 - 最终方案
 两阶段检测：Gemini 粗定位 + 固定半径
+快速路径：本地 HoughCircles 检测，置信度足够时不调用 Gemini
+Gemini 等圆圈定位后端在 CALIBRATION_BACKENDS 中注册，第一次使用时才导入
 
 使用方法：
     python detect_circles_final.py <图片路径>
     python detect_circles_final.py  # 使用默认视频第一帧
 """
-import base64
+import contextlib
+import importlib
 import json
 import cv2
-import re
+import numpy as np
 import sys
 import os
-from google import genai
-from google.genai import types
+
+from calibration_cache import scene_fingerprint
+from instrumentation import stage, timed
+from frame_source import open_frame_source
+from resolution import REFERENCE_WIDTH
 
 # 配置
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("请设置环境变量 GEMINI_API_KEY，获取地址: https://aistudio.google.com/apikey")
 OUTPUT_DIR = "/Users/tgg_ai_studio/Desktop/tennis_score/output"
 
-# 半径配置（原图坐标系，1920x1080）
+# 半径配置（参考分辨率 1920x1080 下的像素，按原图宽度换算）
 RADIUS_CONFIG = {
     10: 27,  # 10分圆圈最大
     20: 20,  # 20分圆圈居中
     30: 15,  # 30分圆圈最小
 }
 
+# 本地检测参数
+EXPECTED_CIRCLES = {10: 2, 20: 2, 30: 2}  # 每种分值的圆圈数量
+LOCAL_RADIUS_TOLERANCE = 0.25  # 半径相对误差上限
+LOCAL_MIN_CONFIDENCE = 0.6  # 低于该置信度时改用 Gemini
+LOCAL_EDGE_MARGIN = 3  # 轮廓支持度在标准半径内外搜索的范围（参考分辨率下的像素，不小于圆圈线宽的一半）
+# 圆圈定位后端：名称 → (模块, 单图函数, 多图函数或 None)，第一次使用时才导入
+# （Gemini SDK 导入较慢，且只在需要时才要求安装）
+CALIBRATION_BACKENDS = {
+    'gemini': ('gemini_detector', 'detect_with_gemini', 'detect_many_with_gemini'),
+}
+CALIBRATION_BACKEND = os.environ.get("CALIBRATION_BACKEND", "gemini")  # 本地检测置信度不足时使用的后端
+_detectors = {}  # 已导入的后端
+
+PREPROCESS_SCALE = 2  # 参考分辨率下幕布区域的放大倍数（更宽的视频相应减小，裁剪图不超过参考分辨率的大小）
 
+
+def curtain_crop_box(w, h):
+    """
+    根据图片尺寸计算固定的幕布裁剪区域 (x1, y1, x2, y2)
+    幕布大概在画面中上部，占画面的 30%-70% 宽度，15%-50% 高度
+    """
+    return int(w * 0.29), int(h * 0.26), int(w * 0.68), int(h * 0.46)
+
+
+@timed('preprocess_image')
 def preprocess_image(image_path):
     """
     预处理：裁剪幕布区域 + 放大
+    放大倍数为 PREPROCESS_SCALE，宽于参考分辨率的视频按比例减小（4K 不放大），
+    因此 4K 的裁剪图与 1080p 的大小相同
     返回: (处理后的图片, 裁剪信息)
     """
     img = cv2.imread(image_path)
     h, w = img.shape[:2]
 
     # 根据图片尺寸动态计算幕布区域
-    # 幕布大概在画面中上部，占画面的 30%-70% 宽度，15%-50% 高度
-    x1 = int(w * 0.29)
-    y1 = int(h * 0.26)
-    x2 = int(w * 0.68)
-    y2 = int(h * 0.46)
+    x1, y1, x2, y2 = curtain_crop_box(w, h)
 
     curtain = img[y1:y2, x1:x2]
 
-    # 放大 2 倍提高识别精度
-    scale = 2
-    enlarged = cv2.resize(curtain, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    # 放大提高识别精度
+    scale = min(PREPROCESS_SCALE, PREPROCESS_SCALE * REFERENCE_WIDTH / w)
+    if scale == 1:
+        enlarged = curtain.copy()
+    else:
+        enlarged = cv2.resize(curtain, None, fx=scale, fy=scale,
+                              interpolation=cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA)
 
     crop_info = {
         'crop': {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2},
@@ -60,83 +89,141 @@ def preprocess_image(image_path):
     return enlarged, crop_info
 
 
+def get_detector(name=CALIBRATION_BACKEND, batch=False):
+    """
+    取得圆圈定位后端（第一次使用时导入对应模块）
+    返回：detector(裁剪图) → [{'score', 'center'}, ...]（裁剪图坐标）
+          batch=True 时为 detector([裁剪图, ...]) → [圆圈列表或 None, ...]
+          （后端不支持多图请求时逐张检测）
+    """
+    if name not in _detectors:
+        if name not in CALIBRATION_BACKENDS:
+            raise ValueError(f"未知的圆圈定位后端: {name}，可选: {', '.join(CALIBRATION_BACKENDS)}")
+        module_name, attr, batch_attr = CALIBRATION_BACKENDS[name]
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            raise ImportError(f"圆圈定位后端 {name} 不可用（{e}），请安装依赖或使用标定缓存") from e
+        single = getattr(module, attr)
+        many = getattr(module, batch_attr) if batch_attr else (lambda images: [single(i) for i in images])
+        _detectors[name] = (single, many)
+    return _detectors[name][1 if batch else 0]
+
+
 def detect_with_gemini(image):
     """
-    阶段1：使用 Gemini 检测圆圈位置
+    阶段1：使用 Gemini 检测圆圈位置（见 gemini_detector.py）
     返回: 圆圈列表 [{'score': 10, 'center': [x, y]}, ...]
     """
-    # 编码图片
-    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
-    image_data = base64.standard_b64encode(buffer).decode('utf-8')
-
-    h, w = image.shape[:2]
-
-    # 调用 Gemini
-    client = genai.Client(api_key=GEMINI_API_KEY)
-
-    prompt = """帮我标出图上 10 分 30 分 20 分的6个得分圆圈
-
-返回JSON格式:
-[{"box_2d": [y1, x1, y2, x2], "label": "10"}, ...]
-坐标使用0-1000归一化值"""
-
-    contents = [
-        types.Content(
-            role="user",
-            parts=[
-                types.Part.from_bytes(
-                    data=base64.standard_b64decode(image_data),
-                    mime_type="image/jpeg"
-                ),
-                types.Part.from_text(text=prompt),
-            ],
-        ),
-    ]
-
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=contents,
-        config=types.GenerateContentConfig(temperature=0.1),
-    )
+    return get_detector('gemini')(image)
 
-    # 解析响应
-    json_match = re.search(r'\[[\s\S]*\]', response.text)
-    if not json_match:
-        raise ValueError(f"无法解析 Gemini 响应: {response.text[:200]}")
 
-    boxes = json.loads(json_match.group())
+_RING_ANGLES = np.linspace(0, 2 * np.pi, 64, endpoint=False)
 
-    # 转换坐标
-    scale_x = w / 1000
-    scale_y = h / 1000
 
-    circles = []
-    for box in boxes:
-        y1, x1, y2, x2 = box['box_2d']
-        label = str(box.get('label', '10'))
+def _ring_values(image, cx, cy, r):
+    """圆周上的采样值；cx / cy 可以是数组（一次采样多个圆心），返回 (圆心数, 采样点数)"""
+    h, w = image.shape
+    cx = np.atleast_1d(cx)[:, None]
+    cy = np.atleast_1d(cy)[:, None]
+    xs = np.clip(np.round(cx + r * np.cos(_RING_ANGLES)).astype(int), 0, w - 1)
+    ys = np.clip(np.round(cy + r * np.sin(_RING_ANGLES)).astype(int), 0, h - 1)
+    return image[ys, xs].astype(np.float32)
+
+
+def _ring_contrast(gray, cx, cy, r):
+    """圆周与内外两侧背景的灰度差（半径正好落在圆圈线条上时最大）"""
+    d = max(2.0, r * 0.2)
+    ring = _ring_values(gray, cx, cy, r).mean(axis=1)
+    inner = _ring_values(gray, cx, cy, r - d).mean(axis=1)
+    outer = _ring_values(gray, cx, cy, r + d).mean(axis=1)
+    return np.abs(ring - (inner + outer) / 2)
 
-        # 计算中心点（像素坐标）
-        cx = int((x1 + x2) / 2 * scale_x)
-        cy = int((y1 + y2) / 2 * scale_y)
 
-        # 提取分数
-        score_match = re.search(r'\d+', label)
-        score = int(score_match.group()) if score_match else 10
+def _edge_support(edges, cx, cy, r, margin=3, shift=0):
+    """
+    半径 r 附近圆周上落在边缘上的采样点比例（圆圈轮廓越清晰越接近 1）
+    shift: 圆心在 ±shift 像素内取支持度最高的位置（噪声下圆心估计有 1~2px 误差）
+    """
+    dx, dy = [v.ravel() for v in np.mgrid[-shift:shift + 1, -shift:shift + 1]]
+    return max(float(np.max(np.mean(_ring_values(edges, cx + dx, cy + dy, r + dr) > 0, axis=1)))
+               for dr in range(-margin, margin + 1))
+
+
+def detect_with_opencv(image, crop_info):
+    """
+    本地快速检测：在预处理后的裁剪图上用 HoughCircles 找圆心，按半径判断分值
+    半径按 RADIUS_CONFIG（参考分辨率）换算到裁剪图坐标系
 
+    返回: (圆圈列表 [{'score': 10, 'center': [x, y], 'radius': r}, ...], 置信度 0~1)
+    置信度 = 找到的圆圈比例 × 最弱圆圈的轮廓支持度
+    """
+    scale = crop_info['scale'] * crop_info['original_size'][0] / REFERENCE_WIDTH
+    expected = {score: r * scale for score, r in RADIUS_CONFIG.items()}
+    # 裁剪图放大后圆圈线条也变宽（1080p 放大 2 倍时约 10px），轮廓的内外边缘离标准半径超过 3px
+    margin = max(3, int(round(LOCAL_EDGE_MARGIN * scale)))
+    min_r = min(expected.values())
+    max_r = max(expected.values())
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = cv2.medianBlur(gray, 5)
+    found = cv2.HoughCircles(
+        gray, cv2.HOUGH_GRADIENT, dp=1, minDist=min_r * 2,
+        param1=100, param2=25,
+        minRadius=int(min_r * (1 - LOCAL_RADIUS_TOLERANCE)),
+        maxRadius=int(np.ceil(max_r * (1 + LOCAL_RADIUS_TOLERANCE)))
+    )
+    if found is None:
+        return [], 0.0
+
+    edges = cv2.dilate(cv2.Canny(gray, 50, 150), None)
+
+    # HoughCircles 的半径误差较大：对每个圆心（在 ±3px 内微调）比较各分值
+    # 标准半径处的圆周对比度，取对比度最高的分值与圆心，
+    # 再用该半径处的轮廓支持度作为这个圆圈的置信度。
+    # 线条宽于微调范围时对比度在一片圆心上都接近最大值，取这片圆心的中心（而不是第一个最大值）
+    dx, dy = [v.ravel() for v in np.mgrid[-3:4, -3:4]]
+    candidates = []
+    for x0, y0, _ in found[0]:
+        xs, ys = x0 + dx, y0 + dy
+        best = None
+        for s, r in expected.items():
+            contrast = _ring_contrast(gray, xs, ys, r)
+            peak = contrast.max()
+            if best is None or peak > best[0]:
+                near = contrast >= peak * 0.98
+                best = (peak, s, xs[near].mean(), ys[near].mean())
+        _, score, x, y = best
+        r = expected[score]
+        candidates.append((_edge_support(edges, x, y, r, margin, shift=2), score, x, y, r))
+
+    # 每种分值保留轮廓支持度最高的几个
+    circles = []
+    supports = []
+    counts = {score: 0 for score in EXPECTED_CIRCLES}
+    for support, score, x, y, r in sorted(candidates, key=lambda c: -c[0]):
+        if counts.get(score, 0) >= EXPECTED_CIRCLES.get(score, 0):
+            continue
+        counts[score] += 1
+        supports.append(support)
         circles.append({
             'score': score,
-            'center': [cx, cy]
+            'center': [int(round(x)), int(round(y))],
+            'radius': int(round(r))
         })
 
-    return circles
+    total = sum(EXPECTED_CIRCLES.values())
+    confidence = len(circles) / total * min(supports) if supports else 0.0
+    return circles, confidence
 
 
 def convert_to_original_coords(circles, crop_info):
     """
-    将裁剪图坐标转换回原图坐标，并添加固定半径
+    将裁剪图坐标转换回原图坐标，并添加固定半径（RADIUS_CONFIG 按原图宽度换算）
     """
     crop = crop_info['crop']
     scale = crop_info['scale']
+    radius_scale = crop_info['original_size'][0] / REFERENCE_WIDTH
 
     result = []
     for c in circles:
@@ -148,7 +235,7 @@ def convert_to_original_coords(circles, crop_info):
         orig_cy = int(cy / scale + crop['y1'])
 
         # 使用固定半径
-        radius = RADIUS_CONFIG.get(score, 20)
+        radius = int(round(RADIUS_CONFIG.get(score, 20) * radius_scale))
 
         result.append({
             'score': score,
@@ -159,10 +246,8 @@ def convert_to_original_coords(circles, crop_info):
     return result
 
 
-def draw_results(image_path, circles, output_path):
-    """绘制检测结果"""
-    img = cv2.imread(image_path)
-
+def annotate_circles(img, circles):
+    """在图片上画出圆圈和分值（原地修改并返回）"""
     colors = {
         10: (0, 255, 0),    # 绿色
         20: (0, 255, 255),  # 黄色
@@ -180,18 +265,77 @@ def draw_results(image_path, circles, output_path):
         cv2.putText(img, f"{score}pts r={radius}",
                     (cx - 40, cy - radius - 10),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return img
+
 
-    cv2.imwrite(output_path, img)
+def draw_results(image_path, circles, output_path):
+    """绘制检测结果"""
+    img = annotate_circles(cv2.imread(image_path), circles)
+
+    with stage('imwrite') as s:
+        cv2.imwrite(output_path, img)
+        s.add_file(output_path)
     return output_path
 
 
-def detect_circles(image_path, output_dir=None):
+def detect_local(preprocessed, crop_info):
+    """本地检测，找到全部圆圈且置信度足够时返回圆圈列表（裁剪图坐标），否则返回 None"""
+    with stage('detect_with_opencv'):
+        found, confidence = detect_with_opencv(preprocessed, crop_info)
+    print(f"    本地检测: {len(found)} 个圆圈, 置信度 {confidence:.2f}")
+    if len(found) == sum(EXPECTED_CIRCLES.values()) and confidence >= LOCAL_MIN_CONFIDENCE:
+        return found
+    return None
+
+
+def calibrate_scenes(image_paths, cache, use_local=True, backend=CALIBRATION_BACKEND):
+    """
+    批量标定：多个场景的第一帧一起定位圆圈，结果写入标定缓存（之后 detect_circles 命中缓存）
+    缓存未命中且本地检测失败的裁剪图打包成多图请求，一次调用定位多个场景
+
+    Returns:
+        写入或已在缓存中的图片数
+    """
+    pending = []
+    calibrated = 0
+    for image_path in image_paths:
+        preprocessed, crop_info = preprocess_image(image_path)
+        fingerprint = scene_fingerprint(preprocessed)
+        size = crop_info['original_size']
+        if cache.lookup(fingerprint, size, record=False) is not None:
+            calibrated += 1
+            continue
+        circles_local = detect_local(preprocessed, crop_info) if use_local else None
+        if circles_local is not None:
+            cache.store(fingerprint, circles_local, size)
+            calibrated += 1
+        else:
+            pending.append((preprocessed, fingerprint, size))
+
+    if pending:
+        print(f"    多图请求定位 {len(pending)} 个场景...")
+        with stage('detect_with_gemini'):
+            results = get_detector(backend, batch=True)([p[0] for p in pending])
+        for (_, fingerprint, size), circles_local in zip(pending, results):
+            if circles_local and len(circles_local) == sum(EXPECTED_CIRCLES.values()):
+                cache.store(fingerprint, circles_local, size)
+                calibrated += 1
+    return calibrated
+
+
+def detect_circles(image_path, output_dir=None, cache=None, detector=None, use_local=True,
+                   render_images=True):
     """
     主函数：检测得分圆圈
 
     Args:
         image_path: 输入图片路径
         output_dir: 输出目录，默认为 OUTPUT_DIR
+        cache: CalibrationCache，场景未变化时复用之前的检测结果
+        detector: 裁剪图上的圆圈检测函数，默认为 CALIBRATION_BACKEND 对应的后端（第一次使用时导入）
+        use_local: 是否先尝试本地 HoughCircles 检测（置信度不足时再调用 detector）
+        render_images: 是否写入 preprocessed.jpg 和 detected_circles_final.jpg
+                       （False 时由 render_cache 按需渲染）
 
     Returns:
         circles: 检测到的圆圈列表
@@ -202,7 +346,7 @@ def detect_circles(image_path, output_dir=None):
     os.makedirs(output_dir, exist_ok=True)
 
     print("=" * 50)
-    print("得分圆圈检测 - Gemini 粗定位 + 固定半径")
+    print("得分圆圈检测 - 本地检测 / Gemini 粗定位 + 固定半径")
     print("=" * 50)
 
     # Step 1: 预处理
@@ -212,12 +356,41 @@ def detect_circles(image_path, output_dir=None):
     print(f"    放大倍数: {crop_info['scale']}x")
 
     # 保存预处理图片（调试用）
-    preprocessed_path = os.path.join(output_dir, "preprocessed.jpg")
-    cv2.imwrite(preprocessed_path, preprocessed)
-
-    # Step 2: Gemini 检测
-    print("\n[2] Gemini 粗定位...")
-    circles_local = detect_with_gemini(preprocessed)
+    if render_images:
+        preprocessed_path = os.path.join(output_dir, "preprocessed.jpg")
+        with stage('imwrite') as s:
+            cv2.imwrite(preprocessed_path, preprocessed)
+            s.add_file(preprocessed_path)
+
+    # Step 2: 定位圆圈（缓存 → 本地检测 → Gemini）
+    print("\n[2] 圆圈定位...")
+    circles_local = None
+    size = crop_info['original_size']
+    if cache is not None:
+        fingerprint = scene_fingerprint(preprocessed)
+        circles_local = cache.lookup(fingerprint, size)
+        if circles_local is not None:
+            print(f"    命中标定缓存 (指纹 {fingerprint})")
+
+    if circles_local is None:
+        # 同一分辨率的标定互斥：同一场景的视频同时上传时只有第一个任务检测，其余等待后命中缓存
+        with cache.claim(size) if cache is not None else contextlib.nullcontext():
+            if cache is not None:
+                circles_local = cache.lookup(fingerprint, size, record=False)
+                if circles_local is not None:
+                    print(f"    等待其它任务标定完成，命中标定缓存 (指纹 {fingerprint})")
+
+            if circles_local is None and use_local:
+                circles_local = detect_local(preprocessed, crop_info)
+
+            if circles_local is None:
+                print("    Gemini 粗定位...")
+                with stage('detect_with_gemini'):
+                    circles_local = (detector or get_detector())(preprocessed)
+
+            # 只缓存完整的结果（与 calibrate_scenes 相同），否则同一场景之后都会复用不完整的标定
+            if cache is not None and len(circles_local) == sum(EXPECTED_CIRCLES.values()):
+                cache.store(fingerprint, circles_local, size)
     print(f"    检测到 {len(circles_local)} 个圆圈")
 
     # Step 3: 坐标转换 + 固定半径
@@ -231,9 +404,10 @@ def detect_circles(image_path, output_dir=None):
     print("\n[4] 保存结果...")
 
     # 可视化
-    output_img_path = os.path.join(output_dir, "detected_circles_final.jpg")
-    draw_results(image_path, circles, output_img_path)
-    print(f"    结果图: {output_img_path}")
+    if render_images:
+        output_img_path = os.path.join(output_dir, "detected_circles_final.jpg")
+        draw_results(image_path, circles, output_img_path)
+        print(f"    结果图: {output_img_path}")
 
     # 配置文件
     config_path = os.path.join(output_dir, "circles_config.json")
@@ -248,15 +422,17 @@ def detect_circles(image_path, output_dir=None):
     return circles
 
 
-def extract_first_frame(video_path, output_path):
+def extract_first_frame(video_path, output_path, backend='opencv'):
     """从视频提取第一帧"""
-    cap = cv2.VideoCapture(video_path)
-    ret, frame = cap.read()
-    cap.release()
-
-    if ret:
-        cv2.imwrite(output_path, frame)
-        return output_path
+    with stage('extract_first_frame') as s:
+        with open_frame_source(video_path, backend) as source:
+            frame = next((f for _, f in source), None)
+
+        if frame is not None:
+            cv2.imwrite(output_path, frame)
+            s.frames = 1
+            s.add_file(output_path)
+            return output_path
     return None
 
 
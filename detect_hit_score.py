@@ -4,9 +4,9 @@
 网球击中检测与计分算法
 
 算法逻辑：
-1. 帧差法检测幕布区域的运动量
-2. 找到运动量超过阈值的帧 = 击中瞬间
-3. 在击中帧用颜色检测找球位置
+1. 帧差法检测幕布区域的运动量（同时用积分图求出每个圆圈和边缘带的运动量，见 region_motion.py）
+2. 找到运动量超过阈值的帧 = 击中瞬间，按各区域运动量定位击中的圆圈
+3. 在击中帧用颜色检测找球位置（找到时按球位置精确判定，找不到时按运动定位的圆圈计分）
 4. 判断球是否在得分圈内
 5. 冷却时间防止重复计分
 
@@ -19,20 +19,44 @@ import numpy as np
 import json
 import sys
 import os
+import heapq
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from frame_source import open_frame_source, read_frames
+from motion_cache import MOTION_CACHE_MAX_CROPS
+from score_map import SCORE_POLICY, score_map_for
+from instrumentation import record, stage, timed
+from region_motion import MotionRegions
+from resolution import WorkResolution, REFERENCE_WIDTH, WORK_WIDTH, MOTION_BLUR_KSIZE
 
 # 默认配置
 DEFAULT_VIDEO = "/Users/tgg_ai_studio/Desktop/tennis_score/hit.mov"
 OUTPUT_DIR = "/Users/tgg_ai_studio/Desktop/tennis_score/output"
 CIRCLES_CONFIG = "/Users/tgg_ai_studio/Desktop/tennis_score/output/circles_config.json"
 
-# 检测参数
+# 检测参数（像素值均为参考分辨率 1920 宽度下的值，按视频分辨率换算，见 resolution.py）
 COOLDOWN_SEC = 1.5  # 冷却时间（秒）- 防止同一次击中被多次计分
 MOTION_THRESHOLD_FACTOR = 1.5  # 运动阈值 = 平均 + N倍标准差（降低以检测更多击中）
 HIT_TOLERANCE = 15  # 击中判定容差（像素）
+MOTION_FALLBACK = True  # 颜色检测找不到球时，按区域运动量定位的圆圈计分（见 score_hit）
+STREAM_MAX_CANDIDATES = 16  # 流式模式下最多缓存的候选帧数（内存上限）
+WARMUP_SEC = 0.5  # 跳过开头的时间（避免摄像机初始化误检）
+EWMA_ALPHA = 0.02  # 在线检测 EWMA 基线的平滑系数
+SEGMENT_OVERLAP_FRAMES = 3  # 并行分段时相邻分段重叠的帧数（用于衔接与校验）
+PIPELINE_BUFFER_FRAMES = 600  # 流水线模式下等待标定期间最多缓存的幕布灰度帧数（1080p 约 180MB）
+PIPELINE_CROP_MARGIN = 64  # 流水线模式下固定裁剪区域向外扩展的像素
+ADAPTIVE_SCAN_SEC = 0.1  # 自适应跳帧：空闲时每隔该时间完整读取一帧（30fps 时每 3 帧）
+ADAPTIVE_HOLD_SEC = 0.5  # 自适应跳帧：运动回落后继续逐帧处理的时间（开头同样逐帧处理以建立基线）
+ADAPTIVE_RISE_FACTOR = 4.0  # 自适应跳帧：运动量超过安静基线 中位数 + N倍离散度 时切换到逐帧处理
+ADAPTIVE_BASELINE_SEC = 2.0  # 自适应跳帧：安静基线取最近多长时间的安静帧
 
 # 球颜色范围 (HSV)
 BALL_COLOR_LOWER = np.array([20, 80, 80])
 BALL_COLOR_UPPER = np.array([45, 255, 255])
+BALL_MIN_AREA = 30  # 球轮廓面积范围（平方像素）
+BALL_MAX_AREA = 2000
 
 
 def get_curtain_roi(circles_config, margin=20):
@@ -53,96 +77,820 @@ def get_curtain_roi(circles_config, margin=20):
     return (int(x1), int(y1), int(x2), int(y2))
 
 
-def detect_motion(video_path, curtain_roi):
+class MotionKernel:
+    """
+    逐帧运动量计算：灰度 → 缩小到工作分辨率 → 模糊 → 帧差 → 求和
+
+    每一步都用 dst= 写入预分配的缓冲（第一帧或输入尺寸变化时分配），前后两帧的模糊图
+    交替使用两块缓冲（ping-pong），逐帧循环中不再新建整幅图像；
+    求和用 cv2.sumElems 直接在 uint8 帧差上整数累加（有区域时取积分图右下角）。
+    每帧新建的只有返回的各区域运动量（几十字节，保存在 frames_data 中）。
+
+    Args:
+        scale: 缩小到工作分辨率的比例
+        ksize: 帧差前的模糊核大小
+        regions: MotionRegions，传入时同时求出各区域运动量
+
+    使用方法：
+        kernel = MotionKernel(scale, ksize, regions)
+        for frame_idx, frame in source:
+            motion_score, region_sums = kernel(frame[cy1:cy2, cx1:cx2])   # 第一帧为 (0, None)
+    """
+
+    def __init__(self, scale=1.0, ksize=MOTION_BLUR_KSIZE, regions=None):
+        self.scale = scale
+        self.ksize = (ksize, ksize)
+        self.regions = regions
+        self.input_shape = None
+        self.primed = False  # prev 中是否已有上一帧
+
+    def _allocate(self, shape):
+        h, w = shape[:2]
+        self.input_shape = shape
+        self.gray = np.empty((h, w), np.uint8) if len(shape) == 3 else None
+        if self.scale != 1.0:
+            # 尺寸与 cv2.resize(fx=scale, fy=scale) 的输出一致
+            self.small = cv2.resize(np.empty((h, w), np.uint8), None, fx=self.scale, fy=self.scale,
+                                    interpolation=cv2.INTER_AREA)
+            h, w = self.small.shape
+        else:
+            self.small = None
+        self.prev = np.empty((h, w), np.uint8)
+        self.curr = np.empty((h, w), np.uint8)
+        self.diff = np.empty((h, w), np.uint8)
+        self.integral = self.regions.integral_buffer((h, w)) if self.regions is not None else None
+        self.primed = False
+
+    def reset(self):
+        """丢弃上一帧（下一帧的运动量记为 0）"""
+        self.primed = False
+
+    def blurred(self, previous=False):
+        """
+        最近一帧（previous=True 时为再前一帧）模糊后的幕布区域
+        返回缓冲本身，下一次调用时被覆盖，需要保留时复制
+        """
+        return self.curr if previous else self.prev
+
+    def __call__(self, curtain):
+        """
+        处理一帧幕布区域（BGR 或灰度，可以是原帧的切片视图）
+        返回：(运动量 int, 各区域运动量 或 None)，第一帧为 (0, None)
+        """
+        if curtain.shape != self.input_shape:
+            self._allocate(curtain.shape)
+
+        image = curtain
+        if self.gray is not None:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        if self.small is not None:
+            image = cv2.resize(image, None, dst=self.small, fx=self.scale, fy=self.scale,
+                               interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(image, self.ksize, 0, dst=self.curr)
+
+        result = (0, None)
+        if self.primed:
+            cv2.absdiff(self.prev, self.curr, dst=self.diff)
+            if self.regions is None:
+                result = (int(cv2.sumElems(self.diff)[0]), None)
+            else:
+                result = self.regions.sums(self.diff, self.integral)
+
+        self.prev, self.curr = self.curr, self.prev
+        self.primed = True
+        return result
+
+
+def _frame_entry(frame_idx, fps, motion_score, region_sums, regions):
+    """frames_data 的一项；有区域时附加 'regions'（第一帧为全 0）"""
+    entry = {'idx': frame_idx, 'time': frame_idx / fps, 'motion': motion_score}
+    if regions is not None:
+        entry['regions'] = region_sums if region_sums is not None else np.zeros(len(regions), np.int64)
+    return entry
+
+
+def detect_motion(video_path, curtain_roi, backend='opencv', scale=1.0, ksize=MOTION_BLUR_KSIZE,
+                  regions=None):
     """
     检测视频中幕布区域的运动
+    scale: 幕布区域缩小到工作分辨率的比例，ksize: 帧差前的模糊核大小
+    regions: MotionRegions，传入时每帧同时记录各区域运动量（'regions'）
     返回：每帧的运动量和帧数据
     """
     cx1, cy1, cx2, cy2 = curtain_roi
+    started = time.perf_counter()
 
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    source = open_frame_source(video_path, backend)
+    fps = source.fps
 
-    prev_curtain = None
+    kernel = MotionKernel(scale, ksize, regions)
     frames_data = []
+    decode_sec = diff_sec = 0.0
+
+    t0 = time.perf_counter()
+    for frame_idx, frame in source:
+        t1 = time.perf_counter()
+        decode_sec += t1 - t0
+
+        # 幕布区域的帧差
+        motion_score, region_sums = kernel(frame[cy1:cy2, cx1:cx2])
+
+        entry = _frame_entry(frame_idx, fps, motion_score, region_sums, regions)
+        entry['frame'] = frame.copy()
+        frames_data.append(entry)
+
+        t0 = time.perf_counter()
+        diff_sec += t0 - t1
+
+    source.close()
+    _record_motion(started, decode_sec, diff_sec, len(frames_data))
+    return frames_data, fps
+
+
+def _record_motion(started, decode_sec, diff_sec, frames, processed=None):
+    """
+    记录运动检测阶段的统计：整体耗时，以及逐帧累加的解码 / 帧差耗时
+    processed: 完整读取并计算帧差的帧数（自适应跳帧时少于 frames），默认为 frames
+    """
+    record('detect_motion.decode', decode_sec, frames)
+    record('detect_motion.diff', diff_sec, frames if processed is None else processed)
+    record('detect_motion', time.perf_counter() - started, frames, start=started)
+
+
+def _offer_candidate(candidates, idx, motion, frame, window, max_candidates):
+    """
+    向候选帧缓冲提交一帧（在线非极大值抑制）
+    同一冷却窗口内只保留运动量最大的帧，缓冲满时淘汰运动量最小的候选
+    """
+    nearby = [j for j in candidates if abs(j - idx) < window]
+    if any(candidates[j][0] >= motion for j in nearby):
+        return
+    for j in nearby:
+        del candidates[j]
+
+    if len(candidates) >= max_candidates:
+        weakest = min(candidates, key=lambda j: candidates[j][0])
+        if candidates[weakest][0] >= motion:
+            return
+        del candidates[weakest]
+
+    candidates[idx] = (motion, frame.copy())
+
 
-    frame_idx = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # 提取幕布区域
-        curtain = frame[cy1:cy2, cx1:cx2]
-        gray = cv2.cvtColor(curtain, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (5, 5), 0)
-
-        # 计算帧差
-        if prev_curtain is not None:
-            diff = cv2.absdiff(prev_curtain, gray)
-            motion_score = np.sum(diff)
+class AdaptiveScan:
+    """
+    自适应跳帧：空闲幕布只采样，运动附近逐帧处理
+
+    空闲时每 stride 帧完整读取一帧，其余帧只 grab()（OpenCVFrameSource.scan）；
+    采样帧与上一采样帧的帧差（跨 stride 帧）超过安静基线时，回到上一采样帧
+    （rewind_to，由调用方 rewind 后重新读取）逐帧处理，连续 hold 帧安静后回到采样。
+    击中前球的运动量很小，越过阈值的往往已是击中后的抖动，因此必须回退，
+    峰值帧才会被逐帧处理。
+
+    安静基线：最近的安静帧运动量的中位数 + rise_factor × 离散度（1.4826·MAD，加中位数的 1% 作为下限），
+    逐帧帧差和跨帧帧差（光照缓慢变化时偏大）各自统计；开头 hold 帧逐帧处理以建立基线。
+    逐帧处理的帧得到与全帧率处理完全相同的运动量；其它帧（只 grab 的帧和空闲时的采样帧）
+    由 fill 补上安静帧运动量的均值，并记下安静帧的标准差（'fill_std'）：
+    batch_threshold 把补上的帧按安静帧的方差计入，阈值的期望与全帧率处理相同。
+
+    Args:
+        fps: 视频帧率
+        scan_sec / hold_sec / rise_factor / baseline_sec: 见 ADAPTIVE_* 常量
+    """
+
+    def __init__(self, fps, scan_sec=ADAPTIVE_SCAN_SEC, hold_sec=ADAPTIVE_HOLD_SEC,
+                 rise_factor=ADAPTIVE_RISE_FACTOR, baseline_sec=ADAPTIVE_BASELINE_SEC):
+        self.stride = max(1, int(round(fps * scan_sec)))
+        self.hold = max(2, int(round(fps * hold_sec)))
+        self.rise_factor = rise_factor
+        size = max(self.hold, int(round(fps * baseline_sec)))
+        self.quiet = {True: deque(maxlen=size), False: deque(maxlen=size)}  # 逐帧 / 跨帧的安静运动量
+        self.dense_until = self.hold  # 逐帧处理到该帧（不含）
+        self.last = None  # 上一个完整读取的帧号
+        self.rewind_to = None  # 需要回退重新读取的帧号
+        self.quiet_total = np.zeros(3)  # 全部逐帧安静运动量的 个数 / 和 / 平方和（fill 使用）
+
+    def want(self, idx):
+        """是否完整读取第 idx 帧"""
+        return self.last is None or idx < self.dense_until or idx - self.last >= self.stride
+
+    def threshold(self, dense=True):
+        """逐帧（dense）或跨帧帧差切换到逐帧处理的阈值，安静帧不足时为 None"""
+        values = self.quiet[dense]
+        if not dense and len(values) < self.hold // 2:
+            values = self.quiet[True]  # 跨帧基线建立之前先用逐帧基线
+        if len(values) < self.hold // 2:
+            return None
+        values = np.fromiter(values, np.float64, len(values))
+        median = np.median(values)
+        spread = 1.4826 * np.median(np.abs(values - median)) + 0.01 * median
+        return median + self.rise_factor * spread
+
+    def update(self, idx, motion):
+        """
+        输入完整读取的一帧与上一个完整读取帧之间的运动量（回退后的第一帧没有上一帧）
+        返回：是否为逐帧的运动量（与全帧率处理相同）；需要回退时 rewind_to 为回退到的帧号
+        """
+        previous = self.last
+        dense = previous is not None and idx - previous == 1
+        self.last = idx
+        self.rewind_to = None
+        if previous is None:
+            return False
+
+        threshold = self.threshold(dense)
+        if threshold is None or motion <= threshold:
+            self.quiet[dense].append(motion)
+            if dense:
+                self.quiet_total += (1, motion, float(motion) ** 2)
+        else:
+            self.dense_until = idx + 1 + self.hold
+            if not dense:
+                # 跨帧的帧差越过阈值：回到上一个完整读取的帧，逐帧处理中间的帧
+                self.rewind_to = previous
+                self.last = None
+        return dense
+
+    def fill(self, entries, frames, fps, regions=None):
+        """
+        补全跳过的帧：entries 为逐帧处理的帧（含第 0 帧），frames 为视频总帧数
+        运动量取逐帧安静运动量的均值，'fill_std' 为其标准差（见 batch_threshold）
+        返回：完整的 frames_data，补上的帧标记 'filled'
+        """
+        by_idx = {e['idx']: e for e in entries}
+        measured = [e for e in entries if e['idx'] > 0]
+        n, total, squares = self.quiet_total
+        if n:
+            mean = total / n
+            motion, std = int(round(mean)), float(np.sqrt(max(0.0, squares / n - mean * mean)))
         else:
-            motion_score = 0
+            motion, std = (int(np.median([e['motion'] for e in measured])) if measured else 0), 0.0
+        region_sums = None
+        if regions is not None and measured:
+            region_sums = np.median([e['regions'] for e in measured], axis=0).astype(np.int64)
+
+        frames_data = []
+        for idx in range(frames):
+            entry = by_idx.get(idx)
+            if entry is None:
+                entry = _frame_entry(idx, fps, motion, region_sums, regions)
+                entry['filled'] = True
+                entry['fill_std'] = std
+            frames_data.append(entry)
+        return frames_data
+
+
+def detect_motion_streaming(video_path, curtain_roi, cooldown_sec=COOLDOWN_SEC,
+                            max_candidates=STREAM_MAX_CANDIDATES,
+                            backend='opencv', gray=False, stride=1, scale=1.0,
+                            crop_store=None, work_scale=1.0, ksize=MOTION_BLUR_KSIZE, regions=None,
+                            adaptive=False):
+    """
+    流式检测幕布运动：不保存全部帧，内存占用与视频长度无关
+    只保留每帧运动量，以及运动峰值附近的少量候选帧（有界缓冲）
+
+    解码选项（见 frame_source.py）：
+        backend: 'opencv' / 'ffmpeg'
+        gray: 解码时直接输出灰度
+        stride: 每 stride 帧计算一次运动量
+        scale: 运动信号的缩放比例
+    work_scale: 幕布区域转为灰度后缩小到工作分辨率的比例（在解码之后进行，仍缓存候选帧）
+    ksize: 帧差前的模糊核大小
+    regions: MotionRegions，传入时每帧同时记录各区域运动量（'regions'，按 scale × work_scale 缩小后的坐标，
+             regions.decode_scale 必须与 scale 相同）
+    选择 ffmpeg / gray / scale 时在解码阶段就裁剪到幕布区域，
+    此时不缓存候选帧，峰值帧由 attach_hit_frames 回读
+
+    crop_store: 可选的 dict，传入时收集运动量局部极大帧的幕布区域图像
+                {帧号: 图像}（运动量最大的 MOTION_CACHE_MAX_CROPS 个，用于运动信号缓存）
+    adaptive: 自适应跳帧（AdaptiveScan，仅 opencv 后端、stride=1）：空闲时只采样，
+              运动附近逐帧处理；跳过的帧补上安静帧的运动量并标记 'filled'（见 AdaptiveScan.fill）
+
+    返回：(每帧运动量（不含 'frame'）, 采样帧率 fps / stride, 候选帧 {帧号: (运动量, 帧)})
+    """
+    _check_adaptive(adaptive, backend, stride)
+    if regions is not None and regions.decode_scale != scale:
+        raise ValueError(f"区域按解码缩放 {regions.decode_scale} 计算，与 scale={scale} 不一致"
+                         f"（创建 MotionRegions 时传入 decode_scale）")
+    cx1, cy1, cx2, cy2 = curtain_roi
+    reduced = backend != 'opencv' or gray or scale != 1.0
+    started = time.perf_counter()
 
-        frames_data.append({
-            'idx': frame_idx,
-            'time': frame_idx / fps,
-            'motion': motion_score,
-            'frame': frame.copy()
-        })
+    source = open_frame_source(
+        video_path, backend,
+        roi=curtain_roi if reduced else None,
+        gray=gray, stride=stride, scale=scale
+    )
+    fps = source.fps
+    sample_fps = fps / source.stride
+    window = max(1, int(fps * cooldown_sec))
+    scan = AdaptiveScan(fps) if adaptive else None
+    anchor = None  # 自适应跳帧回退时，回退到的帧（模糊后），用于校验定位
+
+    kernel = MotionKernel(work_scale, ksize, regions)
+    frames_data = []
+    candidates = {}
+    collect_crops = crop_store is not None and not reduced
+    recent = deque(maxlen=3)  # 最近三帧 (帧号, 运动量, 幕布区域)，判断局部极大
+    top_crops = []  # 小顶堆 (运动量, 帧号, 幕布区域)
+
+    def keep_crop(idx, motion, crop):
+        if len(top_crops) < MOTION_CACHE_MAX_CROPS:
+            heapq.heappush(top_crops, (motion, idx, crop.copy()))
+        elif motion > top_crops[0][0]:
+            heapq.heapreplace(top_crops, (motion, idx, crop.copy()))
+
+    decode_sec = diff_sec = 0.0
+    t0 = time.perf_counter()
+    for frame_idx, frame in (source.scan(scan.want) if scan is not None else source):
+        t1 = time.perf_counter()
+        decode_sec += t1 - t0
+
+        curtain = frame if reduced else frame[cy1:cy2, cx1:cx2]
+        motion_score, region_sums = kernel(curtain)
+        if anchor is not None:
+            # 回退后的第一帧：与回退前读到的同一帧比较，校验定位是否精确
+            if not np.array_equal(kernel.blurred(), anchor):
+                source.close()
+                print("    警告: 自适应跳帧回退定位不精确，改为逐帧处理")
+                return detect_motion_streaming(
+                    video_path, curtain_roi, cooldown_sec, max_candidates, backend, gray, stride, scale,
+                    crop_store, work_scale, ksize, regions
+                )
+            anchor = None
+        if scan is not None and not scan.update(frame_idx, motion_score) and frames_data:
+            # 跨帧的帧差只用于判断是否切换到逐帧处理
+            if scan.rewind_to is not None:
+                anchor = kernel.blurred(previous=True).copy()
+                source.rewind(scan.rewind_to)
+                kernel.reset()
+            t0 = time.perf_counter()
+            diff_sec += t0 - t1
+            continue
+
+        frames_data.append(_frame_entry(frame_idx, fps, motion_score, region_sums, regions))
+        if motion_score > 0 and max_candidates > 0 and not reduced:
+            _offer_candidate(candidates, frame_idx, motion_score, frame,
+                             window, max_candidates)
+        if collect_crops:
+            recent.append((frame_idx, motion_score, curtain))
+            if len(recent) == 3 and recent[0][1] < recent[1][1] >= recent[2][1]:
+                keep_crop(*recent[1])
+
+        t0 = time.perf_counter()
+        diff_sec += t0 - t1
+
+    source.close()
+    processed = None
+    if scan is not None:
+        frames_data = scan.fill(frames_data, source.position, fps, regions)
+        processed = source.retrieved
+    _record_motion(started, decode_sec, diff_sec, len(frames_data), processed)
+    if collect_crops:
+        if len(recent) >= 2 and recent[-2][1] < recent[-1][1]:
+            keep_crop(*recent[-1])
+        crop_store.update({idx: crop for _, idx, crop in top_crops})
+    return frames_data, sample_fps, candidates
+
+
+def _motion_segment(task):
+    """
+    并行分段的工作函数：计算 [first, end) 区间内每帧的运动量
+    first 帧没有前一帧，运动量记为 None，由上一分段提供
+    返回：(first, 运动量列表, 各区域运动量列表（没有区域时为 None）)
+    """
+    video_path, curtain_roi, first, end, scale, ksize, regions = task
+    cv2.setNumThreads(1)
+
+    kernel = MotionKernel(1.0, ksize, regions)
+    motions = []
+    region_rows = []
+    with open_frame_source(video_path, roi=curtain_roi, gray=True, scale=scale, start=first) as source:
+        for frame_idx, gray in source:
+            if end is not None and frame_idx >= end:
+                break
+            motion_score, region_sums = kernel(gray)
+            motions.append(motion_score if motions else None)
+            region_rows.append(region_sums)
+
+    return first, motions, region_rows if regions is not None else None
+
+
+def detect_motion_parallel(video_path, curtain_roi, workers=None, segments=None,
+                           overlap=SEGMENT_OVERLAP_FRAMES, scale=1.0, ksize=MOTION_BLUR_KSIZE,
+                           regions=None):
+    """
+    多进程并行检测幕布运动
+    把视频按时间切成若干分段，每段向前多解码 overlap 帧，
+    在进程池中分别计算运动量后按帧号拼接成完整序列
 
-        prev_curtain = gray
-        frame_idx += 1
+    分段边界：每段第一帧（没有前一帧）的运动量取自上一分段，
+    重叠部分用于校验定位是否精确，不一致时回退到串行计算。
+    击中事件在拼接后的完整序列上统一识别（全局阈值 + 冷却窗口），
+    因此边界附近的事件不会丢失或重复。
+    scale / ksize / regions 同 detect_motion_streaming
 
-    cap.release()
+    返回：(每帧运动量（不含 'frame'）, fps)
+    """
+    workers = workers or os.cpu_count() or 1
+    segments = segments or workers
+    overlap = max(2, overlap)
+    started = time.perf_counter()
+
+    with open_frame_source(video_path) as source:
+        fps = source.fps
+        total = source.frame_count
+
+    bounds = [total * k // segments for k in range(segments + 1)]
+    tasks = []
+    for k in range(segments):
+        start = bounds[k]
+        end = bounds[k + 1] if k < segments - 1 else None
+        tasks.append((video_path, curtain_roi, max(0, start - overlap), end, scale, ksize, regions))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_motion_segment, tasks))
+
+    motion = {}
+    region_sums = {}
+    for k, (first, motions, region_rows) in enumerate(results):
+        for offset, value in enumerate(motions):
+            idx = first + offset
+            if value is None:
+                continue
+            if idx < bounds[k]:
+                # 重叠部分：校验与上一分段的结果一致
+                if motion.get(idx) != value:
+                    print(f"    警告: 分段 {k} 定位不精确，回退到串行计算")
+                    frames_data, fps, _ = detect_motion_streaming(
+                        video_path, curtain_roi, max_candidates=0, gray=True, scale=scale, ksize=ksize,
+                        regions=regions
+                    )
+                    return frames_data, fps
+                continue
+            motion[idx] = value
+            if region_rows is not None:
+                region_sums[idx] = region_rows[offset]
+
+    count = max(motion) + 1 if motion else 0
+    frames_data = [
+        _frame_entry(i, fps, motion.get(i, 0), region_sums.get(i), regions)
+        for i in range(count)
+    ]
+    record('detect_motion', time.perf_counter() - started, count, start=started)
     return frames_data, fps
 
 
-def find_hit_events(frames_data, fps, threshold_factor=1.5, cooldown_sec=1.0):
+def detect_motion_pipelined(video_path, calibrate, crop_roi,
+                            buffer_frames=PIPELINE_BUFFER_FRAMES,
+                            margin=PIPELINE_CROP_MARGIN, scale=1.0, ksize=MOTION_BLUR_KSIZE,
+                            make_regions=None, lookup=None):
     """
-    找到击中事件（运动量超过阈值的帧）
-    在冷却期内找运动量最大的那一帧（击中瞬间）
+    流水线模式：圆圈标定与运动检测同时进行
+
+    calibrate（如调用 Gemini 的 detect_circles）在后台线程中运行，
+    同时解码 crop_roi（预处理使用的固定幕布区域，向外扩展 margin）的灰度图并缓存；
+    标定完成后从缓存帧中截取精确的幕布区域计算运动量，之后的帧直接处理。
+    灰度转换逐像素进行，先裁大区域再截取与直接裁精确区域结果完全一致。
+
+    缓存满（buffer_frames）时解码暂停等待标定；
+    精确区域超出固定裁剪区域时回退为标定后再串行解码。
+    scale / ksize 同 detect_motion_streaming（截取精确区域后再缩小，与解码时裁剪 + 缩小一致）
+    make_regions: 可选，make_regions(圆圈配置, 幕布区域) → MotionRegions，标定完成后创建，
+                  每帧同时记录各区域运动量
+    lookup: 可选，lookup(圆圈配置, 幕布区域, regions) → (每帧运动量, fps) 或 None，
+            标定完成后先调用（如查运动信号缓存），命中时停止解码，直接返回其结果
+
+    返回：(每帧运动量（不含 'frame'）, fps, 圆圈配置, 幕布区域)
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(calibrate)
+
+        source = open_frame_source(video_path)
+        fps = source.fps
+        w, h = source.width, source.height
+        source.close()
+
+        x1, y1, x2, y2 = crop_roi
+        crop = (max(0, x1 - margin), max(0, y1 - margin),
+                min(w, x2 + margin), min(h, y2 + margin))
+
+        frames_data = []
+        buffered = []
+        state = {'kernel': None, 'local': None, 'regions': None, 'found': None}
+
+        def process(frame_idx, gray):
+            lx1, ly1, lx2, ly2 = state['local']
+            motion_score, region_sums = state['kernel'](gray[ly1:ly2, lx1:lx2])
+            frames_data.append(_frame_entry(frame_idx, fps, motion_score, region_sums, state['regions']))
+
+        def narrow():
+            # 标定完成：换算到裁剪区域内的坐标，处理已缓存的帧
+            circles_config = future.result()
+            curtain_roi = get_curtain_roi(circles_config)
+            cx1, cy1, cx2, cy2 = curtain_roi
+            if make_regions is not None:
+                state['regions'] = make_regions(circles_config, curtain_roi)
+            if lookup is not None:
+                state['found'] = lookup(circles_config, curtain_roi, state['regions'])
+                if state['found'] is not None:
+                    buffered.clear()
+                    return circles_config, curtain_roi, False
+            if cx1 < crop[0] or cy1 < crop[1] or cx2 > crop[2] or cy2 > crop[3]:
+                return circles_config, curtain_roi, False
+            state['local'] = (cx1 - crop[0], cy1 - crop[1], cx2 - crop[0], cy2 - crop[1])
+            state['kernel'] = MotionKernel(scale, ksize, state['regions'])
+            for frame_idx, gray in buffered:
+                process(frame_idx, gray)
+            buffered.clear()
+            return circles_config, curtain_roi, True
+
+        calibrated = None
+        with open_frame_source(video_path, roi=crop, gray=True) as source:
+            for frame_idx, gray in source:
+                if calibrated is None and (future.done() or len(buffered) >= buffer_frames):
+                    calibrated = narrow()
+                    if not calibrated[2]:
+                        break
+                if calibrated is None:
+                    buffered.append((frame_idx, gray))
+                else:
+                    process(frame_idx, gray)
+
+        if calibrated is None:
+            calibrated = narrow()
+
+    circles_config, curtain_roi, ok = calibrated
+    if state['found'] is not None:
+        frames_data, fps = state['found']
+    elif not ok:
+        print(f"    幕布区域 {curtain_roi} 超出预解码区域 {crop}，重新解码")
+        frames_data, fps, _ = detect_motion_streaming(video_path, curtain_roi, max_candidates=0,
+                                                      gray=True, scale=scale, ksize=ksize,
+                                                      regions=state['regions'])
+    else:
+        record('detect_motion', time.perf_counter() - started, len(frames_data), start=started)
+
+    return frames_data, fps, circles_config, curtain_roi
+
+
+def attach_hit_frames(video_path, hit_events, candidates, seek=False):
+    """
+    为击中事件补上帧图像
+    优先使用候选缓冲中的帧；缓冲未命中的峰值再顺序回读视频取得，
+    因此结果与全量保存帧的 detect_motion 完全一致
+    seek=True 时按帧号直接定位读取（并行模式使用，避免再串行扫描一遍视频）
     """
-    motion_scores = [f['motion'] for f in frames_data]
-    avg_motion = np.mean(motion_scores)
-    std_motion = np.std(motion_scores)
-    threshold = avg_motion + threshold_factor * std_motion
-
-    cooldown_frames = int(fps * cooldown_sec)
-    hit_events = []
-
-    # 跳过开头的几帧（避免摄像机初始化误检）
-    start_frame = int(fps * 0.5)  # 从0.5秒开始检测
-
-    i = start_frame
-    while i < len(frames_data):
-        fd = frames_data[i]
-        if fd['motion'] > threshold:
-            # 找到一个超过阈值的帧，在接下来的一段时间内找最大值
-            peak_frame = fd
-            j = i + 1
-            while j < len(frames_data) and j - i < cooldown_frames:
-                if frames_data[j]['motion'] > peak_frame['motion']:
-                    peak_frame = frames_data[j]
-                j += 1
-
-            hit_events.append(peak_frame)
-            # 跳过冷却期
-            i = i + cooldown_frames
+    missing = [e['idx'] for e in hit_events if e['idx'] not in candidates]
+    fetched = read_frames(video_path, missing, seek=seek)
+
+    for e in hit_events:
+        if e['idx'] in candidates:
+            e['frame'] = candidates[e['idx']][1]
         else:
-            i += 1
+            e['frame'] = fetched.get(e['idx'])
+
+    return hit_events
+
+
+def attach_cached_crops(video_path, hit_events, crops, curtain_roi):
+    """
+    运动信号缓存命中时为击中事件补上幕布区域图像（事件标记 'cropped'），不再解码视频
+    缓存中没有的峰值（如调整了阈值）按帧号定位读取，裁剪后同时加入 crops
+    返回：新读取的帧数
+    """
+    cx1, cy1, cx2, cy2 = curtain_roi
+    missing = [e['idx'] for e in hit_events if e['idx'] not in crops]
+    fetched = read_frames(video_path, missing, seek=True)
+    for idx, frame in fetched.items():
+        crops[idx] = frame[cy1:cy2, cx1:cx2].copy()
+
+    for e in hit_events:
+        e['frame'] = crops.get(e['idx'])
+        e['cropped'] = True
+    return len(fetched)
+
+
+def find_hit_events(frames_data, fps, threshold_factor=1.5, cooldown_sec=1.0, regions=None):
+    """
+    找到击中事件（运动量超过阈值的帧）
+    在冷却期内找运动量最大的那一帧（击中瞬间）
+    运动量先转成连续数组，峰值由 find_hit_indices 查找
 
+    regions: MotionRegions，frames_data 带有各区域运动量时，按峰值帧的区域运动量定位击中的圆圈，
+             事件增加 'motion_circle'（圆圈下标，无法定位时为 None）和 'motion_z'（偏离倍数）
+    """
+    with stage('find_hit_events') as s:
+        s.frames = len(frames_data)
+        motion = np.fromiter((f['motion'] for f in frames_data), np.float64, len(frames_data))
+        filled = [f for f in frames_data if f.get('filled')]
+        threshold = batch_threshold(motion, threshold_factor, len(filled) / len(frames_data) if filled else 0.0,
+                                    filled[0].get('fill_std', 0.0) if filled else 0.0)
+        hit_indices = find_hit_indices(motion, fps, threshold, cooldown_sec)
+        hit_events = [frames_data[i] for i in hit_indices]
+        if regions is not None and hit_events and 'regions' in hit_events[0]:
+            # 逐帧噪声只用实际处理的帧估计（自适应跳帧补上的帧是同一个常数）
+            series = np.array([f['regions'] for f in frames_data if not f.get('filled')], np.float64)
+            located = regions.localize([e['regions'] for e in hit_events], series)
+            for e, (circle_idx, z) in zip(hit_events, located):
+                e['motion_circle'] = circle_idx
+                e['motion_z'] = z
     return hit_events, threshold
 
 
-def detect_ball_in_frame(frame, curtain_roi):
+def find_hit_indices(motion, fps, threshold, cooldown_sec=1.0):
+    """
+    在运动量数组上找击中帧的下标（find_hit_events 的核心）
+
+    1. 向量化比较找出所有超过阈值的帧（跳过开头 WARMUP_SEC）
+    2. 非极大值抑制：从第一个越过阈值的帧开始开一个冷却窗口，
+       窗口内其余越过阈值的帧被丢弃，下一个窗口从窗口之后第一个越过阈值的帧开始
+       （每个越过阈值的帧的"下一个窗口起点"用 searchsorted 一次算出，
+       只剩沿链跳转的整数循环）
+    3. 所有窗口一次性 gather 成 [击中数, 冷却帧数] 矩阵，按行 argmax 得到峰值
+
+    结果与逐帧扫描完全一致（窗口内取第一个最大值）
+    返回：击中帧在 motion 中的下标数组 (int64)
+    """
+    motion = np.ascontiguousarray(motion, dtype=np.float64)
+    cooldown_frames = max(1, int(fps * cooldown_sec))
+    start_frame = int(fps * WARMUP_SEC)  # 跳过开头的几帧（避免摄像机初始化误检）
+
+    above = np.flatnonzero(motion[start_frame:] > threshold) + start_frame
+    if len(above) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # 沿 "下一个窗口起点" 链选出各冷却窗口的起点
+    following = np.searchsorted(above, above + cooldown_frames).tolist()
+    chosen = []
+    k = 0
+    while k < len(above):
+        chosen.append(k)
+        k = following[k]
+    starts = above[chosen]
+
+    # 窗口越过序列末尾的部分用最后一帧填充（argmax 取第一个最大值，不影响结果）
+    window = starts[:, None] + np.arange(cooldown_frames)
+    np.minimum(window, len(motion) - 1, out=window)
+    return starts + np.argmax(motion[window], axis=1)
+
+
+def batch_threshold(motion_scores, threshold_factor=MOTION_THRESHOLD_FACTOR, filled_fraction=0.0, fill_std=0.0):
+    """
+    全局阈值 = 平均运动量 + N倍标准差（需要完整的运动量序列）
+    filled_fraction / fill_std: 自适应跳帧补上的帧所占比例及安静帧的标准差。补上的帧取安静帧的均值，
+    平均运动量的期望不变；方差补回这些帧本来的离散度 filled_fraction × fill_std²
+    """
+    variance = np.var(motion_scores) + filled_fraction * fill_std ** 2
+    return np.mean(motion_scores) + threshold_factor * np.sqrt(variance)
+
+
+class OnlineHitDetector:
+    """
+    在线击中检测器：逐帧输入运动量，实时输出击中事件
+
+    阈值模式：
+        'ewma'    - 指数加权均值/方差作为基线，适应光照等缓慢变化（实时默认）
+        'welford' - Welford 累计均值/方差，随帧数增加收敛到全局统计量
+        'fixed'   - 使用给定的固定阈值
+
+    等价模式：对已录制的视频，传入 threshold=batch_threshold(全部运动量)
+    （mode='fixed'），输出的事件与 find_hit_events 逐帧一致。
+
+    冷却逻辑与 find_hit_events 相同：运动量首次超过阈值后，
+    在 cooldown 窗口内取最大值作为击中瞬间，窗口结束时输出事件，
+    因此事件的输出延迟为一个冷却窗口。
+
+    低延迟模式（confirm_frames，实时计分使用）：峰值之后连续 confirm_frames 帧
+    没有出现更大的运动量就立即输出，窗口剩余部分仍然抑制新的事件。
+    延迟降为 confirm_frames 帧，代价是窗口后段更大的峰值不再替换已输出的事件。
+    """
+
+    def __init__(self, fps, threshold_factor=MOTION_THRESHOLD_FACTOR,
+                 cooldown_sec=COOLDOWN_SEC, mode='ewma', threshold=None,
+                 ewma_alpha=EWMA_ALPHA, warmup_sec=WARMUP_SEC, confirm_frames=None):
+        if mode == 'fixed' and threshold is None:
+            raise ValueError("mode='fixed' 需要指定 threshold")
+        if mode not in ('ewma', 'welford', 'fixed'):
+            raise ValueError(f"未知的阈值模式: {mode}")
+
+        self.fps = fps
+        self.threshold_factor = threshold_factor
+        self.cooldown_frames = max(1, int(fps * cooldown_sec))
+        self.start_frame = int(fps * warmup_sec)
+        self.mode = mode
+        self.ewma_alpha = ewma_alpha
+        self.fixed_threshold = threshold
+        self.confirm_frames = confirm_frames
+
+        # 统计量
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # welford: 偏差平方和；ewma: 方差
+
+        # 状态
+        self.frame_idx = 0
+        self.next_check = self.start_frame
+        self.window_end = None
+        self.peak = None
+        self.peak_emitted = False
+
+    @property
+    def threshold(self):
+        """当前阈值"""
+        if self.mode == 'fixed':
+            return self.fixed_threshold
+        if self.mode == 'welford':
+            var = self.m2 / self.count if self.count else 0.0
+        else:
+            var = self.m2
+        return self.mean + self.threshold_factor * np.sqrt(var)
+
+    def _update_stats(self, motion):
+        self.count += 1
+        if self.mode == 'welford':
+            delta = motion - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (motion - self.mean)
+        elif self.mode == 'ewma':
+            if self.count == 1:
+                self.mean = float(motion)
+                return
+            delta = motion - self.mean
+            self.mean += self.ewma_alpha * delta
+            self.m2 = (1 - self.ewma_alpha) * (self.m2 + self.ewma_alpha * delta * delta)
+
+    def update(self, motion, frame=None):
+        """
+        输入一帧的运动量（可选附带帧图像，仅峰值帧会被保留）
+        返回：本帧结束的击中事件列表（0 或 1 个）
+        """
+        idx = self.frame_idx
+        self.frame_idx += 1
+        emitted = []
+
+        # 冷却窗口结束 → 输出峰值（低延迟模式下可能已经输出）
+        if self.window_end is not None and idx >= self.window_end:
+            if not self.peak_emitted:
+                emitted.append(self.peak)
+            self.window_end = None
+            self.peak = None
+
+        # 阈值基于之前的帧，避免当前尖峰抬高自己的阈值
+        threshold = self.threshold
+        if self.mode != 'fixed':
+            self._update_stats(motion)
+
+        if self.window_end is not None:
+            if self.peak_emitted:
+                return emitted
+            if motion > self.peak['motion']:
+                self.peak = self._make_event(idx, motion, frame)
+            elif self.confirm_frames and idx - self.peak['idx'] >= self.confirm_frames:
+                # 低延迟模式：峰值已确认，立即输出
+                emitted.append(self.peak)
+                self.peak_emitted = True
+        elif idx >= self.next_check and motion > threshold:
+            self.peak = self._make_event(idx, motion, frame)
+            self.peak_emitted = False
+            self.window_end = idx + self.cooldown_frames
+            self.next_check = self.window_end
+
+        return emitted
+
+    def finish(self):
+        """视频结束：输出尚未关闭的冷却窗口中的峰值"""
+        emitted = []
+        if self.peak is not None and not self.peak_emitted:
+            emitted.append(self.peak)
+        self.window_end = None
+        self.peak = None
+        return emitted
+
+    def _make_event(self, idx, motion, frame):
+        event = {'idx': idx, 'time': idx / self.fps, 'motion': motion}
+        if frame is not None:
+            event['frame'] = frame.copy()
+        return event
+
+
+@timed('detect_ball_in_frame')
+def detect_ball_in_frame(frame, curtain_roi, cropped=False, resolution=None):
     """
     在帧中检测球的位置
-    返回：球的坐标 (x, y) 或 None
+    cropped=True 表示 frame 已是帧源在解码时裁剪好的幕布区域（BGR）
+    resolution: WorkResolution，幕布区域先缩小到工作分辨率再检测，球面积范围按分辨率换算；
+                None 时按原图检测，面积范围不换算
+    返回：球的坐标 (x, y)（原图坐标系）或 None
     """
     cx1, cy1, cx2, cy2 = curtain_roi
-    curtain = frame[cy1:cy2, cx1:cx2]
+    curtain = frame if cropped else frame[cy1:cy2, cx1:cx2]
+    if resolution is None:
+        resolution = WorkResolution(REFERENCE_WIDTH)
+    curtain = resolution.to_work(curtain)
+    min_area = resolution.work_area(BALL_MIN_AREA)
+    max_area = resolution.work_area(BALL_MAX_AREA)
 
     # HSV 颜色检测
     hsv = cv2.cvtColor(curtain, cv2.COLOR_BGR2HSV)
@@ -154,61 +902,104 @@ def detect_ball_in_frame(frame, curtain_roi):
 
     for c in contours:
         area = cv2.contourArea(c)
-        if 30 < area < 2000:  # 球的大小范围
+        if min_area < area < max_area:  # 球的大小范围
             M = cv2.moments(c)
             if M['m00'] > 0:
-                bx = int(M['m10'] / M['m00']) + cx1
-                by = int(M['m01'] / M['m00']) + cy1
-                return (bx, by)
+                bx, by = resolution.to_source(M['m10'] / M['m00'], M['m01'] / M['m00'], (cx1, cy1))
+                return (int(bx), int(by))
 
     return None
 
 
-def check_score(ball_pos, circles_config, tolerance=15):
+def _check_adaptive(adaptive, backend='opencv', stride=1):
+    """自适应跳帧只在 opencv 后端逐帧读取时有收益（其它组合抛出 ValueError）"""
+    if not adaptive:
+        return
+    if backend != 'opencv':
+        raise ValueError(f"自适应跳帧不支持 {backend} 后端：ffmpeg 管道对每一帧都完成解码和颜色转换，"
+                         f"跳帧没有收益，请使用 backend='opencv'")
+    if stride != 1:
+        raise ValueError("自适应跳帧自行决定读取哪些帧，不能与 stride 同时使用")
+
+
+def motion_options(resolution, decode_options=None):
     """
-    判断球是否在得分圈内
-    返回：(是否得分, 分数, 命中的圆圈)
+    运动检测（detect_motion_streaming）的选项：在 decode_options 的基础上
+    缩小到工作分辨率，模糊核按工作分辨率换算
+    与参考分辨率相同时不增加选项（同时用作运动信号缓存的键）
     """
-    if ball_pos is None:
-        return False, 0, None
+    options = dict(decode_options or {})
+    _check_adaptive(options.get('adaptive'), options.get('backend', 'opencv'), options.get('stride', 1))
+    if resolution.scale != 1.0:
+        options['work_scale'] = resolution.scale
+    if resolution.blur_ksize != MOTION_BLUR_KSIZE:
+        options['ksize'] = resolution.blur_ksize
+    return options
 
-    for c in circles_config:
-        cx, cy = c['center']
-        radius = c['radius']
-        dist = np.sqrt((ball_pos[0] - cx)**2 + (ball_pos[1] - cy)**2)
 
-        if dist <= radius + tolerance:
-            return True, c['score'], c
+def score_hit(score_map, circles_config, ball_pos, motion_circle=None, motion_fallback=MOTION_FALLBACK):
+    """
+    单次击中的计分（detect_and_score 与 param_sweep 共用的规则）：
+    颜色检测找到球时按球位置查表（运动定位的圆圈只作为印证），
+    找不到球且 motion_fallback 时按区域运动量定位的圆圈计分
+    返回：(是否得分, 分数, 命中的圆圈, 定位方式 'color' / 'motion' / None)
+    """
+    if ball_pos is not None:
+        return (*score_map.lookup(ball_pos), 'color')
+    if motion_fallback and motion_circle is not None:
+        hit_circle = circles_config[motion_circle]
+        return True, hit_circle['score'], hit_circle, 'motion'
+    return False, 0, None, None
 
-    return False, 0, None
 
+def check_score(ball_pos, circles_config, tolerance=15, policy='first'):
+    """
+    判断球是否在得分圈内（查预先计算的得分查找表，见 score_map.py）
+    policy: 多个圆圈重叠时的裁决规则，默认 'first' 与旧版一致（配置中排在前面的圆圈）
+    返回：(是否得分, 分数, 命中的圆圈)
+    """
+    return score_map_for(circles_config, tolerance, policy).lookup(ball_pos)
 
-def draw_result(frame, curtain_roi, circles_config, ball_pos, scored, score, time_sec):
-    """绘制检测结果"""
+
+def draw_result(frame, curtain_roi, circles_config, ball_pos, scored, score, time_sec, cropped=False):
+    """
+    绘制检测结果
+    cropped=True 表示 frame 是幕布区域图像（运动信号缓存中的候选帧），坐标按幕布区域左上角平移
+    """
     result = frame.copy()
     cx1, cy1, cx2, cy2 = curtain_roi
+    ox, oy = (cx1, cy1) if cropped else (0, 0)
 
     # 画幕布区域
-    cv2.rectangle(result, (cx1, cy1), (cx2, cy2), (255, 255, 255), 1)
+    if cropped:
+        cv2.rectangle(result, (0, 0), (result.shape[1] - 1, result.shape[0] - 1), (255, 255, 255), 1)
+    else:
+        cv2.rectangle(result, (cx1, cy1), (cx2, cy2), (255, 255, 255), 1)
 
     # 画得分圈
     colors = {10: (0, 255, 0), 20: (0, 255, 255), 30: (0, 165, 255)}
     for c in circles_config:
-        cv2.circle(result, tuple(c['center']), c['radius'], colors.get(c['score'], (255, 255, 255)), 2)
+        center = (c['center'][0] - ox, c['center'][1] - oy)
+        cv2.circle(result, center, c['radius'], colors.get(c['score'], (255, 255, 255)), 2)
 
     # 画球和标注
     if ball_pos:
         color = (0, 255, 0) if scored else (0, 0, 255)
-        cv2.circle(result, ball_pos, 15, color, 3)
+        bx, by = ball_pos[0] - ox, ball_pos[1] - oy
+        cv2.circle(result, (bx, by), 15, color, 3)
         status = f"+{score}" if scored else "MISS"
         cv2.putText(result, f"{time_sec:.2f}s {status}",
-                    (ball_pos[0] - 50, ball_pos[1] - 25),
+                    (bx - 50, by - 25),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
 
     return result
 
 
-def detect_and_score(video_path, circles_config_path=None, output_dir=None):
+def detect_and_score(video_path, circles_config_path=None, output_dir=None, streaming=True,
+                     decode_options=None, workers=None, calibrate=None, calibration_roi=None,
+                     motion_cache=None, threshold_factor=None, cooldown_sec=None,
+                     hit_tolerance=None, score_policy=None, ball_locator=None, render_images=True,
+                     work_width=WORK_WIDTH, motion_fallback=None):
     """
     主函数：检测击中并计分
 
@@ -216,6 +1007,26 @@ def detect_and_score(video_path, circles_config_path=None, output_dir=None):
         video_path: 视频路径
         circles_config_path: 圆圈配置文件路径
         output_dir: 输出目录
+        streaming: 是否使用流式运动检测（不在内存中保存全部帧）
+        decode_options: 运动检测的解码选项，如 {'backend': 'ffmpeg', 'gray': True}、
+                        {'adaptive': True}（自适应跳帧，只用于串行流式模式，否则抛出 ValueError；
+                        见 detect_motion_streaming）
+        workers: 大于 1 时按时间分段、多进程并行检测运动
+        calibrate: 流水线模式，返回圆圈配置的函数（代替 circles_config_path），
+                   与运动检测同时运行
+        calibration_roi: 流水线模式下标定完成前预解码的固定幕布区域 (x1, y1, x2, y2)
+        motion_cache: MotionCache，命中时跳过解码，未命中时保存本次的运动序列
+        threshold_factor / cooldown_sec / hit_tolerance: 检测参数，
+                   默认为 MOTION_THRESHOLD_FACTOR / COOLDOWN_SEC / HIT_TOLERANCE
+                   （hit_tolerance 为参考分辨率下的像素，按视频宽度换算）
+        score_policy: 圆圈（含容差）重叠时的裁决规则，默认 SCORE_POLICY（见 score_map.py）
+        ball_locator: 可选的击中点定位函数
+                   ball_locator(video_path, event, curtain_roi, resolution) → (x, y) 或 None
+                   （如 ball_tracker.locate_ball 多帧跟踪），默认在峰值帧上单帧检测
+        render_images: 是否绘制并写入 hit_event_N.jpg（False 时由 render_cache 按帧号按需渲染）
+        work_width: 运动检测和球检测的工作分辨率宽度上限（见 resolution.py），
+                   更宽的视频缩小后处理，None 表示按原分辨率处理
+        motion_fallback: 找不到球时是否按区域运动量定位的圆圈计分，默认 MOTION_FALLBACK（见 score_hit）
 
     Returns:
         total_score: 总得分
@@ -225,37 +1036,123 @@ def detect_and_score(video_path, circles_config_path=None, output_dir=None):
         circles_config_path = CIRCLES_CONFIG
     if output_dir is None:
         output_dir = OUTPUT_DIR
+    if threshold_factor is None:
+        threshold_factor = MOTION_THRESHOLD_FACTOR
+    if cooldown_sec is None:
+        cooldown_sec = COOLDOWN_SEC
+    if hit_tolerance is None:
+        hit_tolerance = HIT_TOLERANCE
+    if score_policy is None:
+        score_policy = SCORE_POLICY
+    if motion_fallback is None:
+        motion_fallback = MOTION_FALLBACK
 
     os.makedirs(output_dir, exist_ok=True)
 
-    # 读取圆圈配置
-    with open(circles_config_path, 'r') as f:
-        circles_config = json.load(f)
-
-    # 计算幕布区域
-    curtain_roi = get_curtain_roi(circles_config)
+    resolution = WorkResolution.for_video(video_path, work_width)
+    options = motion_options(resolution, decode_options)
+    ksize = resolution.blur_ksize
+
+    pipelined = calibrate is not None
+    if options.get('adaptive') and (pipelined or (workers and workers > 1) or not streaming):
+        raise ValueError("自适应跳帧只用于串行流式运动检测，不能与流水线（calibrate）、workers > 1 "
+                         "或 streaming=False 同时使用")
+    if not pipelined:
+        # 读取圆圈配置
+        with open(circles_config_path, 'r') as f:
+            circles_config = json.load(f)
+
+        # 计算幕布区域
+        curtain_roi = get_curtain_roi(circles_config)
+        # 只有串行流式检测使用 decode_options 的 scale，区域按同样的比例缩小
+        decode_scale = options.get('scale', 1.0) if streaming and not (workers and workers > 1) else 1.0
+        regions = MotionRegions(circles_config, curtain_roi, resolution, decode_scale)
 
     print("=" * 60)
     print("网球击中检测与计分")
     print("=" * 60)
     print(f"视频: {video_path}")
-    print(f"幕布区域: {curtain_roi}")
-    print(f"冷却时间: {COOLDOWN_SEC}秒")
+    if pipelined:
+        print(f"流水线模式: 标定期间预解码 {calibration_roi}")
+    else:
+        print(f"幕布区域: {curtain_roi}")
+    print(f"冷却时间: {cooldown_sec}秒")
+    print(f"工作分辨率: {resolution.describe()}")
 
     # Step 1: 检测运动
     print("\n[1] 检测幕布运动...")
-    frames_data, fps = detect_motion(video_path, curtain_roi)
+    cached = None
+    crops = {}
+    if motion_cache is not None and not pipelined:
+        cached = motion_cache.load(video_path, curtain_roi, options, regions)
+
+    def lookup(circles, roi, roi_regions):
+        # 流水线模式：标定得到幕布区域后再查缓存，命中时不再解码剩余的视频
+        nonlocal cached
+        cached = motion_cache.load(video_path, roi, options, roi_regions)
+        return cached[:2] if cached is not None else None
+
+    if cached is not None:
+        frames_data, fps, crops = cached
+        candidates = {}
+        print("    命中运动信号缓存，跳过解码")
+    elif pipelined:
+        frames_data, fps, circles_config, curtain_roi = detect_motion_pipelined(
+            video_path, calibrate, calibration_roi, scale=resolution.scale, ksize=ksize,
+            make_regions=lambda circles, roi: MotionRegions(circles, roi, resolution),
+            lookup=lookup if motion_cache is not None else None
+        )
+        regions = MotionRegions(circles_config, curtain_roi, resolution)
+        candidates = {}
+        print(f"    幕布区域: {curtain_roi}")
+        if cached is not None:
+            crops = cached[2]
+            print("    标定后命中运动信号缓存，跳过剩余的解码")
+    elif workers and workers > 1:
+        frames_data, fps = detect_motion_parallel(video_path, curtain_roi, workers=workers,
+                                                  scale=resolution.scale, ksize=ksize, regions=regions)
+        candidates = {}
+    elif streaming:
+        frames_data, fps, candidates = detect_motion_streaming(
+            video_path, curtain_roi, cooldown_sec=cooldown_sec,
+            crop_store=crops if motion_cache is not None else None, regions=regions,
+            **options
+        )
+    else:
+        frames_data, fps = detect_motion(video_path, curtain_roi, scale=resolution.scale, ksize=ksize,
+                                         regions=regions)
     print(f"    视频: {fps:.1f} fps, {len(frames_data)} 帧")
+    filled = sum(1 for f in frames_data if f.get('filled'))
+    if filled:
+        print(f"    自适应跳帧: 逐帧处理 {len(frames_data) - filled} 帧，跳过 {filled} 帧")
 
     # Step 2: 找击中事件
     print("\n[2] 识别击中事件...")
     hit_events, threshold = find_hit_events(
         frames_data, fps,
-        threshold_factor=MOTION_THRESHOLD_FACTOR,
-        cooldown_sec=COOLDOWN_SEC
+        threshold_factor=threshold_factor,
+        cooldown_sec=cooldown_sec,
+        regions=regions
     )
     print(f"    运动阈值: {threshold:.0f}")
-    print(f"    检测到 {len(hit_events)} 次击中")
+    print(f"    检测到 {len(hit_events)} 次击中，"
+          f"按区域运动量定位 {sum(1 for e in hit_events if e.get('motion_circle') is not None)} 次")
+    if cached is not None:
+        # 缓存命中：在缓存的幕布区域图像上定位球，缓存中没有的峰值帧读取后补进缓存
+        if attach_cached_crops(video_path, hit_events, crops, curtain_roi):
+            motion_cache.save(video_path, curtain_roi, frames_data, fps, crops, options, regions)
+    else:
+        if pipelined or (workers and workers > 1):
+            attach_hit_frames(video_path, hit_events, candidates, seek=True)
+        elif streaming:
+            attach_hit_frames(video_path, hit_events, candidates)
+        if motion_cache is not None:
+            # 击中帧的幕布区域一起保存（流水线 / 并行 / 灰度解码时没有候选帧），再次计分时不再读取视频
+            cx1, cy1, cx2, cy2 = curtain_roi
+            for e in hit_events:
+                if e['idx'] not in crops and e.get('frame') is not None:
+                    crops[e['idx']] = e['frame'][cy1:cy2, cx1:cx2].copy()
+            motion_cache.save(video_path, curtain_roi, frames_data, fps, crops, options, regions)
 
     # Step 3: 检测球位置并计分
     print("\n[3] 计分判定...")
@@ -263,10 +1160,17 @@ def detect_and_score(video_path, circles_config_path=None, output_dir=None):
 
     total_score = 0
     events = []
+    score_map = score_map_for(circles_config, resolution.source_length(hit_tolerance), score_policy)
 
     for i, event in enumerate(hit_events):
-        ball_pos = detect_ball_in_frame(event['frame'], curtain_roi)
-        scored, score, hit_circle = check_score(ball_pos, circles_config, HIT_TOLERANCE)
+        if ball_locator is not None:
+            ball_pos = ball_locator(video_path, event, curtain_roi, resolution)
+        else:
+            ball_pos = detect_ball_in_frame(event['frame'], curtain_roi, cropped=event.get('cropped', False),
+                                            resolution=resolution)
+        motion_circle = event.get('motion_circle')
+        scored, score, hit_circle, located_by = score_hit(score_map, circles_config, ball_pos,
+                                                          motion_circle, motion_fallback)
 
         if scored:
             total_score += score
@@ -275,22 +1179,33 @@ def detect_and_score(video_path, circles_config_path=None, output_dir=None):
             status = "MISS"
 
         ball_str = f"{ball_pos}" if ball_pos else "未检测到"
+        if located_by == 'motion':
+            ball_str += "，按区域运动量定位"
+        elif motion_circle is not None and hit_circle is not circles_config[motion_circle]:
+            ball_str += f"，区域运动量定位为 {circles_config[motion_circle]['score']} 分圆圈"
         print(f"  事件{i+1}: {event['time']:.2f}s, 球={ball_str} → {status}")
 
         # 保存结果
         events.append({
+            'frame_idx': event['idx'],
             'time': event['time'],
             'ball_pos': ball_pos,
             'scored': scored,
-            'score': score
+            'score': score,
+            'motion_circle': motion_circle,
+            'located_by': located_by,
         })
 
         # 保存图片
-        result_img = draw_result(
-            event['frame'], curtain_roi, circles_config,
-            ball_pos, scored, score, event['time']
-        )
-        cv2.imwrite(f"{output_dir}/hit_event_{i+1}.jpg", result_img)
+        if render_images:
+            result_img = draw_result(
+                event['frame'], curtain_roi, circles_config,
+                ball_pos, scored, score, event['time'], cropped=event.get('cropped', False)
+            )
+            image_path = f"{output_dir}/hit_event_{i+1}.jpg"
+            with stage('imwrite') as s:
+                cv2.imwrite(image_path, result_img)
+                s.add_file(image_path)
 
     print("-" * 50)
     print(f"\n[结果] 总得分: {total_score} 分")
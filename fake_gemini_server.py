@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 Gemini 模拟服务 - 不联网测试圆圈标定（客户端池、超时、重试、合并、多图请求）
+
+实现 generateContent 接口：按已知的圆圈配置（原图坐标，如合成视频的 *_circles.json）
+计算每张裁剪图上的归一化框并返回，多图请求按图片顺序返回。
+可以注入延迟和失败（503 / 连接断开），GET /stats 返回收到的请求数和图片数。
+
+使用方法：
+    python fake_gemini_server.py output/bench/720p30_circles.json --port 8765 --latency 0.5 --fail-rate 0.3
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=test python tennis_scorer.py 视频.mov
+
+代码中使用：
+    server = FakeGeminiServer(circles, (1920, 1080)).start()
+    os.environ['GEMINI_BASE_URL'] = server.url
+    ...
+    server.stop()
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from detect_circles_final import curtain_crop_box
+
+FAKE_PORT = 8765
+
+
+def normalized_boxes(circles, size):
+    """原图坐标的圆圈 → 裁剪图上的归一化框（与 preprocess_image 的裁剪区域一致，和放大倍数无关）"""
+    x1, y1, x2, y2 = curtain_crop_box(*size)
+    boxes = []
+    for c in circles:
+        r = c.get('radius', 20)
+        nx1 = (c['center'][0] - r - x1) / (x2 - x1) * 1000
+        nx2 = (c['center'][0] + r - x1) / (x2 - x1) * 1000
+        ny1 = (c['center'][1] - r - y1) / (y2 - y1) * 1000
+        ny2 = (c['center'][1] + r - y1) / (y2 - y1) * 1000
+        boxes.append({'box_2d': [round(ny1), round(nx1), round(ny2), round(nx2)], 'label': str(c['score'])})
+    return boxes
+
+
+class FakeGeminiServer:
+    """
+    模拟 Gemini generateContent 接口
+
+    Args:
+        circles: 圆圈配置（原图坐标）
+        size: 原图尺寸 (w, h)
+        latency: 每个请求的延迟（秒）
+        fail_rate: 返回 503 的概率
+        drop_rate: 不响应直接断开连接的概率
+        port: 端口，0 表示自动分配
+    """
+
+    def __init__(self, circles, size, latency=0.0, fail_rate=0.0, drop_rate=0.0, port=0):
+        self.boxes = normalized_boxes(circles, size)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.stats = {'requests': 0, 'images': 0, 'failures': 0, 'drops': 0}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    with server.lock:
+                        self._send_json(200, server.stats)
+                else:
+                    self._send_json(404, {'error': {'code': 404, 'message': 'not found'}})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not self.path.split('?')[0].endswith(':generateContent'):
+                    self._send_json(404, {'error': {'code': 404, 'message': 'not found'}})
+                    return
+                parts = [p for c in body.get('contents', []) for p in c.get('parts', [])]
+                images = sum(1 for p in parts if 'inlineData' in p or 'inline_data' in p)
+                with server.lock:
+                    server.stats['requests'] += 1
+                    server.stats['images'] += images
+
+                time.sleep(server.latency)
+                roll = random.random()
+                if roll < server.drop_rate:
+                    with server.lock:
+                        server.stats['drops'] += 1
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if roll < server.drop_rate + server.fail_rate:
+                    with server.lock:
+                        server.stats['failures'] += 1
+                    self._send_json(503, {'error': {'code': 503, 'message': 'overloaded',
+                                                    'status': 'UNAVAILABLE'}})
+                    return
+
+                if images > 1:
+                    answer = [{'image': i + 1, 'circles': server.boxes} for i in range(images)]
+                else:
+                    answer = server.boxes
+                self._send_json(200, {
+                    'candidates': [{
+                        'content': {'role': 'model', 'parts': [{'text': json.dumps(answer)}]},
+                        'finishReason': 'STOP',
+                    }],
+                })
+
+        return Handler
+
+    def start(self):
+        """在后台线程中运行"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Gemini 模拟服务")
+    parser.add_argument("circles", help="圆圈配置 JSON（原图坐标）")
+    parser.add_argument("--size", default="1920x1080", help="原图尺寸 WxH")
+    parser.add_argument("--port", type=int, default=FAKE_PORT, help="端口")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="直接断开连接的概率")
+    args = parser.parse_args()
+
+    with open(args.circles, 'r') as f:
+        circles = json.load(f)
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    server = FakeGeminiServer(circles, size, args.latency, args.fail_rate, args.drop_rate, args.port)
+    print(f"模拟 Gemini 服务: {server.url}  (GEMINI_BASE_URL={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+视频帧源 - 可插拔的解码后端
+
+运动检测只需要幕布区域的灰度图，而解码整帧 1920x1080 BGR 是主要的 CPU 开销。
+帧源在解码阶段就完成裁剪 / 灰度 / 跳帧 / 缩小，上层只处理需要的像素。
+
+后端：
+    'opencv' - cv2.VideoCapture，跳帧时只 grab() 不 retrieve()（省去颜色转换），
+               scan(want) 按处理结果逐帧决定是否完整读取（自适应跳帧）
+    'ffmpeg' - 本地 ffmpeg 管道，裁剪、缩放、灰度在 ffmpeg 滤镜中完成
+
+使用方法：
+    with open_frame_source(video_path, backend='ffmpeg', roi=roi, gray=True) as source:
+        for idx, image in source:
+            ...
+"""
+import os
+import subprocess
+
+import cv2
+import numpy as np
+
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+
+
+class OpenCVFrameSource:
+    """
+    基于 cv2.VideoCapture 的帧源
+
+    Args:
+        video_path: 视频路径
+        roi: 裁剪区域 (x1, y1, x2, y2)，None 表示整帧
+        gray: 是否输出灰度图
+        stride: 跳帧步长，每 stride 帧输出一帧
+        scale: 缩放比例（作用于裁剪后的图像）
+        start: 起始帧号（按帧号定位）
+    """
+
+    def __init__(self, video_path, roi=None, gray=False, stride=1, scale=1.0, start=0):
+        self.video_path = video_path
+        self.roi = roi
+        self.gray = gray
+        self.stride = max(1, int(stride))
+        self.scale = scale
+        self.start = start
+
+        self.cap = cv2.VideoCapture(video_path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if start > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    @property
+    def reduced(self):
+        """输出是否不再是原始整帧（裁剪 / 灰度 / 缩放）"""
+        return self.roi is not None or self.gray or self.scale != 1.0
+
+    def _transform(self, frame):
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            frame = frame[y1:y2, x1:x2]
+        if self.gray:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                               interpolation=cv2.INTER_AREA)
+        return frame
+
+    def __iter__(self):
+        return self.scan(lambda frame_idx: (frame_idx - self.start) % self.stride == 0)
+
+    def scan(self, want):
+        """
+        按需输出帧：want(帧号) 为 True 的帧完整读取并输出，其它帧只 grab() 不 retrieve()
+        want 在读取每一帧之前调用，可以根据已输出帧的处理结果改变（自适应跳帧），
+        处理过程中可以用 rewind 回到之前的帧重新读取
+        retrieved / grabbed 为完整读取和只 grab 的帧数（回退重读的帧重复计数）
+        """
+        self.retrieved = self.grabbed = 0
+        self.position = self.start
+        while True:
+            frame_idx = self.position
+            if not want(frame_idx):
+                # 跳过的帧只解码不转换
+                if not self.cap.grab():
+                    break
+                self.grabbed += 1
+                self.position += 1
+                continue
+
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            self.retrieved += 1
+            self.position += 1
+            yield frame_idx, self._transform(frame)
+
+    def rewind(self, frame_idx):
+        """scan 过程中回到 frame_idx 继续读取（按帧号定位，是否精确取决于编码格式，调用方需校验）"""
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        self.position = frame_idx
+
+    def close(self):
+        self.cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FFmpegFrameSource(OpenCVFrameSource):
+    """
+    基于本地 ffmpeg 管道的帧源
+    裁剪、缩放、跳帧和灰度转换都在 ffmpeg 滤镜中完成，管道里只传输需要的像素
+    视频元信息（fps、尺寸）仍通过 cv2.VideoCapture 读取
+    """
+
+    def __init__(self, video_path, roi=None, gray=False, stride=1, scale=1.0, start=0):
+        super().__init__(video_path, roi=roi, gray=gray, stride=stride, scale=scale)
+        self.cap.release()
+        self.start = start
+        self.proc = None
+
+    def _output_size(self):
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            w, h = x2 - x1, y2 - y1
+        else:
+            w, h = self.width, self.height
+        if self.scale != 1.0:
+            w, h = int(round(w * self.scale)), int(round(h * self.scale))
+        return w, h
+
+    def _command(self):
+        filters = []
+        if self.stride > 1:
+            filters.append(f"select='not(mod(n\\,{self.stride}))'")
+        if self.roi is not None:
+            x1, y1, x2, y2 = self.roi
+            filters.append(f"crop={x2 - x1}:{y2 - y1}:{x1}:{y1}")
+        if self.scale != 1.0:
+            w, h = self._output_size()
+            filters.append(f"scale={w}:{h}:flags=area")
+
+        cmd = [FFMPEG_BIN, '-v', 'error', '-nostdin']
+        if self.start > 0:
+            cmd += ['-ss', f"{self.start / self.fps:.6f}"]
+        cmd += ['-i', self.video_path]
+        if filters:
+            cmd += ['-vf', ','.join(filters)]
+        cmd += ['-vsync', '0', '-pix_fmt', 'gray' if self.gray else 'bgr24',
+                '-f', 'rawvideo', 'pipe:1']
+        return cmd
+
+    def __iter__(self):
+        w, h = self._output_size()
+        shape = (h, w) if self.gray else (h, w, 3)
+        frame_bytes = int(np.prod(shape))
+
+        self.proc = subprocess.Popen(self._command(), stdout=subprocess.PIPE,
+                                     bufsize=frame_bytes)
+        frame_idx = self.start
+        try:
+            while True:
+                data = self.proc.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    break
+                yield frame_idx, np.frombuffer(data, np.uint8).reshape(shape)
+                frame_idx += self.stride
+        finally:
+            self.close()
+
+    def scan(self, want):
+        raise NotImplementedError("ffmpeg 管道中每帧都已解码和转换，按需读取（scan）请使用 opencv 后端")
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdout.close()
+            if self.proc.poll() is None:
+                self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+
+FRAME_SOURCES = {
+    'opencv': OpenCVFrameSource,
+    'ffmpeg': FFmpegFrameSource,
+}
+
+
+def open_frame_source(video_path, backend='opencv', **options):
+    """
+    按名称创建帧源
+
+    Args:
+        video_path: 视频路径
+        backend: 'opencv' 或 'ffmpeg'
+        **options: roi / gray / stride / scale / start
+    """
+    if backend not in FRAME_SOURCES:
+        raise ValueError(f"未知的解码后端: {backend}，可选: {', '.join(FRAME_SOURCES)}")
+    return FRAME_SOURCES[backend](video_path, **options)
+
+
+def read_frames(video_path, indices, seek=False):
+    """
+    读取指定帧号的原始整帧
+    默认顺序读取（非目标帧只 grab() 不转换，帧号精确）；
+    seek=True 时直接按帧号定位，适合长视频中零散的少量帧
+    返回：{帧号: 帧}
+    """
+    targets = sorted(set(indices))
+    frames = {}
+    if not targets:
+        return frames
+
+    cap = cv2.VideoCapture(video_path)
+    frame_idx = 0
+    for target in targets:
+        if seek and target != frame_idx:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            frame_idx = target
+        while frame_idx < target and cap.grab():
+            frame_idx += 1
+        if frame_idx < target:
+            break
+        ret, frame = cap.read()
+        frame_idx += 1
+        if ret:
+            frames[target] = frame
+    cap.release()
+    return frames
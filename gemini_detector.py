@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Gemini 圆圈定位后端
+
+在预处理后的裁剪图上调用 Gemini 标出 6 个得分圆圈，返回圆心（裁剪图坐标）。
+本模块导入 google-genai SDK（导入较慢），由 detect_circles_final 的后端注册表
+在第一次需要 Gemini 时才导入；命中标定缓存或本地检测成功时不会加载，也不需要 API Key。
+
+调用通过 GeminiClient：
+    - 客户端池：每个进程最多 GEMINI_POOL_SIZE 个长期复用的 genai.Client（连接复用，fork 后重建）
+    - 截止时间：每次检测（含重试和排队）不超过 GEMINI_DEADLINE_SEC，单次请求不超过 GEMINI_ATTEMPT_TIMEOUT_SEC
+    - 重试：超时、连接错误、429 / 5xx 最多尝试 GEMINI_MAX_ATTEMPTS 次，退避时间加随机抖动
+    - 合并：同一裁剪图（内容相同）的并发检测共用一个进行中的请求
+    - 批量：detect_many 把多张裁剪图打包成一个多图请求（每个请求最多 GEMINI_BATCH_SIZE 张）
+
+环境变量：
+    GEMINI_API_KEY   - API Key（第一次请求时才检查）
+    GEMINI_BASE_URL  - 接口地址，测试时指向本地模拟服务（见 fake_gemini_server.py）
+
+使用方法：
+    circles = detect_with_gemini(preprocessed)
+    results = detect_many_with_gemini([crop1, crop2, crop3])
+"""
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from queue import Empty, LifoQueue
+
+import cv2
+import httpx
+from google import genai
+from google.genai import errors, types
+
+GEMINI_MODEL = "gemini-2.5-flash"
+GEMINI_POOL_SIZE = 4  # 每个进程的客户端数（同时进行的请求数上限）
+GEMINI_DEADLINE_SEC = 60.0  # 一次检测的总时限（含排队、重试和退避）
+GEMINI_ATTEMPT_TIMEOUT_SEC = 20.0  # 单次请求的超时
+GEMINI_MAX_ATTEMPTS = 3  # 最多尝试次数
+GEMINI_BACKOFF_SEC = 1.0  # 第 n 次重试前等待 [0, GEMINI_BACKOFF_SEC * 2^(n-1)] 内的随机时间
+GEMINI_RETRY_STATUS = {408, 429, 500, 502, 503, 504}  # 可重试的 HTTP 状态码
+GEMINI_BATCH_SIZE = 8  # 多图请求每次最多的图片数
+GEMINI_JPEG_QUALITY = 90
+
+PROMPT = """帮我标出图上 10 分 30 分 20 分的6个得分圆圈
+
+返回JSON格式:
+[{"box_2d": [y1, x1, y2, x2], "label": "10"}, ...]
+坐标使用0-1000归一化值"""
+
+BATCH_PROMPT = """以下 {count} 张图片，帮我分别标出每张图上 10 分 30 分 20 分的6个得分圆圈
+
+按图片顺序返回JSON格式:
+[{{"image": 1, "circles": [{{"box_2d": [y1, x1, y2, x2], "label": "10"}}, ...]}}, ...]
+坐标使用0-1000归一化值（相对于各自的图片）"""
+
+
+def encode_image(image):
+    """裁剪图 → JPEG 字节"""
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, GEMINI_JPEG_QUALITY])
+    return buffer.tobytes()
+
+
+def parse_boxes(boxes, shape):
+    """Gemini 返回的归一化框 → 圆圈列表 [{'score', 'center'}, ...]（裁剪图坐标）"""
+    h, w = shape[:2]
+    scale_x = w / 1000
+    scale_y = h / 1000
+
+    circles = []
+    for box in boxes:
+        y1, x1, y2, x2 = box['box_2d']
+        label = str(box.get('label', '10'))
+
+        # 计算中心点（像素坐标）
+        cx = int((x1 + x2) / 2 * scale_x)
+        cy = int((y1 + y2) / 2 * scale_y)
+
+        # 提取分数
+        score_match = re.search(r'\d+', label)
+        score = int(score_match.group()) if score_match else 10
+
+        circles.append({
+            'score': score,
+            'center': [cx, cy]
+        })
+    return circles
+
+
+def _parse_json(text):
+    json_match = re.search(r'\[[\s\S]*\]', text or '')
+    if not json_match:
+        raise ValueError(f"无法解析 Gemini 响应: {(text or '')[:200]}")
+    return json.loads(json_match.group())
+
+
+def is_retryable(error):
+    """超时、连接错误和 429 / 5xx 可以重试；参数错误、认证失败、响应无法解析不重试"""
+    if isinstance(error, errors.APIError):
+        return error.code in GEMINI_RETRY_STATUS
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError))
+
+
+class GeminiClient:
+    """
+    Gemini 调用：客户端池 + 截止时间 + 重试 + 并发合并
+
+    Args:
+        pool_size: 客户端数
+        deadline: 每次检测的总时限（秒）
+        attempt_timeout: 单次请求的超时（秒）
+        max_attempts: 最多尝试次数
+        backoff: 重试退避的基准时间（秒）
+        base_url: 接口地址，None 时使用环境变量 GEMINI_BASE_URL 或 SDK 默认地址
+    """
+
+    def __init__(self, pool_size=GEMINI_POOL_SIZE, deadline=GEMINI_DEADLINE_SEC,
+                 attempt_timeout=GEMINI_ATTEMPT_TIMEOUT_SEC, max_attempts=GEMINI_MAX_ATTEMPTS,
+                 backoff=GEMINI_BACKOFF_SEC, base_url=None):
+        self.pool_size = pool_size
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.base_url = base_url or os.environ.get("GEMINI_BASE_URL")
+        self.idle = LifoQueue()  # 空闲的客户端，最近用过的优先（连接仍然有效）
+        self.created = 0
+        self.inflight = {}  # 裁剪图哈希 → Future（进行中的请求）
+        self.lock = threading.Lock()
+        self.stats = {'detections': 0, 'requests': 0, 'retries': 0, 'coalesced': 0,
+                      'batched_images': 0, 'clients': 0, 'failures': 0}
+
+    def _new_client(self):
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("请设置环境变量 GEMINI_API_KEY，获取地址: https://aistudio.google.com/apikey")
+        http_options = types.HttpOptions(base_url=self.base_url) if self.base_url else None
+        return genai.Client(api_key=api_key, http_options=http_options)
+
+    def _acquire(self, deadline_at):
+        """取一个空闲客户端，池未满时新建，已满时等待（不超过截止时间）"""
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+        with self.lock:
+            if self.created < self.pool_size:
+                self.created += 1
+                self.stats['clients'] += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._new_client()
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+        try:
+            return self.idle.get(timeout=max(0.0, deadline_at - time.monotonic()))
+        except Empty:
+            raise TimeoutError(f"Gemini 客户端池已满，{self.deadline:.0f}s 内没有空闲客户端") from None
+
+    def _generate(self, parts, deadline_at):
+        """
+        发送一个请求（必要时重试），返回响应文本
+        每次尝试的超时为 attempt_timeout 与剩余时间中的较小值
+        """
+        client = self._acquire(deadline_at)
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Gemini 请求超过截止时间 ({self.deadline:.0f}s)")
+                timeout = min(self.attempt_timeout, remaining)
+                with self.lock:
+                    self.stats['requests'] += 1
+                try:
+                    response = client.models.generate_content(
+                        model=GEMINI_MODEL,
+                        contents=[types.Content(role="user", parts=parts)],
+                        config=types.GenerateContentConfig(
+                            temperature=0.1,
+                            http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+                        ),
+                    )
+                    return response.text
+                except Exception as e:
+                    if attempt == self.max_attempts or not is_retryable(e):
+                        with self.lock:
+                            self.stats['failures'] += 1
+                        raise
+                    # 退避（加随机抖动，避免多个进程同时重试），不超过截止时间
+                    delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+                    if time.monotonic() + delay >= deadline_at:
+                        with self.lock:
+                            self.stats['failures'] += 1
+                        raise TimeoutError(f"Gemini 请求超过截止时间 ({self.deadline:.0f}s): {e}") from e
+                    with self.lock:
+                        self.stats['retries'] += 1
+                    time.sleep(delay)
+        finally:
+            self.idle.put(client)
+
+    def _single_flight(self, key, fn, deadline_at):
+        """同一 key 的并发调用只执行一次 fn，其余调用等待并共用结果"""
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+            else:
+                self.stats['coalesced'] += 1
+
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    del self.inflight[key]
+        try:
+            return copy.deepcopy(future.result(timeout=max(0.0, deadline_at - time.monotonic())))
+        except FutureTimeoutError:
+            raise TimeoutError(f"等待进行中的 Gemini 请求超过截止时间 ({self.deadline:.0f}s)") from None
+
+    def detect(self, image):
+        """
+        检测一张裁剪图上的圆圈
+        返回: 圆圈列表 [{'score': 10, 'center': [x, y]}, ...]（裁剪图坐标）
+        """
+        deadline_at = time.monotonic() + self.deadline
+        data = encode_image(image)
+        with self.lock:
+            self.stats['detections'] += 1
+
+        def request():
+            parts = [types.Part.from_bytes(data=data, mime_type="image/jpeg"),
+                     types.Part.from_text(text=PROMPT)]
+            return parse_boxes(_parse_json(self._generate(parts, deadline_at)), image.shape)
+
+        return self._single_flight(hashlib.sha1(data).hexdigest(), request, deadline_at)
+
+    def detect_many(self, images, batch_size=GEMINI_BATCH_SIZE):
+        """
+        检测多张裁剪图：每 batch_size 张打包成一个多图请求
+        返回: 与 images 顺序相同的圆圈列表；某张图在响应中缺失时为 None
+        """
+        results = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            if len(chunk) == 1:
+                results.append(self.detect(chunk[0]))
+                continue
+
+            deadline_at = time.monotonic() + self.deadline
+            parts = []
+            for i, image in enumerate(chunk):
+                parts.append(types.Part.from_text(text=f"图片 {i + 1}:"))
+                parts.append(types.Part.from_bytes(data=encode_image(image), mime_type="image/jpeg"))
+            parts.append(types.Part.from_text(text=BATCH_PROMPT.format(count=len(chunk))))
+            with self.lock:
+                self.stats['detections'] += len(chunk)
+                self.stats['batched_images'] += len(chunk)
+
+            by_image = {}
+            for item in _parse_json(self._generate(parts, deadline_at)):
+                if isinstance(item, dict) and 'image' in item:
+                    by_image[int(item['image'])] = item.get('circles', [])
+            results.extend(parse_boxes(by_image[i + 1], image.shape) if i + 1 in by_image else None
+                           for i, image in enumerate(chunk))
+        return results
+
+    def summary(self):
+        """调用统计：检测次数、请求数、重试、合并、批量图片数、客户端数、失败次数"""
+        with self.lock:
+            return dict(self.stats)
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """当前进程共用的 GeminiClient（第一次使用时创建，fork 出的子进程重新创建）"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = GeminiClient()
+            _client_pid = os.getpid()
+        return _client
+
+
+def detect_with_gemini(image):
+    """
+    阶段1：使用 Gemini 检测圆圈位置
+    返回: 圆圈列表 [{'score': 10, 'center': [x, y]}, ...]
+    """
+    return get_client().detect(image)
+
+
+def detect_many_with_gemini(images):
+    """多张裁剪图打包成多图请求检测，返回与 images 顺序相同的圆圈列表（缺失为 None）"""
+    return get_client().detect_many(images)
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+分阶段性能统计 - 各阶段耗时、帧率、峰值内存、写入字节数
+
+在 profile() 范围内，被 @timed 装饰的函数和 stage() 代码块会记录：
+    calls         - 调用次数
+    seconds       - 累计墙钟时间
+    frames / fps  - 处理的帧数与帧率（有帧数的阶段）
+    bytes_written - 写入文件的字节数
+    peak_rss_mb   - 阶段结束时进程的峰值常驻内存
+不在 profile() 范围内时都是空操作，不影响正常运行。
+
+汇总结果写入 scoring_result.json 的 'metrics'，Web 应用通过 /metrics 以
+Prometheus 文本格式导出，也可以保存为 Chrome trace（chrome://tracing / Perfetto 打开）。
+
+使用方法：
+    with profile(trace=True) as profiler:
+        run_scoring(...)
+    profiler.summary()
+    profiler.write_trace("trace.json")
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_active = None  # 当前的 Profiler（整个进程共享，标定线程的阶段也计入）
+
+
+def peak_rss_mb():
+    """进程的峰值常驻内存（MB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageHandle:
+    """stage() 代码块中用于补充帧数和写入字节数"""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes_written = 0
+
+    def add_file(self, path):
+        """记录写入的文件大小"""
+        if os.path.exists(path):
+            self.bytes_written += os.path.getsize(path)
+
+
+class Profiler:
+    """
+    分阶段统计
+
+    Args:
+        trace: 是否记录 Chrome trace 事件
+    """
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.stages = OrderedDict()
+        self.trace_events = []
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, frames=0, bytes_written=0, start=None):
+        """记录一次阶段测量；start 为 perf_counter 起点，给出时写入 trace"""
+        rss = peak_rss_mb()
+        with self.lock:
+            s = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'frames': 0,
+                                              'bytes_written': 0, 'peak_rss_mb': None})
+            s['calls'] += 1
+            s['seconds'] += seconds
+            s['frames'] += frames
+            s['bytes_written'] += bytes_written
+            s['peak_rss_mb'] = rss
+
+            if self.trace and start is not None:
+                self.trace_events.append({
+                    'name': name,
+                    'ph': 'X',
+                    'ts': (start - self.origin) * 1e6,
+                    'dur': seconds * 1e6,
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident(),
+                    'args': {'frames': frames, 'bytes_written': bytes_written},
+                })
+
+    @contextmanager
+    def stage(self, name):
+        handle = StageHandle()
+        start = time.perf_counter()
+        try:
+            yield handle
+        finally:
+            self.record(name, time.perf_counter() - start, handle.frames,
+                        handle.bytes_written, start)
+
+    def summary(self):
+        """各阶段汇总：{阶段: {calls, seconds, frames, fps, bytes_written, peak_rss_mb}}"""
+        with self.lock:
+            result = OrderedDict()
+            for name, s in self.stages.items():
+                result[name] = dict(s)
+                result[name]['seconds'] = round(s['seconds'], 6)
+                if s['frames']:
+                    result[name]['fps'] = round(s['frames'] / s['seconds'], 1) if s['seconds'] else None
+            return result
+
+    def write_trace(self, path):
+        """保存为 Chrome trace 文件"""
+        with self.lock:
+            events = list(self.trace_events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+
+@contextmanager
+def profile(trace=False):
+    """在此范围内启用分阶段统计（可嵌套，内层结束后恢复外层）"""
+    global _active
+    previous = _active
+    profiler = Profiler(trace=trace)
+    _active = profiler
+    try:
+        yield profiler
+    finally:
+        _active = previous
+
+
+@contextmanager
+def stage(name):
+    """统计一个代码块；未启用统计时返回不记录的 StageHandle"""
+    profiler = _active
+    if profiler is None:
+        yield StageHandle()
+        return
+    with profiler.stage(name) as handle:
+        yield handle
+
+
+def record(name, seconds, frames=0, bytes_written=0, start=None):
+    """
+    直接记录一次测量（如逐帧累加的解码 / 帧差时间）
+    start 为 perf_counter 起点，给出时写入 trace（累加的时间不要给出）
+    """
+    if _active is not None:
+        _active.record(name, seconds, frames, bytes_written, start)
+
+
+def timed(name):
+    """装饰器：把整个函数作为一个阶段统计"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            with _active.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsRegistry:
+    """
+    跨任务累计的阶段统计（Web 应用的 /metrics）
+    每个任务结束后 add(任务的 summary)
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.tasks = 0
+        self.lock = threading.Lock()
+
+    def add(self, summary):
+        with self.lock:
+            self.tasks += 1
+            for name, s in (summary or {}).items():
+                acc = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'frames': 0,
+                                                    'bytes_written': 0, 'peak_rss_mb': 0.0})
+                acc['calls'] += s.get('calls', 0)
+                acc['seconds'] += s.get('seconds', 0.0)
+                acc['frames'] += s.get('frames', 0)
+                acc['bytes_written'] += s.get('bytes_written', 0)
+                acc['peak_rss_mb'] = max(acc['peak_rss_mb'], s.get('peak_rss_mb') or 0.0)
+
+    def render_prometheus(self, prefix='tennis'):
+        """Prometheus 文本格式"""
+        metrics = [
+            ('stage_calls_total', 'counter', '阶段调用次数', 'calls', 1),
+            ('stage_seconds_total', 'counter', '阶段累计耗时（秒）', 'seconds', 1),
+            ('stage_frames_total', 'counter', '阶段处理的帧数', 'frames', 1),
+            ('stage_bytes_written_total', 'counter', '阶段写入的字节数', 'bytes_written', 1),
+            ('stage_peak_rss_bytes', 'gauge', '阶段结束时工作进程的峰值常驻内存', 'peak_rss_mb', 1024 * 1024),
+        ]
+        lines = [
+            f"# HELP {prefix}_tasks_total 已完成统计的任务数",
+            f"# TYPE {prefix}_tasks_total counter",
+        ]
+        with self.lock:
+            lines.append(f"{prefix}_tasks_total {self.tasks}")
+            for metric, kind, help_text, key, scale in metrics:
+                lines.append(f"# HELP {prefix}_{metric} {help_text}")
+                lines.append(f"# TYPE {prefix}_{metric} {kind}")
+                for name, s in self.stages.items():
+                    lines.append(f'{prefix}_{metric}{{stage="{name}"}} {s[key] * scale:g}')
+        return "\n".join(lines) + "\n"
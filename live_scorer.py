@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实时计分 - 摄像头 / RTSP 视频流
+
+逐帧读取视频流，只保留最近 LIVE_RING_FRAMES 帧的幕布区域（预分配的环形缓冲），
+运动量和击中识别都是增量计算（OnlineHitDetector，EWMA 基线）。
+峰值之后 LIVE_CONFIRM_FRAMES 帧没有更大的运动量即确认击中，
+立即在缓冲中的峰值帧上定位球并计分，然后发布事件：
+    - 回调函数 on_event(event)
+    - 命令行模式下每个事件输出一行 JSON（stdout）
+    - Web 应用的 /api/live/events（Server-Sent Events）
+
+延迟（latency_ms）从峰值帧被读入开始计算，30fps、确认 2 帧时约 70ms + 处理时间。
+--track 时要等峰值之后 BALL_TRACK_WINDOW 帧读入后才定位并发布（完整的跟踪窗口），
+30fps 时延迟约 135ms + 处理时间。
+
+使用方法：
+    python live_scorer.py 0                                # 摄像头 0
+    python live_scorer.py rtsp://192.168.1.10/stream       # 网络视频流
+    python live_scorer.py hit.mov --realtime               # 按原速回放本地视频（测试用）
+    python live_scorer.py hit.mov --circles output/circles_config.json --track
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from detect_circles_final import detect_circles
+from detect_hit_score import (
+    get_curtain_roi, detect_ball_in_frame, OnlineHitDetector, MotionKernel,
+    COOLDOWN_SEC, HIT_TOLERANCE
+)
+from ball_tracker import localize_in_crops, BALL_TRACK_WINDOW
+from calibration_cache import CalibrationCache
+from score_map import SCORE_POLICY, score_map_for
+from resolution import WorkResolution, WORK_WIDTH
+
+LIVE_RING_FRAMES = 32  # 环形缓冲保存的最近幕布区域帧数
+LIVE_CONFIRM_FRAMES = 2  # 峰值之后多少帧没有更大的运动量即确认击中
+LIVE_THRESHOLD_FACTOR = 3.0  # EWMA 基线的阈值系数（基线逐帧更新、含击中尖峰，只反映最近的噪声，比全局统计的系数高）
+LIVE_TARGET_LATENCY_MS = 150  # 目标延迟（超过时在状态中计数）
+LIVE_DEFAULT_FPS = 30.0  # 视频流未报告帧率时使用
+LIVE_HISTORY = 256  # EventHub 保留的最近事件数
+
+OUTPUT_DIR = "/Users/tgg_ai_studio/Desktop/tennis_score/output"
+
+
+def open_capture(source):
+    """打开视频流：纯数字为摄像头编号，其他为文件路径或流地址"""
+    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 实时流只要最新的帧
+    if not cap.isOpened():
+        raise OSError(f"无法打开视频流: {source}")
+    return cap
+
+
+def grab_first_frame(source, output_path):
+    """从视频流中读取一帧保存为图片（用于圆圈检测）"""
+    cap = open_capture(source)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        raise OSError(f"无法从视频流读取画面: {source}")
+    cv2.imwrite(output_path, frame)
+    return output_path
+
+
+class FrameRing:
+    """
+    预分配的环形缓冲：保存最近 capacity 帧的幕布区域图像及读入时间
+    帧号 idx 存放在 idx % capacity 槽位，写入时复制，不再分配内存
+    """
+
+    def __init__(self, capacity, shape):
+        self.capacity = capacity
+        self.frames = np.zeros((capacity,) + tuple(shape), np.uint8)
+        self.indices = np.full(capacity, -1, np.int64)
+        self.times = np.zeros(capacity, np.float64)
+
+    def push(self, idx, timestamp, image):
+        slot = idx % self.capacity
+        np.copyto(self.frames[slot], image)
+        self.indices[slot] = idx
+        self.times[slot] = timestamp
+
+    def get(self, idx):
+        """返回 (图像, 读入时间)，已被覆盖时返回 None"""
+        slot = idx % self.capacity
+        if self.indices[slot] != idx:
+            return None
+        return self.frames[slot], self.times[slot]
+
+    def window(self, first, last):
+        """返回 [first, last] 内仍在缓冲中的帧 [(帧号, 图像), ...]"""
+        result = []
+        for idx in range(max(0, first), last + 1):
+            item = self.get(idx)
+            if item is not None:
+                result.append((idx, item[0]))
+        return result
+
+
+class EventHub:
+    """
+    事件广播：实时计分线程发布事件，任意数量的订阅者（SSE 连接）按序号等待新事件
+    只保留最近 LIVE_HISTORY 个事件
+    """
+
+    def __init__(self, history=LIVE_HISTORY):
+        self.events = deque(maxlen=history)
+        self.seq = 0
+        self.cond = threading.Condition()
+
+    def publish(self, event):
+        with self.cond:
+            self.seq += 1
+            self.events.append(dict(event, seq=self.seq))
+            self.cond.notify_all()
+
+    def wait(self, after_seq, timeout=15):
+        """等待序号大于 after_seq 的事件，返回新事件列表（超时返回空列表）"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > after_seq, timeout=timeout)
+            return [e for e in self.events if e['seq'] > after_seq]
+
+
+class LiveScorer:
+    """
+    实时计分器
+
+    Args:
+        source: 摄像头编号、流地址或本地视频
+        circles_config: 圆圈配置
+        on_event: 每个事件的回调 on_event(event)
+        realtime: 按视频帧率节流（回放本地视频时模拟实时流）
+        confirm_frames: 峰值确认帧数，见 OnlineHitDetector
+        track: 在缓冲中峰值前后的帧上跟踪球的轨迹定位击中点（见 ball_tracker.py），
+               事件推迟到峰值之后 BALL_TRACK_WINDOW 帧读入后发布
+        ring_frames: 环形缓冲帧数
+        threshold_factor / cooldown_sec / hit_tolerance / score_policy: 检测与计分参数
+        work_width: 运动检测和球检测的工作分辨率宽度上限（见 resolution.py）
+    """
+
+    def __init__(self, source, circles_config, on_event=None, realtime=False,
+                 confirm_frames=LIVE_CONFIRM_FRAMES, track=False, ring_frames=LIVE_RING_FRAMES,
+                 threshold_factor=LIVE_THRESHOLD_FACTOR, cooldown_sec=COOLDOWN_SEC,
+                 hit_tolerance=HIT_TOLERANCE, score_policy=SCORE_POLICY, work_width=WORK_WIDTH):
+        self.source = source
+        self.circles_config = circles_config
+        self.on_event = on_event
+        self.realtime = realtime
+        self.confirm_frames = confirm_frames
+        self.track = track
+        self.ring_frames = max(ring_frames, confirm_frames + 2 * BALL_TRACK_WINDOW + 1)
+        self.threshold_factor = threshold_factor
+        self.cooldown_sec = cooldown_sec
+        self.hit_tolerance = hit_tolerance
+        self.score_policy = score_policy
+        self.work_width = work_width
+
+        self.running = False
+        self.stats = {'frames': 0, 'events': 0, 'total_score': 0,
+                      'max_latency_ms': 0.0, 'mean_latency_ms': 0.0, 'late_events': 0}
+
+    def stop(self):
+        self.running = False
+
+    def run(self, max_frames=None):
+        """读取视频流直到结束或 stop()，返回统计信息"""
+        cap = open_capture(self.source)
+        fps = cap.get(cv2.CAP_PROP_FPS) or LIVE_DEFAULT_FPS
+        w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        x1, y1, x2, y2 = get_curtain_roi(self.circles_config)
+        x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+        self.curtain_roi = (x1, y1, x2, y2)
+
+        # 容差按视频宽度换算；运动量在工作分辨率上计算，环形缓冲保存原分辨率的幕布区域
+        resolution = self.resolution = WorkResolution(w, self.work_width)
+        self.score_map = score_map_for(self.circles_config,
+                                       resolution.source_length(self.hit_tolerance), self.score_policy)
+        ksize = resolution.blur_ksize
+
+        detector = OnlineHitDetector(fps, self.threshold_factor, self.cooldown_sec,
+                                     mode='ewma', confirm_frames=self.confirm_frames)
+        ring = FrameRing(self.ring_frames, (y2 - y1, x2 - x1, 3))
+        kernel = MotionKernel(resolution.scale, ksize)
+        waiting = deque()  # --track：已确认、等待峰值之后的跟踪窗口读入的事件
+        started = time.perf_counter()
+        self.running = True
+        frame_idx = 0
+
+        try:
+            while self.running and (max_frames is None or frame_idx < max_frames):
+                if self.realtime:
+                    delay = started + frame_idx / fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                now = time.perf_counter()
+                curtain = frame[y1:y2, x1:x2]
+                ring.push(frame_idx, now, curtain)
+
+                motion = float(kernel(curtain)[0])
+
+                for event in detector.update(motion):
+                    if self.track:
+                        waiting.append(event)
+                    else:
+                        self._publish(event, ring, fps)
+                while waiting and frame_idx >= waiting[0]['idx'] + BALL_TRACK_WINDOW:
+                    self._publish(waiting.popleft(), ring, fps)
+                frame_idx += 1
+                self.stats['frames'] = frame_idx
+
+            # 视频结束：跟踪窗口不完整的事件用缓冲中已有的帧定位
+            waiting.extend(detector.finish())
+            while waiting:
+                self._publish(waiting.popleft(), ring, fps)
+        finally:
+            cap.release()
+            self.running = False
+
+        return dict(self.stats)
+
+    def _publish(self, event, ring, fps):
+        """在缓冲中的峰值帧上定位球、计分，发布事件"""
+        idx = event['idx']
+        item = ring.get(idx)
+        if item is None:
+            ball_pos, method, captured = None, 'none', time.perf_counter()
+        elif self.track:
+            window = ring.window(idx - BALL_TRACK_WINDOW, idx + BALL_TRACK_WINDOW)
+            located = localize_in_crops(window, idx, self.curtain_roi, self.resolution)
+            ball_pos, method, captured = located['pos'], located['method'], item[1]
+        else:
+            ball_pos = detect_ball_in_frame(item[0], self.curtain_roi, cropped=True,
+                                            resolution=self.resolution)
+            method, captured = 'peak', item[1]
+
+        scored, score, _ = self.score_map.lookup(ball_pos)
+        latency_ms = (time.perf_counter() - captured) * 1000
+
+        stats = self.stats
+        stats['events'] += 1
+        stats['total_score'] += score
+        stats['mean_latency_ms'] += (latency_ms - stats['mean_latency_ms']) / stats['events']
+        stats['max_latency_ms'] = max(stats['max_latency_ms'], latency_ms)
+        if latency_ms > LIVE_TARGET_LATENCY_MS:
+            stats['late_events'] += 1
+
+        result = {
+            'type': 'hit',
+            'index': stats['events'],
+            'frame_idx': idx,
+            'time': idx / fps,
+            'ball_pos': ball_pos,
+            'scored': scored,
+            'score': score,
+            'total_score': stats['total_score'],
+            'method': method,
+            'latency_ms': round(latency_ms, 1),
+        }
+        if self.on_event is not None:
+            self.on_event(result)
+
+
+def load_live_circles(source, output_dir, circles_path=None, cache=None):
+    """
+    实时模式的圆圈配置：指定文件 > 输出目录下已有的 circles_config.json > 从视频流抓一帧检测
+    """
+    if circles_path is None:
+        circles_path = os.path.join(output_dir, "circles_config.json")
+    if os.path.exists(circles_path):
+        with open(circles_path, 'r') as f:
+            return json.load(f)
+
+    os.makedirs(output_dir, exist_ok=True)
+    first_frame = grab_first_frame(source, os.path.join(output_dir, "live_frame.jpg"))
+    return detect_circles(first_frame, output_dir, cache=cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网球实时计分（摄像头 / 视频流）")
+    parser.add_argument("source", help="摄像头编号、流地址（rtsp://...）或本地视频")
+    parser.add_argument("--circles", help="圆圈配置文件（默认使用输出目录下的配置，没有时自动检测）")
+    parser.add_argument("-o", "--output", default=OUTPUT_DIR, help="输出目录")
+    parser.add_argument("--realtime", action="store_true", help="按视频帧率回放（本地视频测试用）")
+    parser.add_argument("-t", "--track", action="store_true", help="多帧跟踪球的轨迹定位击中点")
+    parser.add_argument("--confirm", type=int, default=LIVE_CONFIRM_FRAMES,
+                        help=f"峰值确认帧数（默认 {LIVE_CONFIRM_FRAMES}）")
+    parser.add_argument("--max-frames", type=int, default=None, help="最多处理的帧数")
+    parser.add_argument("--work-width", type=int, default=WORK_WIDTH,
+                        help=f"工作分辨率宽度上限（默认 {WORK_WIDTH}，0 表示按原分辨率处理）")
+
+    args = parser.parse_args()
+
+    # stdout 只输出事件：圆圈检测的进度信息改为输出到 stderr
+    cache = CalibrationCache(os.path.join(args.output, "calibration_cache.json"))
+    with contextlib.redirect_stdout(sys.stderr):
+        circles = load_live_circles(args.source, args.output, args.circles, cache)
+
+    def emit(event):
+        # stdout 只输出事件（JSON Lines），状态信息输出到 stderr
+        print(json.dumps(event, ensure_ascii=False), flush=True)
+
+    scorer = LiveScorer(args.source, circles, on_event=emit, realtime=args.realtime,
+                        confirm_frames=args.confirm, track=args.track,
+                        work_width=args.work_width or None)
+    print(f"实时计分: {args.source}（Ctrl+C 结束）", file=sys.stderr)
+    try:
+        stats = scorer.run(max_frames=args.max_frames)
+    except KeyboardInterrupt:
+        scorer.stop()
+        stats = scorer.stats
+
+    print(f"结束: {stats['frames']} 帧, {stats['events']} 次击中, 总得分 {stats['total_score']}, "
+          f"平均延迟 {stats['mean_latency_ms']:.1f}ms, 最大延迟 {stats['max_latency_ms']:.1f}ms",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
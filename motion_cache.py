@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+运动信号缓存 - 调整阈值 / 冷却时间 / 容差后重新计分无需再次解码
+
+每个视频的运动量序列和候选击中帧（只保存幕布区域图像）保存为一个 .npz 文件，
+按 视频内容哈希 + 幕布区域 + 解码选项 索引。
+缓存目录超过容量上限时，按最近使用时间淘汰最旧的文件。
+
+文件内容：
+    idx    - 帧号 (int64)
+    time   - 时间（秒）
+    motion - 运动量 (float64)
+    fps    - 运动序列的采样帧率
+    crop_idx / crops - 候选击中帧（运动量局部极大帧和击中帧）的帧号与幕布区域 BGR 图像
+    regions / region_boxes - 各区域运动量 [帧数, 区域数] 与区域矩形（见 region_motion.py，可选）
+    filled / fill_std - 自适应跳帧补上的帧号与安静帧运动量的标准差（可选，见 AdaptiveScan.fill）
+
+区域由圆圈配置决定，不计入文件名：读取时要求区域的缓存文件必须带有相同的区域，
+否则视为未命中（重新解码后覆盖）；不要求区域的调用（如 param_sweep）可以使用任何文件。
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+MOTION_CACHE_VERSION = 2  # 运动量计算方式变化时递增，使旧缓存失效
+MOTION_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 缓存目录容量上限（2GB）
+MOTION_CACHE_MAX_CROPS = 256  # 每个视频最多保存的候选帧数
+
+_digest_cache = {}
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """视频文件内容的 SHA-256（同一进程内按 路径 + 大小 + 修改时间 复用）"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _digest_cache:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        _digest_cache[key] = h.hexdigest()
+    return _digest_cache[key]
+
+
+def remember_digest(path, digest):
+    """登记已知的内容哈希（如上传时边写边算的），之后 file_digest 不再读取整个文件"""
+    stat = os.stat(path)
+    _digest_cache[(os.path.abspath(path), stat.st_size, stat.st_mtime)] = digest
+
+
+class MotionCache:
+    """
+    运动信号缓存
+
+    Args:
+        cache_dir: 缓存目录
+        max_bytes: 缓存目录容量上限
+    """
+
+    def __init__(self, cache_dir, max_bytes=MOTION_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path_for(self, video_path, curtain_roi, options=None):
+        """缓存文件路径：内容哈希 + 幕布区域 + 解码选项"""
+        key = json.dumps({
+            'version': MOTION_CACHE_VERSION,
+            'roi': [int(v) for v in curtain_roi],
+            'options': options or {},
+        }, sort_keys=True)
+        suffix = hashlib.sha256(key.encode()).hexdigest()[:12]
+        return os.path.join(self.cache_dir, f"{file_digest(video_path)[:24]}_{suffix}.npz")
+
+    def load(self, video_path, curtain_roi, options=None, regions=None):
+        """
+        读取缓存
+        regions: MotionRegions，传入时每帧附加 'regions'，缓存中没有相同区域时视为未命中
+        返回：(每帧运动量（不含 'frame'）, fps, 候选帧 {帧号: 幕布区域图像})，未命中返回 None
+        """
+        path = self.path_for(video_path, curtain_roi, options)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                idx = data['idx']
+                times = data['time']
+                motion = data['motion']
+                fps = float(data['fps'])
+                crops = dict(zip(data['crop_idx'].tolist(), data['crops']))
+                filled = data['filled'] if 'filled' in data else None
+                fill_std = float(data['fill_std']) if 'fill_std' in data else 0.0
+                region_sums = None
+                if regions is not None:
+                    if 'region_boxes' not in data or data['region_boxes'].tolist() != regions.key():
+                        return None
+                    region_sums = data['regions']
+        except (OSError, ValueError, KeyError):
+            return None
+
+        os.utime(path)  # 更新最近使用时间
+        frames_data = [
+            {'idx': i, 'time': t, 'motion': m}
+            for i, t, m in zip(idx.tolist(), times.tolist(), motion.tolist())
+        ]
+        if region_sums is not None:
+            for entry, row in zip(frames_data, region_sums):
+                entry['regions'] = row
+        if filled is not None:
+            for i in filled.tolist():
+                frames_data[i]['filled'] = True
+                frames_data[i]['fill_std'] = fill_std
+        return frames_data, fps, crops
+
+    def save(self, video_path, curtain_roi, frames_data, fps, crops=None, options=None, regions=None):
+        """保存运动序列、候选帧和各区域运动量（regions 不为 None 时），之后按容量上限淘汰旧缓存"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(video_path, curtain_roi, options)
+
+        crops = crops or {}
+        crop_idx = sorted(crops)
+        if crop_idx:
+            crop_array = np.stack([crops[i] for i in crop_idx])
+        else:
+            crop_array = np.zeros((0, 0, 0, 3), np.uint8)
+
+        extra = {}
+        filled = [i for i, f in enumerate(frames_data) if f.get('filled')]
+        if filled:
+            extra['filled'] = np.array(filled, np.int64)  # 自适应跳帧补上的帧（下标）
+            extra['fill_std'] = np.float64(frames_data[filled[0]].get('fill_std', 0.0))
+        if regions is not None:
+            extra['region_boxes'] = np.array(regions.key(), np.int64)
+            extra['regions'] = np.array([f['regions'] for f in frames_data], np.int64).reshape(-1, len(regions))
+
+        tmp_path = f"{path[:-4]}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            idx=np.array([f['idx'] for f in frames_data], np.int64),
+            time=np.array([f['time'] for f in frames_data], np.float64),
+            motion=np.array([f['motion'] for f in frames_data], np.float64),
+            fps=np.float64(fps),
+            crop_idx=np.array(crop_idx, np.int64),
+            crops=crop_array,
+            **extra
+        )
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """缓存目录超过容量上限时删除最久未使用的文件"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz') and '.tmp.' not in name:
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+参数扫描 - 在标注视频上评估 阈值系数 × 冷却时间 × 击中容差 的组合
+
+每个视频只解码一次（命中运动信号缓存时不解码），
+之后所有参数组合都在同一条运动量序列上计算：
+    - 全局均值 / 标准差只算一次，阈值系数只改变阈值
+    - 击中帧用 find_hit_indices 在数组上查找
+    - 所有组合的击中帧取并集，每帧只检测一次球的位置
+    - 每个容差的得分查找表只构建一次，所有球位置批量查表（见 score_map.py）
+    - 找不到球的击中与 detect_and_score 相同，按区域运动量定位的圆圈计分
+      （detect_hit_score.score_hit，--no-motion-fallback 关闭）
+多个视频在进程池中并行处理。
+
+标注文件格式（JSON，路径相对于标注文件所在目录，score 为 0 表示未得分）：
+    [
+      {"video": "hit1.mov", "circles": "hit1_circles.json",
+       "hits": [{"time": 2.35, "score": 10}, {"time": 4.10, "score": 0}]},
+      ...
+    ]
+
+使用方法：
+    python param_sweep.py labels.json
+    python param_sweep.py labels.json --threshold 1.0:2.5:0.25 --cooldown 0.8,1.0,1.5 --tolerance 5:25:5
+    python param_sweep.py labels.json -j 4 --csv sweep.csv --json sweep.json
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from detect_hit_score import (
+    get_curtain_roi, detect_motion_streaming, find_hit_indices, detect_ball_in_frame, motion_options,
+    score_hit, MOTION_THRESHOLD_FACTOR, COOLDOWN_SEC, HIT_TOLERANCE, MOTION_FALLBACK
+)
+from frame_source import read_frames
+from motion_cache import MotionCache
+from region_motion import MotionRegions
+from resolution import WorkResolution
+from score_map import SCORE_POLICIES, SCORE_POLICY, score_map_for
+
+MATCH_WINDOW_SEC = 0.2  # 预测击中与标注击中的最大时间差（秒）
+
+
+def parse_grid(spec):
+    """解析参数网格：'start:stop:step'（包含 stop）或逗号分隔的列表"""
+    if ':' in spec:
+        start, stop, step = (float(v) for v in spec.split(':'))
+        count = int(round((stop - start) / step)) + 1
+        return [round(start + k * step, 6) for k in range(count)]
+    return [float(v) for v in spec.split(',')]
+
+
+def load_labels(labels_path):
+    """读取标注文件，视频和圆圈配置路径换算为绝对路径"""
+    with open(labels_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(labels_path))
+    for entry in entries:
+        entry['video'] = os.path.join(base, entry['video'])
+        entry['circles'] = os.path.join(base, entry['circles'])
+    return entries
+
+
+def load_motion(video_path, curtain_roi, resolution, cache_dir=None, regions=None):
+    """
+    读取运动量序列（工作分辨率与 detect_and_score 相同，共用运动信号缓存）：
+    优先使用运动信号缓存，未命中时解码一次并写入缓存
+    regions: MotionRegions，传入时同时读取各区域运动量
+    返回：(帧号数组, 运动量数组, 各区域运动量 [帧数, 区域数] 或 None, fps,
+          候选帧 {帧号: 幕布区域图像}, 是否命中缓存)
+    """
+    options = motion_options(resolution)
+    cache = MotionCache(cache_dir) if cache_dir else None
+    cached = cache.load(video_path, curtain_roi, options, regions) if cache else None
+
+    if cached is not None:
+        frames_data, fps, crops = cached
+    else:
+        crops = {}
+        frames_data, fps, _ = detect_motion_streaming(
+            video_path, curtain_roi, max_candidates=0, crop_store=crops, regions=regions, **options
+        )
+        if cache:
+            cache.save(video_path, curtain_roi, frames_data, fps, crops, options, regions)
+
+    idx = np.array([f['idx'] for f in frames_data], np.int64)
+    motion = np.array([f['motion'] for f in frames_data], np.float64)
+    region_sums = np.array([f['regions'] for f in frames_data], np.float64) if regions is not None else None
+    return idx, motion, region_sums, fps, crops, cached is not None
+
+
+def score_matrix(positions, circles_config, tolerances, policy=SCORE_POLICY, resolution=None):
+    """
+    批量计分：每个容差的得分查找表只构建一次，所有球位置一次查表
+    positions: [(x, y) 或 None, ...]
+    resolution: WorkResolution，容差为参考分辨率下的像素时按视频宽度换算
+    返回：得分矩阵 [球位置, 容差]
+    """
+    scores = np.zeros((len(positions), len(tolerances)), np.int64)
+    found = [k for k, p in enumerate(positions) if p is not None]
+    if not found:
+        return scores
+
+    pts = np.array([positions[k] for k in found], np.float64)
+    for t, tolerance in enumerate(tolerances):
+        if resolution is not None:
+            tolerance = resolution.source_length(tolerance)
+        scores[found, t] = score_map_for(circles_config, tolerance, policy).score_batch(pts)[0]
+    return scores
+
+
+def match_hits(pred_times, label_times, window=MATCH_WINDOW_SEC):
+    """
+    按时间匹配预测击中与标注击中：每个预测按时间顺序匹配最近的、尚未匹配的标注
+    返回：[(预测下标, 标注下标), ...]
+    """
+    label_times = np.asarray(label_times, np.float64)
+    used = np.zeros(len(label_times), bool)
+    pairs = []
+    for i, t in enumerate(pred_times):
+        gap = np.abs(label_times - t)
+        gap[used] = np.inf
+        if len(gap) and gap.min() <= window:
+            j = int(np.argmin(gap))
+            used[j] = True
+            pairs.append((i, j))
+    return pairs
+
+
+def evaluate_video(task):
+    """
+    在一个标注视频上评估全部参数组合（进程池的工作函数）
+    返回：{'video', 'frames', 'fps', 'decode_sec', 'cached', 'rows': [每个组合的计数]}
+    """
+    entry, factors, cooldowns, tolerances, window, cache_dir, policy, motion_fallback = task
+
+    with open(entry['circles'], 'r') as f:
+        circles_config = json.load(f)
+    curtain_roi = get_curtain_roi(circles_config)
+    resolution = WorkResolution.for_video(entry['video'])
+    regions = MotionRegions(circles_config, curtain_roi, resolution) if motion_fallback else None
+
+    start = time.perf_counter()
+    idx, motion, region_sums, fps, crops, cached = load_motion(entry['video'], curtain_roi, resolution,
+                                                               cache_dir, regions)
+    decode_sec = time.perf_counter() - start
+
+    label_times = [h['time'] for h in entry['hits']]
+    label_scores = np.array([h.get('score', 0) for h in entry['hits']], np.int64)
+
+    # 全局统计量只算一次（与 batch_threshold 相同）
+    mean, std = np.mean(motion), np.std(motion)
+    peaks = {}
+    for factor in factors:
+        for cooldown in cooldowns:
+            peaks[factor, cooldown] = find_hit_indices(motion, fps, mean + factor * std, cooldown)
+
+    # 所有组合的击中帧取并集，每帧只检测一次球
+    union = sorted({int(p) for arr in peaks.values() for p in arr})
+    frame_ids = [int(idx[p]) for p in union]
+    fetched = read_frames(entry['video'], [i for i in frame_ids if i not in crops], seek=True)
+    positions = []
+    for i in frame_ids:
+        if i in crops:
+            positions.append(detect_ball_in_frame(crops[i], curtain_roi, cropped=True,
+                                                  resolution=resolution))
+        elif fetched.get(i) is not None:
+            positions.append(detect_ball_in_frame(fetched[i], curtain_roi, resolution=resolution))
+        else:
+            positions.append(None)
+    scores = score_matrix(positions, circles_config, tolerances, policy, resolution)
+    row_of = {p: k for k, p in enumerate(union)}
+
+    rows = []
+    for (factor, cooldown), arr in peaks.items():
+        pred_rows = [row_of[int(p)] for p in arr]
+        pred_table = scores[pred_rows]
+        if regions is not None and len(arr):
+            # 区域定位依赖本组合的全部击中（与 find_hit_events 相同），找不到球的击中按 score_hit 计分
+            located = regions.localize(region_sums[arr], region_sums)
+            for k, (row, (circle_idx, _)) in enumerate(zip(pred_rows, located)):
+                if positions[row] is None:
+                    pred_table[k] = score_hit(None, circles_config, None, circle_idx, motion_fallback)[1]
+        pairs = match_hits(idx[arr] / fps if len(arr) else [], label_times, window)
+        for t, tolerance in enumerate(tolerances):
+            pred_scores = pred_table[:, t]
+            rows.append({
+                'threshold_factor': factor,
+                'cooldown_sec': cooldown,
+                'hit_tolerance': tolerance,
+                'predicted': len(arr),
+                'labelled': len(label_times),
+                'matched': len(pairs),
+                'score_correct': sum(int(pred_scores[i] == label_scores[j]) for i, j in pairs),
+                'predicted_total': int(pred_scores.sum()),
+                'labelled_total': int(label_scores.sum()),
+            })
+
+    return {
+        'video': entry['video'],
+        'frames': len(motion),
+        'fps': fps,
+        'decode_sec': decode_sec,
+        'cached': cached,
+        'rows': rows,
+    }
+
+
+def aggregate(video_results):
+    """
+    汇总所有视频的计数，计算每个参数组合的指标：
+        precision / recall / f1 - 击中检测（按时间匹配）
+        score_accuracy          - 标注击中中被检测到且得分正确的比例
+        total_error             - 各视频总得分绝对误差之和
+    """
+    keys = ('threshold_factor', 'cooldown_sec', 'hit_tolerance')
+    summary = {}
+    for result in video_results:
+        for row in result['rows']:
+            key = tuple(row[k] for k in keys)
+            acc = summary.setdefault(key, dict(zip(keys, key), predicted=0, labelled=0,
+                                               matched=0, score_correct=0, total_error=0))
+            for k in ('predicted', 'labelled', 'matched', 'score_correct'):
+                acc[k] += row[k]
+            acc['total_error'] += abs(row['predicted_total'] - row['labelled_total'])
+
+    rows = []
+    for acc in summary.values():
+        precision = acc['matched'] / acc['predicted'] if acc['predicted'] else 0.0
+        recall = acc['matched'] / acc['labelled'] if acc['labelled'] else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        acc.update(
+            precision=precision,
+            recall=recall,
+            f1=f1,
+            score_accuracy=acc['score_correct'] / acc['labelled'] if acc['labelled'] else 0.0,
+        )
+        rows.append(acc)
+
+    rows.sort(key=lambda r: (-r['f1'], -r['score_accuracy'], r['total_error'],
+                             r['threshold_factor'], r['cooldown_sec'], r['hit_tolerance']))
+    return rows
+
+
+def run_sweep(entries, factors, cooldowns, tolerances, window=MATCH_WINDOW_SEC,
+              workers=1, cache_dir=None, policy=SCORE_POLICY, motion_fallback=MOTION_FALLBACK):
+    """对所有标注视频运行参数扫描，返回 (每个视频的结果, 汇总指标)"""
+    tasks = [(entry, factors, cooldowns, tolerances, window, cache_dir, policy, motion_fallback)
+             for entry in entries]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            video_results = list(pool.map(evaluate_video, tasks))
+    else:
+        video_results = [evaluate_video(task) for task in tasks]
+    return video_results, aggregate(video_results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="击中检测参数扫描")
+    parser.add_argument("labels", help="标注文件（JSON）")
+    parser.add_argument("--threshold", default="1.0:3.0:0.25",
+                        help="阈值系数网格，start:stop:step 或逗号列表")
+    parser.add_argument("--cooldown", default="0.5:2.0:0.25",
+                        help="冷却时间网格（秒）")
+    parser.add_argument("--tolerance", default="0:30:5",
+                        help="击中容差网格（像素，1920 宽度下，按视频分辨率换算）")
+    parser.add_argument("--match-window", type=float, default=MATCH_WINDOW_SEC,
+                        help=f"预测与标注击中的最大时间差（秒，默认 {MATCH_WINDOW_SEC}）")
+    parser.add_argument("--policy", choices=SCORE_POLICIES, default=SCORE_POLICY,
+                        help=f"圆圈重叠时的裁决规则（默认 {SCORE_POLICY}）")
+    parser.add_argument("--no-motion-fallback", action="store_true",
+                        help="找不到球的击中不按区域运动量定位的圆圈计分（对应 detect_and_score 的 motion_fallback）")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="并行处理的视频数")
+    parser.add_argument("--cache-dir", default="output/motion_cache",
+                        help="运动信号缓存目录（空字符串表示不缓存）")
+    parser.add_argument("--top", type=int, default=10, help="显示前 N 个组合")
+    parser.add_argument("--json", help="结果保存路径（JSON）")
+    parser.add_argument("--csv", help="汇总指标保存路径（CSV）")
+
+    args = parser.parse_args()
+    entries = load_labels(args.labels)
+    factors = parse_grid(args.threshold)
+    cooldowns = parse_grid(args.cooldown)
+    tolerances = parse_grid(args.tolerance)
+
+    print("=" * 60)
+    print("击中检测参数扫描")
+    print("=" * 60)
+    print(f"标注视频: {len(entries)} 个")
+    print(f"参数组合: {len(factors)} × {len(cooldowns)} × {len(tolerances)} = "
+          f"{len(factors) * len(cooldowns) * len(tolerances)}")
+    print("-" * 60)
+
+    start = time.perf_counter()
+    video_results, rows = run_sweep(entries, factors, cooldowns, tolerances,
+                                    args.match_window, args.workers, args.cache_dir or None,
+                                    args.policy, MOTION_FALLBACK and not args.no_motion_fallback)
+    elapsed = time.perf_counter() - start
+
+    for result in video_results:
+        source = "缓存" if result['cached'] else f"解码 {result['decode_sec']:.1f}s"
+        print(f"  {os.path.basename(result['video'])}: {result['frames']} 帧 ({source})")
+    print(f"  总耗时: {elapsed:.1f}s")
+
+    print("-" * 60)
+    print(f"{'阈值':>6} {'冷却':>6} {'容差':>6} {'精确率':>8} {'召回率':>8} {'F1':>6} {'得分准确':>8} {'总分误差':>8}")
+    for r in rows[:args.top]:
+        print(f"{r['threshold_factor']:>6.2f} {r['cooldown_sec']:>6.2f} {r['hit_tolerance']:>6.0f} "
+              f"{r['precision']:>8.2%} {r['recall']:>8.2%} {r['f1']:>6.3f} "
+              f"{r['score_accuracy']:>8.2%} {r['total_error']:>8}")
+
+    default = next((r for r in rows
+                    if (r['threshold_factor'], r['cooldown_sec'], r['hit_tolerance'])
+                    == (MOTION_THRESHOLD_FACTOR, COOLDOWN_SEC, HIT_TOLERANCE)), None)
+    if default is not None:
+        print(f"\n当前默认参数 ({MOTION_THRESHOLD_FACTOR}, {COOLDOWN_SEC}, {HIT_TOLERANCE}): "
+              f"F1 {default['f1']:.3f}, 得分准确 {default['score_accuracy']:.2%}, "
+              f"总分误差 {default['total_error']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'videos': video_results, 'summary': rows}, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存: {args.json}")
+    if args.csv:
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"汇总已保存: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+分区域运动量 - 帧差的积分图一次求出每个得分圆圈和幕布边缘带的运动量
+
+运动检测每帧只算一次帧差；对帧差求积分图（cv2.integral）后，任意矩形区域的运动量
+只需 4 次查表，因此在整个幕布运动量（积分图右下角，与 np.sum 相同）之外，
+同时得到每个区域的运动序列，几乎不增加耗时。
+
+区域（工作分辨率下的幕布区域坐标，左闭右开）：
+    圆圈 0..N-1  - 各得分圆圈的外接正方形（顺序与圆圈配置相同）
+    边缘带       - 幕布区域上 / 下 / 左 / 右宽 REGION_BAND_WIDTH 的边缘（圆圈之外的背景）
+
+击中定位：击中瞬间幕布整体抖动（或晃动、有人经过）时所有区域的运动量都增加，
+只看绝对运动量无法区分击中的圆圈。把每次击中峰值帧的区域运动量与本视频所有击中的
+中位数剖面比较，偏离（球带来的运动，或球遮挡了抖动的圆圈边缘而减少）以各区域在击中之间的
+离散度（MAD，加上逐帧噪声作为下限）为单位；某个圆圈的偏离足够大（REGION_MIN_Z）
+且明显大于其它所有区域（含边缘带，REGION_MIN_CONTRAST 倍）时定位为该圆圈，否则不定位。
+
+使用方法：
+    regions = MotionRegions(circles_config, curtain_roi, resolution)
+    total, sums = regions.sums(cv2.absdiff(prev, gray))    # sums: [区域数]（逐帧计算见 detect_hit_score.MotionKernel）
+    located = regions.localize(profiles)                    # profiles: [击中数, 区域数]
+"""
+import cv2
+import numpy as np
+
+from resolution import WorkResolution, REFERENCE_WIDTH
+
+REGION_BAND_WIDTH = 20  # 边缘带宽度（参考分辨率下的像素，与 get_curtain_roi 的外扩边距相同）
+REGION_BANDS = ('top', 'bottom', 'left', 'right')
+REGION_MIN_HITS = 3  # 击中少于该次数时没有可靠的中位数剖面，不定位
+REGION_MIN_Z = 4.0  # 圆圈的偏离至少为击中之间离散度的倍数
+REGION_MIN_CONTRAST = 1.5  # 圆圈的偏离至少为其余区域最大偏离的倍数
+
+
+class MotionRegions:
+    """
+    圆圈和边缘带的矩形区域，以及帧差上的分区域求和
+
+    Args:
+        circles_config: 圆圈配置（原图坐标）
+        curtain_roi: 幕布区域 (x1, y1, x2, y2)（原图坐标）
+        resolution: WorkResolution，None 时按原图计算
+        decode_scale: 解码阶段的缩放比例（decode_options 的 scale），帧差在工作分辨率上再缩小该比例
+    """
+
+    def __init__(self, circles_config, curtain_roi, resolution=None, decode_scale=1.0):
+        if resolution is None:
+            resolution = WorkResolution(REFERENCE_WIDTH)
+        cx1, cy1, cx2, cy2 = curtain_roi
+        self.decode_scale = decode_scale
+        s = resolution.scale * decode_scale
+        self.n_circles = len(circles_config)
+        self.names = [f"circle_{i}" for i in range(self.n_circles)] + list(REGION_BANDS)
+
+        boxes = []
+        for c in circles_config:
+            x = (c['center'][0] - cx1) * s
+            y = (c['center'][1] - cy1) * s
+            r = c['radius'] * s
+            boxes.append([int(np.floor(x - r)), int(np.floor(y - r)),
+                          int(np.ceil(x + r)) + 1, int(np.ceil(y + r)) + 1])
+
+        # 边缘带按幕布区域缩小后的尺寸定义，超出实际帧差尺寸的部分在 sums 中裁掉
+        w = int(round((cx2 - cx1) * s))
+        h = int(round((cy2 - cy1) * s))
+        band = max(1, int(round(resolution.work_length(REGION_BAND_WIDTH) * decode_scale)))
+        boxes += [[0, 0, w, band], [0, h - band, w, h], [0, 0, band, h], [w - band, 0, w, h]]
+        self.boxes = np.array(boxes, np.int64)
+        self.shape = (h, w)  # 缩小后的幕布区域尺寸（实际帧差可能因取整相差 1 像素）
+        self._clipped = {}  # 帧差尺寸 → (裁剪后的角点下标, 面积)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def key(self):
+        """区域的描述（用于运动信号缓存的键）"""
+        return self.boxes.tolist()
+
+    def _clip(self, shape):
+        """按帧差尺寸裁剪区域，返回 ((y1, x1, y2, x2) 下标数组, 面积)"""
+        clipped = self._clipped.get(shape)
+        if clipped is None:
+            h, w = shape[:2]
+            b = self.boxes.copy()
+            b[:, [0, 2]] = np.clip(b[:, [0, 2]], 0, w)
+            b[:, [1, 3]] = np.clip(b[:, [1, 3]], 0, h)
+            area = np.maximum(1, (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]))
+            clipped = self._clipped[shape] = ((b[:, 1], b[:, 0], b[:, 3], b[:, 2]), area)
+        return clipped
+
+    def areas(self):
+        """各区域的面积（像素）"""
+        return self._clip(self.shape)[1]
+
+    @staticmethod
+    def integral_buffer(shape):
+        """帧差尺寸为 shape 时积分图的预分配缓冲（每帧复用，传给 sums 的 integral）"""
+        h, w = shape[:2]
+        return np.empty((h + 1, w + 1), np.int32 if h * w < (1 << 23) else np.float64)
+
+    def sums(self, diff, integral=None):
+        """
+        帧差的整体运动量和各区域运动量
+        integral: 可选的预分配积分图缓冲（integral_buffer），写入其中而不是每帧新建
+        返回：(整体运动量 int, 各区域运动量 [区域数] int64)
+        """
+        if integral is None:
+            integral = self.integral_buffer(diff.shape)
+        cv2.integral(diff, sum=integral, sdepth=cv2.CV_32S if integral.dtype == np.int32 else cv2.CV_64F)
+        y1, x1, y2, x2 = self._clip(diff.shape[:2])[0]
+        sums = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+        return int(integral[-1, -1]), sums.astype(np.int64)
+
+    def localize(self, profiles, series=None, min_hits=REGION_MIN_HITS, min_z=REGION_MIN_Z,
+                 min_contrast=REGION_MIN_CONTRAST):
+        """
+        按区域运动量定位每次击中的圆圈
+        profiles: [击中数, 区域数]，各击中峰值帧的区域运动量
+        series: 可选的 [帧数, 区域数] 全部帧的区域运动量，用于估计逐帧噪声（离散度的下限）
+        返回：[(圆圈下标或 None, 偏离倍数), ...]
+        """
+        profiles = np.asarray(profiles, np.float64).reshape(-1, len(self))
+        if len(profiles) < min_hits or self.n_circles == 0:
+            return [(None, 0.0)] * len(profiles)
+
+        noise = 1.0
+        if series is not None and len(series):
+            series = np.asarray(series, np.float64).reshape(-1, len(self))
+            noise = 1.4826 * np.median(np.abs(series - np.median(series, axis=0)), axis=0) + 1.0
+
+        # 相对所有击中的中位数剖面的偏离，以击中之间的离散度为单位
+        deviation = np.abs(profiles - np.median(profiles, axis=0))
+        z = deviation / (1.4826 * np.median(deviation, axis=0) + noise)
+
+        located = []
+        for row in z:
+            best = int(np.argmax(row[:self.n_circles]))
+            runner_up = np.delete(row, best).max() if len(row) > 1 else 0.0
+            ok = row[best] >= min_z and row[best] >= min_contrast * runner_up
+            located.append((best if ok else None, round(float(row[best]), 2)))
+        return located
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标注图片按需渲染 - 计分时只记录渲染所需的信息，图片在第一次被请求时才生成
+
+计分时（render_images=False）不再绘制和写入整帧 JPEG，而是由调用方用 record_render_info
+在输出目录的 render.json 中记录渲染所需的信息：第一帧路径、视频路径、圆圈配置、
+每次击中的帧号 / 时间 / 球位置 / 得分。
+
+可渲染的文件（输出目录下）：
+    detected_circles_final.jpg   - 圆圈检测结果
+    preprocessed.jpg             - 裁剪放大后的幕布区域
+    hit_event_N.jpg              - 第 N 次击中（按帧号从视频中读取该帧）
+    <以上或 first_frame>.thumb.jpg - 宽度 RENDER_THUMB_WIDTH 的缩略图
+
+RenderCache.get 只返回 <任务目录>/ 下的 first_frame、detected_circles_final、hit_event_N
+图片及其缩略图（is_servable），输出目录中的其它文件（render.json、圆圈配置等）不对外提供。
+
+渲染结果写入输出目录作为缓存，RenderCache 统计其总大小，超过上限时删除最久未访问的
+（只删除可以重新渲染的文件）。
+
+使用方法：
+    cache = RenderCache(OUTPUT_FOLDER)
+    path = cache.get("task_id/hit_event_1.thumb.jpg")   # 不存在时渲染，不可渲染或不对外提供时返回 None
+
+    python render_cache.py output/                      # 渲染输出目录中全部图片
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+import cv2
+
+from detect_circles_final import annotate_circles, extract_first_frame, preprocess_image
+from detect_hit_score import draw_result, get_curtain_roi
+from frame_source import read_frames
+
+RENDER_MANIFEST = "render.json"
+RENDER_CACHE_MAX_BYTES = 512 * 1024 ** 2  # 渲染图片缓存上限（512MB）
+RENDER_THUMB_WIDTH = 480  # 缩略图宽度
+RENDER_JPEG_QUALITY = 90
+RENDER_THUMB_QUALITY = 80
+
+_HIT_PATTERN = re.compile(r'^hit_event_(\d+)$')
+
+
+def record_render_info(output_dir, video_path, first_frame_path, circles, events):
+    """
+    记录渲染输出目录中图片所需的信息（render.json）
+    events: detect_and_score 返回的击中事件（含 frame_idx）
+    """
+    manifest = {
+        'image': os.path.abspath(first_frame_path),
+        'video': os.path.abspath(video_path),
+        'circles': circles,
+        'curtain_roi': list(get_curtain_roi(circles)),
+        'hits': [{k: e[k] for k in ('frame_idx', 'time', 'ball_pos', 'scored', 'score')}
+                 for e in events],
+    }
+    path = os.path.join(output_dir, RENDER_MANIFEST)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def load_manifest(output_dir):
+    """读取 render.json，不存在时返回 None"""
+    path = os.path.join(output_dir, RENDER_MANIFEST)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _resolve(output_dir, path):
+    """记录的路径不存在时（输出目录被移动过），在输出目录中按文件名查找"""
+    if not os.path.exists(path):
+        moved = os.path.join(output_dir, os.path.basename(path))
+        if os.path.exists(moved):
+            return moved
+    return path
+
+
+def render_image(output_dir, name, manifest=None):
+    """
+    渲染输出目录中的一张图片（不含扩展名的文件名，如 'hit_event_1'）
+    返回：BGR 图像，无法渲染时返回 None
+    """
+    if manifest is None:
+        manifest = load_manifest(output_dir)
+    if manifest is None:
+        return None
+
+    video_path = _resolve(output_dir, manifest['video'])
+    if name in ('first_frame', 'detected_circles_final', 'preprocessed'):
+        # 复用了已有圆圈配置时没有提取第一帧，从视频读取
+        image_path = _resolve(output_dir, manifest['image'])
+        if not os.path.exists(image_path):
+            if not os.path.exists(video_path) or extract_first_frame(video_path, image_path) is None:
+                return None
+        if name == 'preprocessed':
+            return preprocess_image(image_path)[0]
+        image = cv2.imread(image_path)
+        return annotate_circles(image, manifest['circles']) if name == 'detected_circles_final' else image
+
+    match = _HIT_PATTERN.match(name)
+    if match is None:
+        return None
+    n = int(match.group(1))
+    if not 1 <= n <= len(manifest['hits']) or not os.path.exists(video_path):
+        return None
+    hit = manifest['hits'][n - 1]
+    frame = read_frames(video_path, [hit['frame_idx']], seek=True).get(hit['frame_idx'])
+    if frame is None:
+        return None
+    ball_pos = tuple(hit['ball_pos']) if hit['ball_pos'] else None
+    return draw_result(frame, tuple(manifest['curtain_roi']), manifest['circles'],
+                       ball_pos, hit['scored'], hit['score'], hit['time'])
+
+
+def make_thumbnail(image, width=RENDER_THUMB_WIDTH):
+    """按宽度等比缩小（图片本身更窄时原样返回）"""
+    h, w = image.shape[:2]
+    if w <= width:
+        return image
+    return cv2.resize(image, (width, round(h * width / w)), interpolation=cv2.INTER_AREA)
+
+
+def render_file(path):
+    """
+    渲染一个输出文件（'<输出目录>/<名称>.jpg' 或 '<名称>.thumb.jpg'）并写入磁盘
+    返回：是否成功
+    """
+    output_dir, filename = os.path.split(path)
+    if not filename.endswith('.jpg'):
+        return False
+    name = filename[:-len('.jpg')]
+    thumb = name.endswith('.thumb')
+    if thumb:
+        name = name[:-len('.thumb')]
+
+    # 缩略图优先从已有的整图缩小
+    full_path = os.path.join(output_dir, f"{name}.jpg")
+    image = cv2.imread(full_path) if thumb and os.path.exists(full_path) else None
+    if image is None:
+        image = render_image(output_dir, name)
+    if image is None:
+        return False
+
+    if thumb:
+        image = make_thumbnail(image)
+    quality = RENDER_THUMB_QUALITY if thumb else RENDER_JPEG_QUALITY
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.jpg"
+    cv2.imwrite(tmp_path, image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    os.replace(tmp_path, path)
+    return True
+
+
+def is_renderable(filename):
+    """是否为可以重新渲染的文件名（缓存淘汰只删除这些文件）"""
+    if filename.endswith('.thumb.jpg'):
+        return True
+    name = filename[:-len('.jpg')] if filename.endswith('.jpg') else None
+    return name in ('detected_circles_final', 'preprocessed') or bool(name and _HIT_PATTERN.match(name))
+
+
+def is_servable(relpath):
+    """是否为对外提供的结果图片：<任务目录>/first_frame、圆圈检测或击中图片（含缩略图）"""
+    parts = relpath.split(os.sep)
+    if len(parts) != 2 or not parts[1].endswith('.jpg'):
+        return False
+    name = parts[1][:-len('.jpg')]
+    if name.endswith('.thumb'):
+        name = name[:-len('.thumb')]
+    return name in ('first_frame', 'detected_circles_final') or bool(_HIT_PATTERN.match(name))
+
+
+class RenderCache:
+    """
+    输出目录中渲染图片的缓存（按最近访问时间淘汰）
+
+    Args:
+        root: 输出根目录（各任务的输出目录在其下）
+        max_bytes: 渲染图片总大小上限
+    """
+
+    def __init__(self, root, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.entries = None  # 相对路径 → [大小, 最近访问时间]，第一次使用时扫描
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'renders': 0, 'evictions': 0}
+
+    def _scan(self):
+        self.entries = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            if RENDER_MANIFEST not in filenames:
+                continue
+            for filename in filenames:
+                if is_renderable(filename):
+                    path = os.path.join(dirpath, filename)
+                    stat = os.stat(path)
+                    self.entries[os.path.relpath(path, self.root)] = [stat.st_size, stat.st_atime]
+
+    def get(self, relpath):
+        """
+        取得结果图片的绝对路径：已存在时直接返回，可渲染时先渲染
+        返回：路径，不对外提供（is_servable）、不存在且无法渲染时返回 None
+        """
+        path = os.path.normpath(os.path.join(self.root, relpath))
+        if not path.startswith(self.root + os.sep):
+            return None
+        relpath = os.path.relpath(path, self.root)
+        if not is_servable(relpath):
+            return None
+
+        with self.lock:
+            if self.entries is None:
+                self._scan()
+            if os.path.exists(path):
+                if relpath in self.entries:
+                    self.entries[relpath][1] = time.time()
+                    self.stats['hits'] += 1
+                return path
+
+        if not is_renderable(os.path.basename(path)) or not render_file(path):
+            return None
+
+        with self.lock:
+            self.stats['renders'] += 1
+            self.entries[relpath] = [os.path.getsize(path), time.time()]
+            self._evict(keep=relpath)
+        return path
+
+    def _evict(self, keep=None):
+        total = sum(size for size, _ in self.entries.values())
+        for relpath, (size, _) in sorted(self.entries.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_bytes:
+                break
+            if relpath == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.root, relpath))
+            except OSError:
+                pass
+            del self.entries[relpath]
+            total -= size
+            self.stats['evictions'] += 1
+
+    def summary(self):
+        """缓存统计：文件数、总大小、命中 / 渲染 / 淘汰次数"""
+        with self.lock:
+            if self.entries is None:
+                self._scan()
+            return {
+                'files': len(self.entries),
+                'bytes': sum(size for size, _ in self.entries.values()),
+                'max_bytes': self.max_bytes,
+                **self.stats,
+            }
+
+
+def render_all(output_dir, thumbs=True):
+    """渲染一个输出目录中的全部图片，返回图片路径列表"""
+    manifest = load_manifest(output_dir)
+    if manifest is None:
+        return []
+
+    names = ['detected_circles_final', 'preprocessed']
+    names += [f"hit_event_{i + 1}" for i in range(len(manifest['hits']))]
+    paths = [os.path.join(output_dir, f"{name}.jpg") for name in names]
+    if thumbs:
+        paths += [os.path.join(output_dir, f"{name}.thumb.jpg") for name in names + ['first_frame']]
+
+    return [path for path in paths if os.path.exists(path) or render_file(path)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="渲染输出目录中的标注图片")
+    parser.add_argument("dirs", nargs="+", help="输出目录（含 render.json，或其上级目录）")
+    parser.add_argument("--no-thumbs", action="store_true", help="不生成缩略图")
+    args = parser.parse_args()
+
+    total = 0
+    for root in args.dirs:
+        for dirpath, _, filenames in os.walk(root):
+            if RENDER_MANIFEST in filenames:
+                written = render_all(dirpath, thumbs=not args.no_thumbs)
+                total += len(written)
+                print(f"{dirpath}: {len(written)} 张")
+    print(f"共 {total} 张")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+分辨率换算 - 像素参数按参考分辨率标定，处理在工作分辨率上进行
+
+圆圈半径（RADIUS_CONFIG）、击中容差（HIT_TOLERANCE）、球轮廓面积、帧差前的模糊核、
+轨迹关联距离等像素参数都是在 1920 宽度（REFERENCE_WIDTH）的视频上标定的。
+其它分辨率的视频按宽度比例换算：长度乘以比例，面积乘以比例的平方。
+
+运动检测和球检测在工作分辨率上进行：宽度超过 WORK_WIDTH 的视频（如 4K）
+在解码时就把幕布区域缩小到工作分辨率，球位置再换算回原图坐标。
+计分（圆圈、容差、球位置）始终在原图坐标系中进行。
+
+使用方法：
+    res = WorkResolution(3840)              # 4K 视频，默认工作宽度 1920
+    res.scale                               # 0.5：原图 → 工作分辨率
+    res.source_length(HIT_TOLERANCE)        # 30：原图坐标系中的击中容差
+    res.blur_ksize                          # 5：工作分辨率上的模糊核
+
+本模块只有常量和换算，OpenCV 在需要读取视频或缩放图像时才导入（命令行 --help 不加载）
+"""
+REFERENCE_WIDTH = 1920  # 像素参数标定时的视频宽度
+WORK_WIDTH = 1920  # 运动检测和球检测的工作分辨率宽度上限，None 表示按原分辨率处理
+MOTION_BLUR_KSIZE = 5  # 帧差前高斯模糊的核大小（参考分辨率下）
+
+
+def video_width(video_path):
+    """视频宽度（只读取元信息）"""
+    from frame_source import open_frame_source
+    with open_frame_source(video_path) as source:
+        return source.width
+
+
+class WorkResolution:
+    """
+    原图 → 工作分辨率的换算（工作分辨率只缩小不放大）
+
+    Args:
+        width: 原视频宽度
+        work_width: 工作分辨率宽度上限，None 表示按原分辨率处理
+    """
+
+    def __init__(self, width, work_width=WORK_WIDTH):
+        self.width = width
+        self.scale = min(1.0, work_width / width) if work_width and width else 1.0
+        self.source_ratio = width / REFERENCE_WIDTH if width else 1.0  # 原图一个像素 ↔ 参考分辨率
+        self.work_ratio = self.source_ratio * self.scale  # 工作分辨率一个像素 ↔ 参考分辨率
+
+    @classmethod
+    def for_video(cls, video_path, work_width=WORK_WIDTH):
+        """按视频的宽度创建"""
+        return cls(video_width(video_path), work_width)
+
+    def source_length(self, length):
+        """参考分辨率下的长度 → 原图坐标系中的长度"""
+        return length * self.source_ratio
+
+    def work_length(self, length):
+        """参考分辨率下的长度 → 工作分辨率中的长度"""
+        return length * self.work_ratio
+
+    def work_area(self, area):
+        """参考分辨率下的面积 → 工作分辨率中的面积"""
+        return area * self.work_ratio ** 2
+
+    @property
+    def blur_ksize(self):
+        """工作分辨率上的模糊核大小（奇数，至少 3）"""
+        return max(3, int(round(self.work_length(MOTION_BLUR_KSIZE))) | 1)
+
+    def to_work(self, image):
+        """原图（或裁剪区域）缩小到工作分辨率，与帧源解码时的缩放相同（INTER_AREA）"""
+        if self.scale == 1.0:
+            return image
+        import cv2
+        return cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+    def to_source(self, x, y, offset=(0, 0)):
+        """工作分辨率中的坐标 → 原图坐标（offset 为裁剪区域左上角的原图坐标）"""
+        return x / self.scale + offset[0], y / self.scale + offset[1]
+
+    def describe(self):
+        """打印用的说明"""
+        if self.scale == 1.0:
+            return f"原分辨率 (宽 {self.width})"
+        return f"宽 {self.width} → {int(round(self.width * self.scale))} (×{self.scale:.3f})"
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+计分结果库 - 按视频内容哈希索引的 SQLite 结果存储
+
+同一视频（内容相同）用相同参数计分的结果是确定的，按 视频 SHA-256 + 参数指纹
+保存完整结果，再次上传时直接返回，不再排队处理。
+每次上传（包括直接返回缓存结果的上传）另外记录一条计分记录，保存总分、击中数、选手和日期，
+历史查询（某选手每天的总分等）直接查库，不需要扫描输出目录。
+
+表 results（结果缓存）：
+    sha256 / params_key  - 主键：视频内容哈希 + 参数指纹
+    task_id              - 结果图片所在的输出目录（OUTPUT_FOLDER/<task_id>）
+    created              - 计分时间（时间戳）
+    params / result      - 参数与完整结果（JSON）
+
+表 sessions（计分记录，每次上传一条）：
+    id                   - 自增主键
+    sha256 / params_key  - 对应的结果
+    task_id              - 结果图片所在的输出目录
+    player / video_name  - 选手、原始文件名
+    created / day        - 记录时间（时间戳）与日期（YYYY-MM-DD，本地时间）
+    total_score / hits / scored
+
+使用方法：
+    store = ResultStore("data/results.db")
+    result = store.lookup(sha256, params)           # 未命中返回 None
+    store.save(sha256, params, result, player="张三", video_name="hit.mov")
+    store.record_session(sha256, params, result, player="李四")   # 缓存命中的上传
+    store.daily_totals(player="张三", since="2024-05-01")
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+RESULT_STORE_VERSION = 3  # 结果格式或计分逻辑变化时递增，使旧结果不再命中
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    sha256      TEXT NOT NULL,
+    params_key  TEXT NOT NULL,
+    task_id     TEXT NOT NULL,
+    created     REAL NOT NULL,
+    params      TEXT NOT NULL,
+    result      TEXT NOT NULL,
+    PRIMARY KEY (sha256, params_key)
+);
+CREATE INDEX IF NOT EXISTS results_task ON results (task_id);
+CREATE TABLE IF NOT EXISTS sessions (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256      TEXT NOT NULL,
+    params_key  TEXT NOT NULL,
+    task_id     TEXT NOT NULL,
+    player      TEXT,
+    video_name  TEXT,
+    created     REAL NOT NULL,
+    day         TEXT NOT NULL,
+    total_score INTEGER NOT NULL,
+    hits        INTEGER NOT NULL,
+    scored      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_player_day ON sessions (player, day);
+CREATE INDEX IF NOT EXISTS sessions_day ON sessions (day);
+"""
+
+# 旧版 sessions 表（结果与记录在同一张表，主键 sha256 + params_key）拆分为 results 和 sessions
+_MIGRATE_V1 = """
+ALTER TABLE sessions RENAME TO sessions_v1;
+DROP INDEX IF EXISTS sessions_task;
+DROP INDEX IF EXISTS sessions_player_day;
+DROP INDEX IF EXISTS sessions_day;
+""" + _SCHEMA + """
+INSERT OR IGNORE INTO results SELECT sha256, params_key, task_id, created, params, result FROM sessions_v1;
+INSERT INTO sessions (sha256, params_key, task_id, player, video_name, created, day, total_score, hits, scored)
+    SELECT sha256, params_key, task_id, player, video_name, created, day, total_score, hits, scored
+    FROM sessions_v1 ORDER BY created;
+DROP TABLE sessions_v1;
+"""
+
+_SESSION_COLUMNS = "sha256, task_id, player, video_name, created, day, total_score, hits, scored"
+
+
+def params_key(params):
+    """参数指纹：参数字典（加上 RESULT_STORE_VERSION）按键排序后的 SHA-1 前 16 位"""
+    payload = json.dumps({'version': RESULT_STORE_VERSION, **params}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class ResultStore:
+    """
+    SQLite 结果库（多线程共用：每个线程一个连接）
+
+    Args:
+        path: 数据库文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(sessions)")]
+            conn.executescript(_MIGRATE_V1 if columns and 'id' not in columns else _SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def lookup(self, sha256, params):
+        """按视频内容哈希和参数查找结果，未命中返回 None"""
+        row = self._connect().execute(
+            "SELECT result FROM results WHERE sha256 = ? AND params_key = ?",
+            (sha256, params_key(params))
+        ).fetchone()
+        return json.loads(row['result']) if row else None
+
+    def get_by_task(self, task_id):
+        """按 task_id 查找结果（任务状态过期后查询历史结果），未找到返回 None"""
+        row = self._connect().execute(
+            "SELECT result FROM results WHERE task_id = ? ORDER BY created DESC LIMIT 1", (task_id,)
+        ).fetchone()
+        return json.loads(row['result']) if row else None
+
+    def save(self, sha256, params, result, player=None, video_name=None):
+        """保存一次计分结果（同一视频 + 参数已有结果时覆盖），同时记录这次上传"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, params_key(params), result['task_id'], now,
+                 json.dumps(params, sort_keys=True), json.dumps(result, ensure_ascii=False))
+            )
+            self._insert_session(conn, sha256, params, result, player, video_name, now)
+
+    def record_session(self, sha256, params, result, player=None, video_name=None):
+        """记录一次上传（复用已有结果时，如缓存命中或处理中重复上传）"""
+        with self._connect() as conn:
+            self._insert_session(conn, sha256, params, result, player, video_name, time.time())
+
+    @staticmethod
+    def _insert_session(conn, sha256, params, result, player, video_name, now):
+        events = result.get('events', [])
+        conn.execute(
+            f"INSERT INTO sessions (params_key, {_SESSION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (params_key(params), sha256, result['task_id'], player, video_name, now,
+             datetime.fromtimestamp(now).strftime('%Y-%m-%d'),
+             result['total_score'], len(events), sum(1 for e in events if e['scored']))
+        )
+
+    def list_sessions(self, player=None, since=None, until=None, limit=100, offset=0):
+        """
+        历史计分记录（不含完整结果），按时间倒序
+        since / until: 日期 'YYYY-MM-DD'（含）
+        """
+        where, args = self._filters(player, since, until)
+        rows = self._connect().execute(
+            f"SELECT {_SESSION_COLUMNS} FROM sessions {where} ORDER BY created DESC LIMIT ? OFFSET ?",
+            (*args, limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def daily_totals(self, player=None, since=None, until=None):
+        """每位选手每天的计分次数、总分、击中数和得分次数"""
+        where, args = self._filters(player, since, until)
+        rows = self._connect().execute(
+            f"SELECT day, player, COUNT(*) AS sessions, SUM(total_score) AS total_score, "
+            f"SUM(hits) AS hits, SUM(scored) AS scored FROM sessions {where} "
+            f"GROUP BY day, player ORDER BY day DESC, player",
+            args
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _filters(self, player, since, until):
+        clauses, args = [], []
+        if player is not None:
+            clauses.append("player = ?")
+            args.append(player)
+        if since is not None:
+            clauses.append("day >= ?")
+            args.append(since)
+        if until is not None:
+            clauses.append("day <= ?")
+            args.append(until)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def summary(self):
+        """计分记录数、视频数、选手数"""
+        row = self._connect().execute(
+            "SELECT COUNT(*) AS sessions, COUNT(DISTINCT sha256) AS videos, "
+            "COUNT(DISTINCT player) AS players FROM sessions"
+        ).fetchone()
+        return dict(row)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+得分查找表 - 每个圆圈配置预先计算一次，之后每个球位置 O(1) 查表
+
+对覆盖所有圆圈（含容差）的矩形区域逐像素计算命中的圆圈，保存为标签图：
+    labels[y - y1, x - x1] = 圆圈下标，-1 表示未命中
+球位置按像素取整后直接查表；区域外一律未命中。
+
+多个圆圈（含容差）重叠时按明确的规则裁决：
+    'highest' - 分数最高的圆圈；同分取距圆心最近的（默认）
+    'nearest' - 距圆心最近的圆圈；等距取分数高的
+    'first'   - 圆圈配置中排在前面的（旧版 check_score 的行为）
+以上规则仍相同时取配置中排在前面的圆圈。
+
+使用方法：
+    score_map = score_map_for(circles_config, tolerance=15)
+    scored, score, circle = score_map.lookup((x, y))
+    scores, circle_idx = score_map.score_batch(positions)   # positions: [N, 2]
+"""
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+SCORE_POLICIES = ('highest', 'nearest', 'first')
+SCORE_POLICY = 'highest'  # 默认的重叠裁决规则
+SCORE_MAP_CACHE_SIZE = 16  # score_map_for 最多缓存的查找表数
+_ROW_BLOCK = 64  # 构建查找表时每次处理的行数（限制中间矩阵的内存）
+
+_score_maps = OrderedDict()
+
+
+def resolve_circles(points, circles_config, tolerance, policy=SCORE_POLICY):
+    """
+    精确判定一组球位置命中的圆圈（查找表的构建也使用此函数）
+    points: [N, 2] 坐标
+    返回：圆圈下标数组 [N]，-1 表示未命中
+    """
+    if policy not in SCORE_POLICIES:
+        raise ValueError(f"未知的裁决规则: {policy}，可选: {', '.join(SCORE_POLICIES)}")
+
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    if not circles_config or len(points) == 0:
+        return np.full(len(points), -1, np.int64)
+
+    centers = np.array([c['center'] for c in circles_config], np.float64)
+    radius = np.array([c['radius'] for c in circles_config], np.float64)
+    scores = np.array([c['score'] for c in circles_config], np.float64)
+
+    dist = np.sqrt(((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+    inside = dist <= radius + tolerance
+
+    # 逐级筛选候选圆圈；argmax / argmin 在并列时取下标最小的，即配置中排在前面的
+    if policy == 'first':
+        chosen = np.argmax(inside, axis=1)
+    elif policy == 'highest':
+        best = np.where(inside, scores, -np.inf).max(axis=1, keepdims=True)
+        candidates = inside & (scores == best)
+        chosen = np.argmin(np.where(candidates, dist, np.inf), axis=1)
+    else:
+        masked = np.where(inside, dist, np.inf)
+        candidates = inside & (masked == masked.min(axis=1, keepdims=True))
+        chosen = np.argmax(np.where(candidates, scores, -np.inf), axis=1)
+
+    return np.where(inside.any(axis=1), chosen, -1)
+
+
+class ScoreMap:
+    """
+    圆圈配置的得分查找表
+
+    Args:
+        circles_config: 圆圈配置 [{'center', 'radius', 'score'}, ...]
+        tolerance: 击中判定容差（像素）
+        policy: 重叠裁决规则，见 SCORE_POLICIES
+    """
+
+    def __init__(self, circles_config, tolerance, policy=SCORE_POLICY):
+        self.circles_config = circles_config
+        self.tolerance = tolerance
+        self.policy = policy
+        self.scores = np.array([c['score'] for c in circles_config] + [0], np.int64)
+
+        if not circles_config:
+            self.origin = (0, 0)
+            self.labels = np.full((0, 0), -1, np.int8)
+            return
+
+        reach = [c['radius'] + tolerance for c in circles_config]
+        x1 = int(np.floor(min(c['center'][0] - r for c, r in zip(circles_config, reach))))
+        y1 = int(np.floor(min(c['center'][1] - r for c, r in zip(circles_config, reach))))
+        x2 = int(np.ceil(max(c['center'][0] + r for c, r in zip(circles_config, reach)))) + 1
+        y2 = int(np.ceil(max(c['center'][1] + r for c, r in zip(circles_config, reach)))) + 1
+        self.origin = (x1, y1)
+
+        dtype = np.int8 if len(circles_config) < 127 else np.int32
+        self.labels = np.empty((y2 - y1, x2 - x1), dtype)
+        xs = np.arange(x1, x2)
+        for row in range(y1, y2, _ROW_BLOCK):
+            ys = np.arange(row, min(row + _ROW_BLOCK, y2))
+            grid = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+            block = resolve_circles(grid, circles_config, tolerance, policy)
+            self.labels[row - y1:row - y1 + len(ys)] = block.reshape(len(ys), -1)
+
+    def circle_index(self, positions):
+        """
+        批量查表：positions 为 [N, 2] 坐标（按像素取整）
+        返回：圆圈下标数组 [N]，-1 表示未命中
+        """
+        pts = np.rint(np.asarray(positions, np.float64).reshape(-1, 2)).astype(np.int64)
+        x = pts[:, 0] - self.origin[0]
+        y = pts[:, 1] - self.origin[1]
+        h, w = self.labels.shape
+        valid = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+
+        result = np.full(len(pts), -1, np.int64)
+        result[valid] = self.labels[y[valid], x[valid]]
+        return result
+
+    def score_batch(self, positions):
+        """批量计分，返回：(得分数组, 圆圈下标数组)，未命中得分为 0、下标为 -1"""
+        idx = self.circle_index(positions)
+        return self.scores[idx], idx
+
+    def lookup(self, ball_pos):
+        """
+        单个球位置查表，返回值与 check_score 相同
+        返回：(是否得分, 分数, 命中的圆圈)
+        """
+        if ball_pos is None:
+            return False, 0, None
+        x = int(round(ball_pos[0])) - self.origin[0]
+        y = int(round(ball_pos[1])) - self.origin[1]
+        h, w = self.labels.shape
+        if not (0 <= x < w and 0 <= y < h):
+            return False, 0, None
+        k = int(self.labels[y, x])
+        if k < 0:
+            return False, 0, None
+        circle = self.circles_config[k]
+        return True, circle['score'], circle
+
+
+def score_map_for(circles_config, tolerance, policy=SCORE_POLICY):
+    """按 (圆圈配置, 容差, 裁决规则) 缓存的查找表，同一配置只构建一次"""
+    key = (json.dumps(circles_config, sort_keys=True), float(tolerance), policy)
+    score_map = _score_maps.get(key)
+    if score_map is None:
+        score_map = ScoreMap(circles_config, tolerance, policy)
+        _score_maps[key] = score_map
+        while len(_score_maps) > SCORE_MAP_CACHE_SIZE:
+            _score_maps.popitem(last=False)
+    else:
+        _score_maps.move_to_end(key)
+    return score_map
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成测试视频 - 已知击中时间、位置和得分的网球靶视频
+
+画面：灰色背景 + 浅色幕布 + 6 个红色得分圈（两行，每种分值 2 个，
+半径按 RADIUS_CONFIG 随分辨率缩放，位置在 curtain_crop_box 范围内）。
+每次击中：球从左下方飞向击中点，在击中帧到达，随后反弹离开；
+击中后幕布抖动几帧（运动检测实际看到的就是幕布的运动）。
+可选的干扰：逐帧像素噪声、幕布上静止的黄绿色噪声点。
+
+同一组参数（含 seed）总是生成相同的视频，可以在不同提交之间比较结果。
+
+输出：
+    <视频>.avi                 视频（MJPG）
+    <视频>_circles.json        圆圈配置（与 circles_config.json 格式相同）
+    <视频>_labels.json         标注（param_sweep.py 的标注格式）
+
+使用方法：
+    python synthetic_video.py output/synth.avi
+    python synthetic_video.py output/synth.avi --width 1920 --height 1080 --fps 60 --duration 30 --noise 6
+"""
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+from detect_circles_final import RADIUS_CONFIG, curtain_crop_box
+from detect_hit_score import HIT_TOLERANCE
+from resolution import REFERENCE_WIDTH
+
+SYNTH_VERSION = 2  # 生成逻辑变化时递增（基准测试按参数和版本缓存视频）
+SYNTH_FIRST_HIT_SEC = 1.5  # 第一次击中的时间
+SYNTH_HIT_JITTER_SEC = 0.3  # 击中间隔的随机抖动
+SYNTH_APPROACH_FRAMES = 4  # 击中前球可见的帧数
+SYNTH_BOUNCE_FRAMES = 3  # 击中后球可见的帧数
+SYNTH_SHAKE = (4, 3, 2, 1)  # 击中后幕布逐帧的位移（像素，参考分辨率下）
+SYNTH_NOISE_BANK = 8  # 预生成的噪声帧数（循环使用）
+SYNTH_LAYOUT = [  # 圆圈在幕布裁剪区域中的相对位置 (分值, x, y)
+    (10, 0.2, 0.3), (20, 0.5, 0.3), (30, 0.8, 0.3),
+    (30, 0.2, 0.7), (20, 0.5, 0.7), (10, 0.8, 0.7),
+]
+
+DEFAULT_PARAMS = {
+    'width': 1280,
+    'height': 720,
+    'fps': 30,
+    'duration': 20.0,  # 秒
+    'hit_interval': 2.5,  # 平均击中间隔（秒），应大于冷却时间
+    'miss_ratio': 0.2,  # 打在圆圈外的比例
+    'noise': 2.0,  # 逐帧像素噪声的标准差
+    'distractor': False,  # 幕布上放一个静止的黄绿色噪声点
+    'seed': 0,
+}
+
+
+def synthetic_circles(width, height):
+    """圆圈配置：[{'score', 'center', 'radius'}, ...]（原图坐标）"""
+    x1, y1, x2, y2 = curtain_crop_box(width, height)
+    scale = width / REFERENCE_WIDTH
+    return [
+        {'score': score,
+         'center': [int(x1 + fx * (x2 - x1)), int(y1 + fy * (y2 - y1))],
+         'radius': max(4, int(round(RADIUS_CONFIG[score] * scale)))}
+        for score, fx, fy in SYNTH_LAYOUT
+    ]
+
+
+def plan_hits(params, circles, rng):
+    """
+    击中计划：[{'frame', 'time', 'pos', 'score'}, ...]
+    命中时落点在圆圈半径的一半以内，未命中时落点离所有圆圈都超过半径 + 容差（按分辨率换算）
+    """
+    fps, duration = params['fps'], params['duration']
+    x1, y1, x2, y2 = curtain_crop_box(params['width'], params['height'])
+    margin = HIT_TOLERANCE * params['width'] / REFERENCE_WIDTH + 5
+
+    hits = []
+    t = SYNTH_FIRST_HIT_SEC
+    while t < duration - 1.0:
+        frame = int(round(t * fps))
+        if rng.random() < params['miss_ratio']:
+            while True:
+                pos = (int(rng.uniform(x1 + 10, x2 - 10)), int(rng.uniform(y1 + 10, y2 - 10)))
+                if all(np.hypot(pos[0] - c['center'][0], pos[1] - c['center'][1])
+                       > c['radius'] + margin for c in circles):
+                    break
+            score = 0
+        else:
+            circle = circles[int(rng.integers(len(circles)))]
+            angle = rng.uniform(0, 2 * np.pi)
+            dist = rng.uniform(0, circle['radius'] * 0.5)
+            pos = (int(circle['center'][0] + dist * np.cos(angle)),
+                   int(circle['center'][1] + dist * np.sin(angle)))
+            score = circle['score']
+        hits.append({'frame': frame, 'time': frame / fps, 'pos': pos, 'score': score})
+        t += params['hit_interval'] + rng.uniform(-SYNTH_HIT_JITTER_SEC, SYNTH_HIT_JITTER_SEC)
+    return hits
+
+
+def ball_positions(hits, scale):
+    """每帧球的位置：{帧号: (x, y)}（击中前从左下方飞来，击中后向右下方反弹）"""
+    approach = np.array([18.0, -12.0]) * scale
+    bounce = np.array([14.0, 16.0]) * scale
+    positions = {}
+    for hit in hits:
+        p = np.array(hit['pos'], np.float64)
+        for k in range(SYNTH_APPROACH_FRAMES, 0, -1):
+            positions[hit['frame'] - k] = p - approach * k
+        positions[hit['frame']] = p
+        for k in range(1, SYNTH_BOUNCE_FRAMES + 1):
+            positions[hit['frame'] + k] = p + bounce * k
+    return positions
+
+
+def render_background(width, height, circles):
+    """静态画面：背景 + 幕布 + 圆圈"""
+    img = np.full((height, width, 3), (90, 90, 90), np.uint8)
+    x1, y1, x2, y2 = curtain_crop_box(width, height)
+    cv2.rectangle(img, (x1, y1), (x2, y2), (200, 200, 200), -1)
+    thickness = max(2, width // 640)
+    for c in circles:
+        cv2.circle(img, tuple(c['center']), c['radius'], (0, 0, 255), thickness)
+    return img
+
+
+def generate_video(video_path, **params):
+    """
+    生成合成视频及其圆圈配置和标注
+
+    Returns:
+        {'video', 'circles', 'labels', 'params', 'frames', 'hits': 击中计划}
+    """
+    params = {**DEFAULT_PARAMS, **params}
+    width, height, fps = params['width'], params['height'], params['fps']
+    scale = width / REFERENCE_WIDTH
+    rng = np.random.default_rng(params['seed'])
+
+    circles = synthetic_circles(width, height)
+    hits = plan_hits(params, circles, rng)
+    balls = ball_positions(hits, scale)
+    shake_at = {}
+    for hit in hits:
+        for k, amount in enumerate(SYNTH_SHAKE):
+            shake_at[hit['frame'] + k] = max(1, int(round(amount * scale)))
+
+    background = render_background(width, height, circles)
+    x1, y1, x2, y2 = curtain_crop_box(width, height)
+    ball_radius = max(3, int(round(11 * scale)))
+    distractor = (x1 + (x2 - x1) // 20, y1 + (y2 - y1) // 8)
+    if params['distractor']:
+        cv2.circle(background, distractor, ball_radius, (40, 220, 200), -1)
+
+    noise_bank = []
+    if params['noise'] > 0:
+        for _ in range(SYNTH_NOISE_BANK):
+            noise_bank.append(rng.normal(0, params['noise'], background.shape).astype(np.int16))
+
+    base, _ = os.path.splitext(video_path)
+    os.makedirs(os.path.dirname(os.path.abspath(video_path)), exist_ok=True)
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f"无法写入视频: {video_path}")
+
+    frames = int(params['duration'] * fps)
+    img = np.empty_like(background)
+    try:
+        for i in range(frames):
+            np.copyto(img, background)
+            if i in balls:
+                cv2.circle(img, tuple(int(v) for v in balls[i]), ball_radius, (40, 220, 200), -1)
+            if i in shake_at:
+                # 幕布区域整体平移（边缘复制），模拟被球击中后的抖动
+                d = shake_at[i]
+                M = np.float32([[1, 0, d if i % 2 else -d], [0, 1, d // 2 + 1]])
+                img[y1:y2, x1:x2] = cv2.warpAffine(img[y1:y2, x1:x2], M, (x2 - x1, y2 - y1),
+                                                   borderMode=cv2.BORDER_REPLICATE)
+            if noise_bank:
+                noise = noise_bank[int(rng.integers(len(noise_bank)))]
+                writer.write(np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+            else:
+                writer.write(img)
+    finally:
+        writer.release()
+
+    circles_path = f"{base}_circles.json"
+    with open(circles_path, 'w', encoding='utf-8') as f:
+        json.dump(circles, f, indent=2)
+
+    labels_path = f"{base}_labels.json"
+    with open(labels_path, 'w', encoding='utf-8') as f:
+        json.dump([{
+            'video': video_path,
+            'circles': circles_path,
+            'hits': [{'time': round(h['time'], 4), 'score': h['score']} for h in hits],
+        }], f, indent=2)
+
+    return {'video': video_path, 'circles': circles_path, 'labels': labels_path,
+            'params': params, 'frames': frames, 'hits': hits}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成已知击中时间和得分的合成测试视频")
+    parser.add_argument("video", help="输出视频路径（.avi）")
+    parser.add_argument("--width", type=int, default=DEFAULT_PARAMS['width'], help="画面宽度")
+    parser.add_argument("--height", type=int, default=DEFAULT_PARAMS['height'], help="画面高度")
+    parser.add_argument("--fps", type=int, default=DEFAULT_PARAMS['fps'], help="帧率")
+    parser.add_argument("--duration", type=float, default=DEFAULT_PARAMS['duration'], help="时长（秒）")
+    parser.add_argument("--hit-interval", type=float, default=DEFAULT_PARAMS['hit_interval'],
+                        help="平均击中间隔（秒）")
+    parser.add_argument("--miss-ratio", type=float, default=DEFAULT_PARAMS['miss_ratio'],
+                        help="打在圆圈外的比例")
+    parser.add_argument("--noise", type=float, default=DEFAULT_PARAMS['noise'],
+                        help="逐帧像素噪声的标准差")
+    parser.add_argument("--distractor", action="store_true", help="在幕布上放一个静止的黄绿色噪声点")
+    parser.add_argument("--seed", type=int, default=DEFAULT_PARAMS['seed'], help="随机种子")
+    args = parser.parse_args()
+
+    result = generate_video(
+        args.video, width=args.width, height=args.height, fps=args.fps,
+        duration=args.duration, hit_interval=args.hit_interval, miss_ratio=args.miss_ratio,
+        noise=args.noise, distractor=args.distractor, seed=args.seed
+    )
+
+    print(f"视频: {result['video']} ({args.width}x{args.height}, {args.fps} fps, {result['frames']} 帧)")
+    print(f"圆圈配置: {result['circles']}")
+    print(f"标注: {result['labels']}")
+    print(f"击中: {len(result['hits'])} 次，期望总得分 {sum(h['score'] for h in result['hits'])}")
+    for h in result['hits']:
+        print(f"  {h['time']:6.2f}s  {h['pos']}  → {h['score'] if h['score'] else 'MISS'}")
+
+
+if __name__ == "__main__":
+    main()
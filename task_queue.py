@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+异步任务队列 - 有界进程池 + 进度上报
+
+HTTP 请求线程只负责入队并立即返回 task_id，耗时的抽帧、圆圈检测和视频扫描
+在进程池中执行。排队任务数超过上限时拒绝新任务（背压），由调用方返回 503。
+
+任务状态：
+    queued  - 已入队，等待空闲进程
+    running - 正在处理，stage / message 为当前阶段
+    done    - 完成，result 为结果
+    error   - 失败，error 为错误信息
+
+工作进程中调用 report_progress(stage, message) 上报进度，
+主进程的监听线程更新任务状态并唤醒等待中的 SSE 连接。
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+TASK_TTL_SEC = 3600  # 已结束任务的状态保留时间（秒）
+
+# 工作进程内的进度队列（由进程池 initializer 设置）
+_progress_queue = None
+_current_task_id = None
+
+
+class QueueFullError(Exception):
+    """排队任务已达上限"""
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_task(task_id, fn, args):
+    global _current_task_id
+    _current_task_id = task_id
+    report_progress('running', '开始处理')
+    try:
+        return fn(task_id, *args)
+    finally:
+        _current_task_id = None
+
+
+def report_progress(stage, message=''):
+    """在工作进程中上报当前任务的进度（不在任务队列中运行时为空操作）"""
+    if _progress_queue is not None and _current_task_id is not None:
+        _progress_queue.put((_current_task_id, stage, message))
+
+
+class TaskQueue:
+    """
+    有界进程池任务队列
+
+    Args:
+        workers: 工作进程数
+        max_pending: 最多排队（未开始）的任务数
+        on_done: 可选的回调 on_done(task_id, result)，任务成功后在主进程中调用
+    """
+
+    def __init__(self, workers=2, max_pending=8, on_done=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.on_done = on_done
+        self.tasks = {}
+        self.cond = threading.Condition()
+        self.pool = None
+        self.progress_queue = None
+
+    def _ensure_pool(self):
+        # 延迟创建进程池，避免在导入或 Flask 重载时 fork
+        if self.pool is None:
+            ctx = multiprocessing.get_context()
+            self.progress_queue = ctx.Queue()
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(self.progress_queue,)
+            )
+            threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        while True:
+            task_id, stage, message = self.progress_queue.get()
+            self._update(task_id, status='running', stage=stage, message=message)
+
+    def _update(self, task_id, **fields):
+        with self.cond:
+            task = self.tasks.get(task_id)
+            if task is None or task['status'] in ('done', 'error'):
+                return
+            task.update(fields)
+            task['updated'] = time.time()
+            task['version'] += 1
+            self.cond.notify_all()
+
+    def _on_done(self, task_id, future):
+        exc = future.exception()
+        if exc is not None:
+            self._update(task_id, status='error', stage='error', error=str(exc))
+        else:
+            result = future.result()
+            self._update(task_id, status='done', stage='done', result=result)
+            if self.on_done is not None:
+                self.on_done(task_id, result)
+
+    def _prune(self):
+        now = time.time()
+        for task_id in [t for t, task in self.tasks.items()
+                        if task['status'] in ('done', 'error')
+                        and now - task['updated'] > TASK_TTL_SEC]:
+            del self.tasks[task_id]
+
+    def pending(self):
+        """排队中（未开始）的任务数"""
+        with self.cond:
+            return sum(1 for t in self.tasks.values() if t['status'] == 'queued')
+
+    def active(self):
+        """未结束（排队中或运行中）的任务数"""
+        with self.cond:
+            return sum(1 for t in self.tasks.values() if t['status'] in ('queued', 'running'))
+
+    def is_full(self):
+        """是否已达到背压上限"""
+        return self.active() >= self.workers + self.max_pending
+
+    def submit(self, task_id, fn, *args):
+        """
+        提交任务：fn(task_id, *args) 在工作进程中执行，返回值作为任务结果
+        队列已满时抛出 QueueFullError
+        """
+        with self.cond:
+            self._prune()
+            if self.is_full():
+                raise QueueFullError(f"任务队列已满（{self.max_pending} 个排队中）")
+            now = time.time()
+            self.tasks[task_id] = {
+                'task_id': task_id,
+                'status': 'queued',
+                'stage': 'queued',
+                'message': '排队中',
+                'created': now,
+                'updated': now,
+                'version': 0,
+            }
+
+        self._ensure_pool()
+        future = self.pool.submit(_run_task, task_id, fn, args)
+        future.add_done_callback(lambda f: self._on_done(task_id, f))
+        return task_id
+
+    def complete(self, task_id, result):
+        """登记一个已完成的任务（如直接返回的缓存结果），之后可以通过 get / wait 查询"""
+        with self.cond:
+            self._prune()
+            now = time.time()
+            self.tasks[task_id] = {
+                'task_id': task_id,
+                'status': 'done',
+                'stage': 'done',
+                'message': '',
+                'result': result,
+                'created': now,
+                'updated': now,
+                'version': self.tasks[task_id]['version'] + 1 if task_id in self.tasks else 0,
+            }
+            self.cond.notify_all()
+        return task_id
+
+    def get(self, task_id):
+        """返回任务状态的副本，不存在时返回 None"""
+        with self.cond:
+            task = self.tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def wait(self, task_id, version, timeout=15):
+        """
+        等待任务状态版本号超过 version（用于 SSE 推送）
+        返回最新状态；超时返回当前状态；任务不存在返回 None
+        """
+        with self.cond:
+            self.cond.wait_for(
+                lambda: task_id not in self.tasks or self.tasks[task_id]['version'] > version,
+                timeout=timeout
+            )
+            task = self.tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
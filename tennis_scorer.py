@@ -11,18 +11,17 @@
 使用方法：
     python tennis_scorer.py <视频路径>
     python tennis_scorer.py  # 使用默认视频
+
+核心模块（OpenCV / NumPy）在 run_scoring 中才导入，--help 和参数错误等不计分的路径快速返回
 """
-import cv2
-import numpy as np
 import json
 import sys
 import os
 import argparse
 from datetime import datetime
 
-# 导入核心模块
-from detect_circles_final import detect_circles, extract_first_frame
-from detect_hit_score import detect_and_score
+from instrumentation import profile, stage
+from resolution import WORK_WIDTH
 
 # 默认配置
 DEFAULT_VIDEO = "/Users/tgg_ai_studio/Desktop/tennis_score/hit.mov"
@@ -63,7 +62,20 @@ def print_result(total_score, events):
     print()
 
 
-def run_scoring(video_path, output_dir=None, force_detect_circles=False):
+def print_metrics(metrics):
+    """打印各阶段耗时"""
+    print(f"{'阶段':<22} {'次数':>5} {'耗时(s)':>9} {'帧率':>9} {'写入(KB)':>9} {'峰值内存(MB)':>12}")
+    for name, m in metrics.items():
+        fps = f"{m['fps']:.1f}" if m.get('fps') else '-'
+        rss = f"{m['peak_rss_mb']:.0f}" if m['peak_rss_mb'] is not None else '-'
+        print(f"{name:<22} {m['calls']:>5} {m['seconds']:>9.3f} {fps:>9} "
+              f"{m['bytes_written'] / 1024:>9.1f} {rss:>12}")
+    print()
+
+
+def run_scoring(video_path, output_dir=None, force_detect_circles=False, workers=None,
+                pipeline=False, track_ball=False, trace_path=None, cache_dir=None, render_images=False,
+                work_width=WORK_WIDTH, adaptive=False):
     """
     运行完整的计分流程
 
@@ -71,13 +83,36 @@ def run_scoring(video_path, output_dir=None, force_detect_circles=False):
         video_path: 视频路径
         output_dir: 输出目录
         force_detect_circles: 是否强制重新检测圆圈
+        workers: 运动检测的并行进程数（大于 1 时按时间分段并行）
+        pipeline: 需要检测圆圈时，圆圈检测与运动检测同时进行
+        track_ball: 在峰值前后几帧内跟踪球的轨迹，以折返点作为击中点（见 ball_tracker.py）
+        trace_path: 保存各阶段的 Chrome trace 文件（chrome://tracing 打开）
+        cache_dir: 标定缓存和运动信号缓存所在目录，默认为 output_dir（批量计分时多个视频共用）
+        render_images: 立即渲染标注图片（默认只记录 render.json，图片由 render_cache 按需渲染）
+        work_width: 运动检测和球检测的工作分辨率宽度上限（见 resolution.py），None 表示按原分辨率处理
+        adaptive: 自适应跳帧（串行流式运动检测，见 detect_hit_score.AdaptiveScan；
+                  与 pipeline / workers > 1 同时使用时抛出 ValueError）
 
     Returns:
         total_score: 总得分
         events: 击中事件列表
     """
+    if adaptive and (pipeline or (workers and workers > 1)):
+        raise ValueError("自适应跳帧只用于串行流式运动检测，不能与 pipeline / workers > 1 同时使用")
+
+    # 导入核心模块
+    import cv2
+    from detect_circles_final import detect_circles, extract_first_frame, curtain_crop_box
+    from detect_hit_score import detect_and_score
+    from calibration_cache import CalibrationCache
+    from motion_cache import MotionCache
+    from ball_tracker import locate_ball
+    from render_cache import record_render_info, render_all
+
     if output_dir is None:
         output_dir = OUTPUT_DIR
+    if cache_dir is None:
+        cache_dir = output_dir
 
     os.makedirs(output_dir, exist_ok=True)
 
@@ -86,38 +121,87 @@ def run_scoring(video_path, output_dir=None, force_detect_circles=False):
 
     print_banner()
 
-    # Step 1: 检测圆圈（如果需要）
-    if force_detect_circles or not os.path.exists(circles_config_path):
-        print("[阶段1] 检测得分圆圈...")
-        print("-" * 60)
-
-        # 提取第一帧
-        extract_first_frame(video_path, first_frame_path)
-
-        # 检测圆圈
-        circles = detect_circles(first_frame_path, output_dir)
-        print()
-    else:
-        print("[阶段1] 使用已有的圆圈配置")
-        print(f"    配置文件: {circles_config_path}")
-        with open(circles_config_path, 'r') as f:
-            circles = json.load(f)
-        for c in circles:
-            print(f"    {c['score']}分: 中心{c['center']}, 半径{c['radius']}")
-        print()
-
-    # Step 2: 检测击中并计分
-    print("[阶段2] 检测击中事件并计分...")
-    print("-" * 60)
-
-    total_score, events = detect_and_score(
-        video_path,
-        circles_config_path=circles_config_path,
-        output_dir=output_dir
-    )
+    with profile(trace=trace_path is not None) as profiler:
+        need_detect = force_detect_circles or not os.path.exists(circles_config_path)
+        cache = CalibrationCache(os.path.join(cache_dir, "calibration_cache.json"))
+        motion_cache = MotionCache(os.path.join(cache_dir, "motion_cache"))
+        ball_locator = locate_ball if track_ball else None
+
+        if need_detect and pipeline:
+            # 流水线模式：圆圈检测在后台进行，同时开始解码视频
+            print("[阶段1+2] 检测得分圆圈，同时检测击中事件...")
+            print("-" * 60)
+
+            extract_first_frame(video_path, first_frame_path)
+            h, w = cv2.imread(first_frame_path).shape[:2]
+
+            detected = {}
+
+            def calibrate():
+                detected['circles'] = detect_circles(first_frame_path, output_dir, cache=cache,
+                                                     render_images=False)
+                return detected['circles']
+
+            total_score, events = detect_and_score(
+                video_path,
+                output_dir=output_dir,
+                calibrate=calibrate,
+                calibration_roi=curtain_crop_box(w, h),
+                motion_cache=motion_cache,
+                ball_locator=ball_locator,
+                render_images=False,
+                work_width=work_width
+            )
+            circles = detected['circles']
+        else:
+            # Step 1: 检测圆圈（如果需要）
+            if need_detect:
+                print("[阶段1] 检测得分圆圈...")
+                print("-" * 60)
+
+                # 提取第一帧
+                extract_first_frame(video_path, first_frame_path)
+
+                # 检测圆圈（同一场景复用标定缓存）
+                circles = detect_circles(first_frame_path, output_dir, cache=cache,
+                                         render_images=False)
+                print()
+            else:
+                print("[阶段1] 使用已有的圆圈配置")
+                print(f"    配置文件: {circles_config_path}")
+                with open(circles_config_path, 'r') as f:
+                    circles = json.load(f)
+                for c in circles:
+                    print(f"    {c['score']}分: 中心{c['center']}, 半径{c['radius']}")
+                print()
+
+            # Step 2: 检测击中并计分
+            print("[阶段2] 检测击中事件并计分...")
+            print("-" * 60)
+
+            total_score, events = detect_and_score(
+                video_path,
+                circles_config_path=circles_config_path,
+                output_dir=output_dir,
+                workers=workers,
+                decode_options={'adaptive': True} if adaptive else None,
+                motion_cache=motion_cache,
+                ball_locator=ball_locator,
+                render_images=False,
+                work_width=work_width
+            )
+
+        # 标注图片：记录渲染信息，需要时立即渲染
+        record_render_info(output_dir, video_path, first_frame_path, circles, events)
+        if render_images:
+            with stage('render'):
+                rendered = render_all(output_dir)
+            print(f"[完成] 已渲染 {len(rendered)} 张标注图片")
 
     # 打印结果
     print_result(total_score, events)
+    metrics = profiler.summary()
+    print_metrics(metrics)
 
     # 保存结果
     result = {
@@ -125,13 +209,17 @@ def run_scoring(video_path, output_dir=None, force_detect_circles=False):
         'timestamp': datetime.now().isoformat(),
         'total_score': total_score,
         'events': events,
-        'circles_config': circles
+        'circles_config': circles,
+        'metrics': metrics
     }
 
     result_path = os.path.join(output_dir, "scoring_result.json")
     with open(result_path, 'w', encoding='utf-8') as f:
         json.dump(result, f, indent=2, ensure_ascii=False)
     print(f"[完成] 结果已保存: {result_path}")
+    if trace_path:
+        profiler.write_trace(trace_path)
+        print(f"[完成] Trace 已保存: {trace_path}")
 
     return total_score, events
 
@@ -144,8 +232,25 @@ def main():
                         help="输出目录")
     parser.add_argument("-f", "--force", action="store_true",
                         help="强制重新检测圆圈")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="运动检测的并行进程数（默认串行）")
+    parser.add_argument("-p", "--pipeline", action="store_true",
+                        help="圆圈检测与运动检测同时进行")
+    parser.add_argument("-t", "--track", action="store_true",
+                        help="多帧跟踪球的轨迹定位击中点")
+    parser.add_argument("--trace", default=None,
+                        help="保存各阶段的 Chrome trace 文件")
+    parser.add_argument("--render", action="store_true",
+                        help="立即渲染标注图片（默认按需渲染，见 render_cache.py）")
+    parser.add_argument("-a", "--adaptive", action="store_true",
+                        help="自适应跳帧：空闲时只采样，运动附近逐帧处理（只 grab 跳过的帧；"
+                             "仅串行流式检测，不能与 --pipeline / --workers 同时使用）")
+    parser.add_argument("--work-width", type=int, default=WORK_WIDTH,
+                        help=f"运动检测和球检测的工作分辨率宽度上限（默认 {WORK_WIDTH}，0 表示按原分辨率处理）")
 
     args = parser.parse_args()
+    if args.adaptive and (args.pipeline or (args.workers and args.workers > 1)):
+        parser.error("--adaptive 只用于串行流式运动检测，不能与 --pipeline / --workers 同时使用")
 
     if not os.path.exists(args.video):
         print(f"错误: 视频文件不存在: {args.video}")
@@ -154,7 +259,14 @@ def main():
     total_score, events = run_scoring(
         args.video,
         output_dir=args.output,
-        force_detect_circles=args.force
+        force_detect_circles=args.force,
+        workers=args.workers,
+        pipeline=args.pipeline,
+        track_ball=args.track,
+        trace_path=args.trace,
+        render_images=args.render,
+        work_width=args.work_width or None,
+        adaptive=args.adaptive
     )
 
 